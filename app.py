@@ -8,15 +8,25 @@ from extensions import db, login_manager
 def create_app():
     app = Flask(__name__)
     
+    # Stream uploads to disk in chunks, hashing and sniffing them on the way
+    from utils.upload_intake import IntakeRequest
+    app.request_class = IntakeRequest
+    
     # Configuration
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', os.urandom(32))
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///kpn2020.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=24)
     
-    # Caching Configuration
-    app.config['CACHE_TYPE'] = 'simple'  # Use Redis in production: 'redis'
+    # Caching Configuration: Redis shares the cache between worker processes; without
+    # it each process caches on its own and values other workers change expire sooner
+    if os.environ.get('CACHE_REDIS_URL'):
+        app.config['CACHE_TYPE'] = 'RedisCache'
+        app.config['CACHE_REDIS_URL'] = os.environ['CACHE_REDIS_URL']
+    else:
+        app.config['CACHE_TYPE'] = 'SimpleCache'
     app.config['CACHE_DEFAULT_TIMEOUT'] = 300  # 5 minutes default cache timeout
+    app.config['WEB_CONCURRENCY'] = int(os.environ.get('WEB_CONCURRENCY', 1))  # Worker processes, as for gunicorn
     
     # Security Configuration
     app.config['SESSION_COOKIE_SECURE'] = os.environ.get('FLASK_ENV') == 'production'
@@ -25,6 +35,21 @@ def create_app():
     app.config['WTF_CSRF_TIME_LIMIT'] = None
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file upload
     
+    # Upload storage: 'filesystem' (static/) or 's3' (any S3-compatible object store)
+    app.config['STORAGE_BACKEND'] = os.environ.get('STORAGE_BACKEND', 'filesystem')
+    app.config['S3_BUCKET'] = os.environ.get('S3_BUCKET')
+    app.config['S3_ENDPOINT_URL'] = os.environ.get('S3_ENDPOINT_URL')  # e.g. a local MinIO
+    app.config['S3_REGION'] = os.environ.get('S3_REGION')
+    app.config['S3_ACCESS_KEY'] = os.environ.get('S3_ACCESS_KEY')
+    app.config['S3_SECRET_KEY'] = os.environ.get('S3_SECRET_KEY')
+    app.config['S3_PUBLIC_URL'] = os.environ.get('S3_PUBLIC_URL')
+    
+    # Send queued email from a background thread in each web process (0 to leave it to cron)
+    app.config['EMAIL_OUTBOX_WORKER'] = os.environ.get('EMAIL_OUTBOX_WORKER', '1') != '0'
+    
+    # Live dashboard events are shared between worker processes through Redis when set
+    app.config['EVENT_BUS_REDIS_URL'] = os.environ.get('EVENT_BUS_REDIS_URL')
+    
     # Initialize extensions with app
     db.init_app(app)
     login_manager.init_app(app)
@@ -40,8 +65,15 @@ def create_app():
     # Add static content caching headers for performance
     @app.after_request
     def add_cache_headers(response):
+        # Content-addressed uploads never change, so they can be cached forever
+        if request.endpoint == 'static' and (request.view_args or {}).get('filename', '').startswith('uploads/blobs/'):
+            response.cache_control.no_cache = None
+            response.cache_control.max_age = 31536000
+            response.cache_control.public = True
+            response.cache_control.immutable = True
+        
         # Cache static assets for 1 hour
-        if request.endpoint and 'static' in request.endpoint:
+        elif request.endpoint and 'static' in request.endpoint:
             response.cache_control.max_age = 3600
             response.cache_control.public = True
         
@@ -69,6 +101,7 @@ def create_app():
     from blueprints.registration import registration
     from blueprints.duty_logs import duty_logs
     from blueprints.disciplinary import disciplinary
+    from blueprints.notifications import notifications
     
     app.register_blueprint(core)
     app.register_blueprint(staff, url_prefix='/staff')
@@ -80,14 +113,38 @@ def create_app():
     app.register_blueprint(registration, url_prefix='/register')
     app.register_blueprint(duty_logs, url_prefix='/duties')
     app.register_blueprint(disciplinary, url_prefix='/disciplinary')
+    app.register_blueprint(notifications, url_prefix='/notifications')
+    
+    # Maintenance commands (flask --app app <command>)
+    from commands import register_commands
+    register_commands(app)
+    
+    # Template helpers for uploaded files and responsive image variants
+    from utils.storage import upload_url
+    from utils.image_pipeline import responsive_image, thumbnail_image
+    app.add_template_global(upload_url)
+    app.add_template_global(responsive_image)
+    app.add_template_global(thumbnail_image)
+    
+    # Navbar notification badge, read from the cache
+    from utils.notification_center import load_counter
+    app.add_template_global(load_counter, 'notification_counter')
     
     # Create database tables
     with app.app_context():
         db.create_all()
+        # Add columns introduced since the tables were first created
+        from utils.schema_sync import sync_schema
+        sync_schema()
         # Import and run seed data
         from seed_data import seed_database
         seed_database()
     
+    # Pick up email left pending or backing off before a restart
+    if app.config['EMAIL_OUTBOX_WORKER']:
+        from utils.email_outbox import outbox_worker
+        outbox_worker.start(app)
+    
     return app
 
 app = create_app()
@@ -1,6 +1,9 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
 from models import *
+from utils.image_pipeline import image_pipeline, store_original
+from utils.upload_intake import validate_upload
+from utils.cache_utils import invalidate_campaign_caches
 
 campaigns = Blueprint('campaigns', __name__)
 
@@ -36,6 +39,14 @@ def create():
         return redirect(url_for('core.home'))
     
     if request.method == 'POST':
+        # Validate the featured image before creating anything
+        featured_image = request.files.get('featured_image')
+        if featured_image and featured_image.filename:
+            error = validate_upload(featured_image)
+            if error:
+                flash(error, 'error')
+                return render_template('campaigns/create.html')
+        
         campaign = Campaign(
             title=request.form['title'],
             content=request.form['content'],
@@ -44,9 +55,17 @@ def create():
             featured=request.form.get('featured') == 'on'
         )
         
+        # Store the original; responsive variants are generated in the background
+        if featured_image and featured_image.filename:
+            campaign.featured_image = store_original(featured_image)
+        
         db.session.add(campaign)
+        if campaign.featured_image:
+            image_pipeline.process_campaign_image(campaign)
         db.session.commit()
         
+        invalidate_campaign_caches()
+        
         flash('Campaign created successfully.', 'success')
         return redirect(url_for('campaigns.manage'))
     
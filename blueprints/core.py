@@ -67,9 +67,8 @@ def join():
 
 @core.route('/media')
 def media_gallery():
-    photos = Media.query.filter_by(file_type='photo', public=True).order_by(Media.created_at.desc()).all()
-    videos = Media.query.filter_by(file_type='video', public=True).order_by(Media.created_at.desc()).all()
-    return render_template('core/media.html', photos=photos, videos=videos)
+    from utils.cache_utils import get_media_gallery_data
+    return render_template('core/media.html', **get_media_gallery_data())
 
 @core.route('/news')
 def news():
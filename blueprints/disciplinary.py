@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, request, flash, redirect, url_for
 from flask_login import login_required, current_user
 from models import db, User, DisciplinaryAction, RoleType
 from datetime import datetime
+from utils.activity_feed import record_activity
 
 disciplinary = Blueprint('disciplinary', __name__)
 
@@ -101,6 +102,7 @@ def create_action():
         )
         
         db.session.add(action)
+        record_activity('disciplinary', f'{action_type.title()} issued: {reason}', User.query.get(user_id), actor=current_user)
         db.session.commit()
         
         flash('Disciplinary action created successfully.', 'success')
@@ -133,6 +135,7 @@ def resolve_action(action_id):
     
     action.status = 'resolved'
     action.resolved_at = datetime.utcnow()
+    record_activity('disciplinary_resolved', f'{action.action_type.title()} resolved', action.user, actor=current_user)
     
     db.session.commit()
     
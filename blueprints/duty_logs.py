@@ -2,6 +2,10 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_required, current_user
 from models import *
 from utils.activity_tracker import log_activity, auto_track_duty_completion
+from utils.email_outbox import outbox_worker
+from utils.notifications import notify_duty_assigned
+from utils.event_bus import publish_counts
+from utils.activity_feed import record_activity
 from datetime import datetime, timedelta
 from auth_helpers import get_users_in_jurisdiction, get_duties_in_jurisdiction, validate_duty_assignment
 
@@ -67,7 +71,13 @@ def create_duty():
         )
         
         db.session.add(duty)
+        db.session.flush()
+        assignee = User.query.get(user_id)
+        notify_duty_assigned(duty, assignee, current_user)
+        record_activity('duty_assigned', f'Duty assigned: {duty_description}', assignee, actor=current_user)
         db.session.commit()
+        outbox_worker.notify()
+        publish_counts(total_duties=1, pending_duties=1)
         
         flash('Duty assigned successfully.', 'success')
         return redirect(url_for('duty_logs.manage_duties'))
@@ -103,9 +113,15 @@ def complete_duty(duty_id):
         flash('You can only complete your own duties.', 'error')
         return redirect(url_for('duty_logs.view_duties'))
     
+    previous_status = duty.completion_status
     duty.completion_status = 'completed'
     duty.completed_date = datetime.utcnow()
+    if previous_status != 'completed':
+        record_activity('duty_completed', f'Duty completed: {duty.duty_description}', current_user, actor=current_user)
     db.session.commit()
+    if previous_status != 'completed':
+        publish_counts(f'{current_user.full_name} completed a duty', completed_duties=1,
+                       **{f'{previous_status}_duties': -1})
     
     # Track duty completion activity
     try:
@@ -152,6 +168,7 @@ def create_disciplinary_action():
         )
         
         db.session.add(action)
+        record_activity('disciplinary', f'{action_type.title()} issued: {reason}', User.query.get(user_id), actor=current_user)
         db.session.commit()
         
         flash(f'Disciplinary action ({action_type}) issued successfully.', 'success')
@@ -2,6 +2,8 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
 from models import *
 from datetime import datetime
+from utils.email_outbox import outbox_worker
+from utils.notifications import notify_event_created
 
 events = Blueprint('events', __name__)
 
@@ -91,9 +93,13 @@ def create():
             event.ward_id = current_user.ward_id
         
         db.session.add(event)
+        db.session.flush()
+        # Queued with the event and sent in the background, however large the scope
+        _, notified = notify_event_created(event)
         db.session.commit()
+        outbox_worker.notify()
         
-        flash('Event created successfully.', 'success')
+        flash(f'Event created successfully. {notified} members will be notified.', 'success')
         return redirect(url_for('events.manage'))
     
     return render_template('events/create.html')
\ No newline at end of file
@@ -1,6 +1,13 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
+from datetime import datetime
 from models import *
+from utils.seat_index import invalidate_seat_index
+from utils.seat_reservations import take_seat, vacate_seats
+from utils.email_outbox import outbox_worker
+from utils.notifications import notify_account_approved
+from utils.event_bus import publish_counts
+from utils.activity_feed import record_activity
 
 leadership = Blueprint('leadership', __name__)
 
@@ -43,7 +50,19 @@ def approve_user(user_id):
     
     if current_user.can_approve_user(user):
         user.approval_status = ApprovalStatus.APPROVED
+        user.approved_at = datetime.utcnow()
+        # Confirm the seat in the approval's transaction, so neither is kept without the other
+        if not take_seat(user, 'confirmed'):
+            db.session.rollback()
+            flash(f'No {user.role_type.value.replace("_", " ").title()} seat is available for {user.full_name}.', 'error')
+            return redirect(url_for('leadership.approvals'))
+        
+        notify_account_approved(user, current_user)
+        record_activity('approval', f'{user.role_type.value.replace("_", " ").title()} registration approved', user, actor=current_user)
         db.session.commit()
+        outbox_worker.notify()
+        invalidate_seat_index()
+        publish_counts(f'{user.full_name} was approved', pending_approvals=-1, total_members=1)
         flash(f'{user.full_name} has been approved successfully.', 'success')
     else:
         flash('You do not have permission to approve this user.', 'error')
@@ -57,7 +76,11 @@ def reject_user(user_id):
     
     if current_user.can_approve_user(user):
         user.approval_status = ApprovalStatus.REJECTED
+        vacate_seats(user)
+        record_activity('rejection', f'{user.role_type.value.replace("_", " ").title()} registration rejected', user, actor=current_user)
         db.session.commit()
+        invalidate_seat_index()
+        publish_counts(pending_approvals=-1)
         flash(f'{user.full_name} has been rejected.', 'info')
     else:
         flash('You do not have permission to reject this user.', 'error')
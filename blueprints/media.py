@@ -1,18 +1,58 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, send_file, current_app, jsonify, session
 from flask_login import login_required, current_user
 from models import *
 from werkzeug.utils import secure_filename
 from datetime import datetime
+from utils.image_pipeline import image_pipeline, store_original
+from utils.upload_intake import validate_upload, sniff, SNIFF_BYTES
+from utils.cache_utils import invalidate_media_caches
+from utils.image_cache import resize_cache, allowed_size, FORMATS
+from utils.media_delivery import send_media, cache_headers
+from utils.storage import get_storage, upload_url, MULTIPART_PART_SIZE, MAX_PARTS
+import hashlib
+import math
 import os
+import uuid
 
 media = Blueprint('media', __name__)
 
+# Videos that may be uploaded straight to the object store
+DIRECT_UPLOAD_TYPES = {'.mp4': 'video/mp4', '.mov': 'video/quicktime', '.webm': 'video/webm', '.avi': 'video/x-msvideo'}
+DIRECT_UPLOAD_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
 @media.route('/')
 def gallery():
     # Use cached media gallery data for better performance
     from utils.cache_utils import get_media_gallery_data
     media_data = get_media_gallery_data()
-    return render_template('media/gallery.html', photos=media_data['photos'], videos=media_data['videos'])
+    return render_template('media/gallery.html', **media_data)
+
+@media.route('/feed/<file_type>')
+def gallery_feed(file_type):
+    """Next page of public photos or videos as JSON, for infinite scroll"""
+    from utils.cache_utils import get_media_gallery_page, GALLERY_PAGE_SIZES
+    if file_type not in GALLERY_PAGE_SIZES:
+        abort(404)
+    
+    try:
+        page = get_media_gallery_page(file_type, request.args.get('cursor'))
+    except ValueError:
+        abort(400)
+    
+    next_cursor = page['next_cursor']
+    return jsonify({
+        'items': [{
+            'id': item.id,
+            'title': item.title,
+            'created_at': item.created_at.isoformat(),
+            'thumbnail': upload_url(item.thumbnail_path) or None,
+            'url': url_for('media.media_file', media_id=item.id),
+        } for item in page['items']],
+        'html': render_template('media/_gallery_items.html', items=page['items'],
+                                file_type=file_type, eager_count=0),
+        'next_cursor': next_cursor,
+        'next_url': url_for('media.gallery_feed', file_type=file_type, cursor=next_cursor) if next_cursor else None,
+    })
 
 @media.route('/manage')
 @login_required
@@ -21,8 +61,29 @@ def manage():
         flash('Access denied.', 'error')
         return redirect(url_for('core.home'))
     
-    media_files = Media.query.order_by(Media.created_at.desc()).all()
-    return render_template('media/manage.html', media_files=media_files)
+    # Sizes come from the image metadata index rather than the files on disk
+    from sqlalchemy.orm import contains_eager
+    query = Media.query.outerjoin(ImageMetadata, ImageMetadata.path == Media.file_path) \
+        .options(contains_eager(Media.image_info))
+    
+    image_format = request.args.get('format')
+    if image_format:
+        query = query.filter(ImageMetadata.format == image_format)
+    min_kb = request.args.get('min_kb', type=int)
+    if min_kb:
+        query = query.filter(ImageMetadata.bytes >= min_kb * 1024)
+    
+    sort = request.args.get('sort', 'newest')
+    ordering = {
+        'largest': [ImageMetadata.bytes.desc().nulls_last()],
+        'smallest': [ImageMetadata.bytes.asc().nulls_last()],
+        'resolution': [(ImageMetadata.width * ImageMetadata.height).desc().nulls_last()],
+    }.get(sort, [])
+    media_files = query.order_by(*ordering, Media.created_at.desc()).all()
+    
+    formats = [f for (f,) in db.session.query(ImageMetadata.format).distinct().order_by(ImageMetadata.format) if f]
+    return render_template('media/manage.html', media_files=media_files, formats=formats,
+                           sort=sort, image_format=image_format, min_kb=min_kb)
 
 @media.route('/upload', methods=['GET', 'POST'])
 @login_required
@@ -31,6 +92,9 @@ def upload():
         flash('Access denied.', 'error')
         return redirect(url_for('core.home'))
     
+    # Videos go straight to the object store when the backend supports it
+    direct_upload = get_storage().supports_direct_upload
+    
     if request.method == 'POST':
         title = request.form['title']
         description = request.form.get('description', '')
@@ -40,32 +104,183 @@ def upload():
         # Handle file upload
         uploaded_file = request.files.get('media_file')
         if uploaded_file and uploaded_file.filename:
-            filename = secure_filename(f"{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{uploaded_file.filename}")
+            error = validate_upload(uploaded_file, kinds=('image',) if file_type == 'photo' else ('video',))
+            if error:
+                flash(error, 'error')
+                return render_template('media/upload.html', direct_upload=direct_upload)
             
-            # Create upload directory
-            upload_dir = f"static/uploads/{file_type}s"
-            os.makedirs(upload_dir, exist_ok=True)
-            
-            # Save file
-            file_path = os.path.join(upload_dir, filename)
-            uploaded_file.save(file_path)
+            # Store the original; photos are optimized in the background
+            file_path = store_original(uploaded_file)
             
             # Create media record
             media_item = Media(
                 title=title,
                 description=description,
-                file_path=f"uploads/{file_type}s/{filename}",
+                file_path=file_path,
                 file_type=file_type,
                 uploaded_by_id=current_user.id,
                 public=public
             )
             
             db.session.add(media_item)
+            if file_type == 'photo':
+                image_pipeline.process_media(media_item)
             db.session.commit()
             
+            invalidate_media_caches()
+            
             flash('Media uploaded successfully.', 'success')
             return redirect(url_for('media.manage'))
         else:
             flash('Please select a file to upload.', 'error')
     
-    return render_template('media/upload.html')
\ No newline at end of file
+    return render_template('media/upload.html', direct_upload=direct_upload)
+
+def _direct_uploads():
+    """Direct uploads started in this session, by upload ID"""
+    return session.setdefault('direct_uploads', {})
+
+@media.route('/upload/direct', methods=['POST'])
+@login_required
+def start_direct_upload():
+    """Start a multipart upload of a video straight to the object store"""
+    if current_user.role_type not in [RoleType.ADMIN, RoleType.EXECUTIVE]:
+        return jsonify({'error': 'Access denied.'}), 403
+    
+    storage = get_storage()
+    if not storage.supports_direct_upload:
+        return jsonify({'error': 'Direct uploads are not available.'}), 400
+    
+    data = request.get_json(silent=True) or {}
+    ext = os.path.splitext(secure_filename(data.get('filename', '')))[1].lower()
+    size = data.get('size')
+    if ext not in DIRECT_UPLOAD_TYPES:
+        return jsonify({'error': 'Invalid file type. Please upload MP4, MOV, WebM or AVI videos.'}), 400
+    max_bytes = current_app.config.get('DIRECT_UPLOAD_MAX_BYTES', DIRECT_UPLOAD_MAX_BYTES)
+    if not isinstance(size, int) or not 0 < size <= max_bytes:
+        return jsonify({'error': f'File too large. Maximum size is {max_bytes // (1024 * 1024)}MB.'}), 400
+    
+    key = f"uploads/videos/{uuid.uuid4().hex}{ext}"
+    upload_id = storage.create_multipart_upload(key, DIRECT_UPLOAD_TYPES[ext])
+    uploads = _direct_uploads()
+    uploads[upload_id] = {'key': key, 'size': size}
+    session.modified = True
+    
+    part_size = max(MULTIPART_PART_SIZE, math.ceil(size / MAX_PARTS))
+    part_count = math.ceil(size / part_size)
+    return jsonify({
+        'upload_id': upload_id,
+        'part_size': part_size,
+        'parts': [{'part_number': number, 'url': storage.presign_upload_part(key, upload_id, number)}
+                  for number in range(1, part_count + 1)],
+    })
+
+@media.route('/upload/direct/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_direct_upload(upload_id):
+    """Assemble an uploaded video and create its Media record"""
+    pending = _direct_uploads().get(upload_id)
+    if not pending:
+        abort(404)
+    
+    data = request.get_json(silent=True) or {}
+    title = (data.get('title') or '').strip()
+    if not title:
+        return jsonify({'error': 'Please enter a title.'}), 400
+    
+    storage = get_storage()
+    key = pending['key']
+    try:
+        storage.complete_multipart_upload(key, upload_id, [(int(part['part_number']), part['etag'])
+                                                           for part in data.get('parts', [])])
+    except Exception as e:
+        current_app.logger.error(f"Direct upload {upload_id} could not be completed: {e}")
+        return jsonify({'error': 'Upload could not be completed. Please try again.'}), 400
+    finally:
+        _direct_uploads().pop(upload_id, None)
+        session.modified = True
+    
+    # Check the assembled object the way streamed uploads are checked
+    kind = sniff(storage.read_range(key, 0, SNIFF_BYTES - 1))[0]
+    if kind != 'video' or storage.size(key) != pending['size']:
+        storage.delete(key)
+        return jsonify({'error': 'Invalid file type. Please upload MP4, MOV, WebM or AVI videos.'}), 400
+    
+    media_item = Media(
+        title=title,
+        description=data.get('description', ''),
+        file_path=key,
+        file_type='video',
+        uploaded_by_id=current_user.id,
+        public=bool(data.get('public', True))
+    )
+    db.session.add(media_item)
+    db.session.commit()
+    invalidate_media_caches()
+    
+    flash('Media uploaded successfully.', 'success')
+    return jsonify({'id': media_item.id, 'redirect': url_for('media.manage')})
+
+@media.route('/upload/direct/<upload_id>', methods=['DELETE'])
+@login_required
+def abort_direct_upload(upload_id):
+    """Discard the parts of an abandoned direct upload"""
+    pending = _direct_uploads().pop(upload_id, None)
+    session.modified = True
+    if not pending:
+        abort(404)
+    get_storage().abort_multipart_upload(pending['key'], upload_id)
+    return jsonify({'aborted': True})
+
+def _can_view(media_item):
+    """Private media is only visible to administrators and executives"""
+    return media_item.public or (current_user.is_authenticated and
+                                 current_user.role_type in [RoleType.ADMIN, RoleType.EXECUTIVE])
+
+def _image_version(media_item):
+    """Short hash of the stored file, so resized URLs change when the file does"""
+    return hashlib.sha1(media_item.file_path.encode()).hexdigest()[:12]
+
+@media.app_template_global()
+def media_image_url(media_item, width, height, fmt='webp'):
+    """URL of a resized copy of a photo (sizes must be in the allow-list)"""
+    if fmt not in FORMATS:
+        fmt = 'jpg'
+    return url_for('media.resized_image', media_id=media_item.id, width=width, height=height,
+                   fmt=fmt, v=_image_version(media_item))
+
+@media.route('/img/<int:media_id>/<int:width>x<int:height>.<fmt>')
+def resized_image(media_id, width, height, fmt):
+    """Serve a photo resized on demand from the disk cache"""
+    if fmt not in FORMATS or not allowed_size(width, height):
+        abort(404)
+    
+    media_item = Media.query.get_or_404(media_id)
+    if media_item.file_type != 'photo' or not _can_view(media_item):
+        abort(404)
+    
+    source_path = get_storage().fetch(media_item.file_path)
+    if not source_path:
+        abort(404)
+    
+    path = resize_cache.get(source_path, width, height, fmt)
+    if not path:
+        abort(404)
+    
+    # Versioned URLs never change content; unversioned ones are cached briefly.
+    # Shared caches may only keep public photos.
+    immutable = media_item.public and request.args.get('v') == _image_version(media_item)
+    response = send_file(path, mimetype=FORMATS[fmt][1], conditional=True)
+    return cache_headers(response, immutable, media_item.public)
+
+@media.route('/file/<int:media_id>')
+def media_file(media_id):
+    """Serve an original media file with Range support so videos can seek"""
+    media_item = Media.query.get_or_404(media_id)
+    if not _can_view(media_item):
+        abort(404)
+    
+    response = send_media(media_item.file_path, public=media_item.public)
+    if response is None:
+        abort(404)
+    return response
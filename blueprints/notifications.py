@@ -0,0 +1,62 @@
+from flask import Blueprint, render_template, request, redirect, url_for, jsonify, abort
+from flask_login import login_required, current_user
+from models import *
+from utils.notification_center import load_counter, mark_read, newer_than
+from utils.pagination import keyset_page
+
+notifications = Blueprint('notifications', __name__)
+
+PAGE_SIZE = 30
+
+@notifications.route('/')
+@login_required
+def index():
+    """The current user's notifications, newest first"""
+    query = Notification.query.filter_by(user_id=current_user.id)
+    try:
+        items, next_cursor = keyset_page(query, Notification.created_at, Notification.id,
+                                         request.args.get('cursor'), limit=PAGE_SIZE)
+    except ValueError:
+        abort(400)
+    
+    return render_template('notifications/index.html', notifications=items, next_cursor=next_cursor)
+
+@notifications.route('/unread')
+@login_required
+def unread():
+    """
+    Unread count and cursor for the navbar badge
+    
+    Costs one cache read; notifications are only fetched when the cursor has
+    moved past the client's ?since= value.
+    """
+    counter = load_counter(current_user.id)
+    response = {'unread': counter['unread'], 'cursor': counter['cursor']}
+    
+    since = request.args.get('since', type=int)
+    if since is not None and counter['cursor'] > since:
+        response['items'] = [{
+            'id': item.id,
+            'kind': item.kind,
+            'message': item.message,
+            'created_at': item.created_at.isoformat(),
+            'url': url_for('notifications.open_notification', notification_id=item.id),
+        } for item in newer_than(current_user.id, since)]
+    return jsonify(response)
+
+@notifications.route('/<int:notification_id>/open')
+@login_required
+def open_notification(notification_id):
+    """Mark a notification read and follow its link"""
+    notification = Notification.query.filter_by(id=notification_id, user_id=current_user.id).first_or_404()
+    mark_read(current_user.id, [notification.id])
+    return redirect(notification.link or url_for('notifications.index'))
+
+@notifications.route('/read-all', methods=['POST'])
+@login_required
+def read_all():
+    """Mark every notification of the current user read"""
+    marked = mark_read(current_user.id)
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'marked': marked, **load_counter(current_user.id)})
+    return redirect(url_for('notifications.index'))
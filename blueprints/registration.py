@@ -1,10 +1,17 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, send_file
+from flask_login import login_required, current_user
 from models import *
 from werkzeug.utils import secure_filename
-import os
-import requests
 from datetime import datetime
-from utils.activity_tracker import log_activity, auto_track_facebook_follow
+from utils.facebook_service import facebook_service, fail_stranded_job, FACEBOOK_APP_ID, FACEBOOK_APP_SECRET, FACEBOOK_PAGE_ID
+from utils.seat_index import SEAT_LIMITS, get_seat_occupancy, invalidate_seat_index
+from utils.seat_reservations import take_seat
+from utils.notification_center import push_approval_pending
+from utils.event_bus import publish_counts
+from utils.activity_feed import record_activity
+from utils.image_pipeline import image_pipeline, store_original
+from utils.upload_intake import validate_upload
+from utils.bulk_import import run_import, report_path, BulkImportError, REQUIRED_COLUMNS, OPTIONAL_COLUMNS
 
 # Define valid positions for each role type (server-side validation)
 VALID_ROLE_POSITIONS = {
@@ -34,11 +41,6 @@ VALID_ROLE_POSITIONS = {
 
 registration = Blueprint('registration', __name__)
 
-# Facebook App Configuration (secure environment variables)
-FACEBOOK_APP_ID = os.environ.get('FACEBOOK_APP_ID')
-FACEBOOK_APP_SECRET = os.environ.get('FACEBOOK_APP_SECRET')
-FACEBOOK_PAGE_ID = os.environ.get('FACEBOOK_PAGE_ID', '')  # KPN Official Page ID removed
-
 # Validate Facebook configuration
 if not FACEBOOK_APP_ID or not FACEBOOK_APP_SECRET:
     print("Warning: Facebook integration requires FACEBOOK_APP_ID and FACEBOOK_APP_SECRET environment variables")
@@ -59,6 +61,10 @@ def register():
         role_type = request.form.get('role_type')
         role_title = request.form.get('role_title')
         
+        # The leadership level select submits enum names (e.g. EXECUTIVE)
+        if role_type:
+            role_type = role_type.lower()
+        
         # Check if username or email already exists
         if User.query.filter_by(username=username).first():
             flash('Username already exists.', 'error')
@@ -68,6 +74,15 @@ def register():
             flash('Email already exists.', 'error')
             return redirect(url_for('registration.register'))
         
+        # Validate the profile photo before creating anything
+        photo = request.files.get('photo')
+        if photo and photo.filename:
+            photo_error = validate_upload(photo, max_size_mb=5)
+            if photo_error:
+                flash(photo_error, 'error')
+                zones = Zone.query.all()
+                return render_template('registration/register.html', zones=zones)
+        
         # Validate role_title for leadership roles
         if role_type and role_type != 'general_member' and role_title:
             valid_positions = VALID_ROLE_POSITIONS.get(role_type, [])
@@ -106,17 +121,29 @@ def register():
         )
         user.set_password(password)
         
-        # Handle photo upload
-        photo = request.files.get('photo')
+        # Handle photo upload; the photo is optimized in the background
         if photo and photo.filename:
-            filename = secure_filename(f"{username}_{photo.filename}")
-            upload_path = os.path.join('static/uploads/photos', filename)
-            os.makedirs(os.path.dirname(upload_path), exist_ok=True)
-            photo.save(upload_path)
-            user.photo = filename
+            user.photo = store_original(photo)
         
         db.session.add(user)
+        db.session.flush()
+        
+        # Hold the seat in the same transaction as the registration; the database rejects concurrent overfills
+        if user.role_type in SEAT_LIMITS and not take_seat(user):
+            flash('The selected leadership position is no longer available. You have been registered as a General Member.', 'warning')
+            user.role_type = RoleType.GENERAL_MEMBER
+            user.role_title = None
+        
+        # Let the approvers know it is waiting for them
+        push_approval_pending(user)
+        record_activity('registration', f'New {user.role_type.value.replace("_", " ").title()} registration', user)
+        if user.photo:
+            image_pipeline.process_user_photo(user)
         db.session.commit()
+        invalidate_seat_index()
+        
+        publish_counts(f'New {user.role_type.value.replace("_", " ").title()} registration: {user.full_name}',
+                       total_users=1, pending_approvals=1)
         
         # Store user ID in session for Facebook verification
         session['pending_user_id'] = user.id
@@ -129,6 +156,45 @@ def register():
     zones = Zone.query.all()
     return render_template('registration/register.html', zones=zones)
 
+@registration.route('/bulk-import', methods=['GET', 'POST'])
+@login_required
+def bulk_import():
+    """Import paper registrations collected during field mobilization"""
+    if current_user.role_type not in [RoleType.ADMIN, RoleType.EXECUTIVE, RoleType.ZONAL_COORDINATOR, RoleType.LGA_LEADER, RoleType.WARD_LEADER]:
+        flash('Access denied.', 'error')
+        return redirect(url_for('core.home'))
+    
+    result = None
+    if request.method == 'POST':
+        import_file = request.files.get('import_file')
+        if not import_file or not import_file.filename:
+            flash('Please select a CSV or XLSX file to import.', 'error')
+        else:
+            try:
+                result = run_import(import_file, current_user)
+                session['import_report_id'] = result['report_id']
+                flash(f"Imported {result['imported']} members; {result['failed']} rows need attention.",
+                      'success' if not result['failed'] else 'warning')
+            except BulkImportError as e:
+                flash(str(e), 'error')
+    
+    return render_template('registration/bulk_import.html',
+                         result=result,
+                         required_columns=REQUIRED_COLUMNS,
+                         optional_columns=OPTIONAL_COLUMNS)
+
+@registration.route('/bulk-import/report/<report_id>')
+@login_required
+def bulk_import_report(report_id):
+    """Download the per-row report of the importer's last bulk import"""
+    path = report_path(report_id)
+    if not path or session.get('import_report_id') != report_id:
+        flash('Import report not found.', 'error')
+        return redirect(url_for('registration.bulk_import'))
+    
+    return send_file(path, mimetype='text/csv', as_attachment=True,
+                     download_name=f'import-report-{report_id[:8]}.csv')
+
 @registration.route('/facebook-verification')
 def facebook_verification():
     if 'pending_user_id' not in session:
@@ -157,149 +223,63 @@ def verify_facebook():
     if not facebook_user_id or not access_token:
         return jsonify({'success': False, 'message': 'Missing Facebook data'})
     
-    # Verify the user follows the KPN page
-    follows_page = verify_facebook_page_follow(facebook_user_id, access_token)
+    if not User.query.get(user_id):
+        return jsonify({'success': False, 'message': 'User not found'})
     
-    user = User.query.get(user_id)
-    if user:
-        user.facebook_user_id = facebook_user_id
-        user.facebook_verified = follows_page
-        user.facebook_follow_date = datetime.utcnow() if follows_page else None
-        
-        # Auto-approve general members who verify Facebook
-        if user.role_type == RoleType.GENERAL_MEMBER and follows_page:
-            user.approval_status = ApprovalStatus.APPROVED
-        
-        db.session.commit()
-        
-        # Track Facebook follow activity if successful
-        if follows_page:
-            try:
-                # Log the Facebook follow activity
-                auto_track_facebook_follow(user.id)
-                
-                # Log profile completion activity
-                log_activity(
-                    user_id=user.id,
-                    activity_type='profile_completed',
-                    description=f"Completed registration and Facebook verification for {user.role_type.value} role"
-                )
-            except Exception as e:
-                print(f"Error tracking Facebook verification activity: {str(e)}")
-        
-        # Clear session
-        session.pop('pending_user_id', None)
-        session.pop('facebook_verification_required', None)
-        
-        if follows_page:
-            return jsonify({
-                'success': True, 
-                'message': 'Facebook verification successful! Your registration is complete.',
-                'approved': user.approval_status == ApprovalStatus.APPROVED
-            })
-        else:
-            return jsonify({
-                'success': False, 
-                'message': 'Please follow our official Facebook page to complete registration.'
-            })
+    # Verify the user follows the KPN page in the background; the client polls for the result
+    job = facebook_service.enqueue_verification(user_id, facebook_user_id, access_token)
     
-    return jsonify({'success': False, 'message': 'User not found'})
-
-def verify_facebook_page_follow(facebook_user_id, access_token):
-    """Verify if user follows the KPN Facebook page"""
-    # Check if Facebook is properly configured
-    if not FACEBOOK_APP_ID or not FACEBOOK_APP_SECRET or not FACEBOOK_PAGE_ID:
-        print("Facebook integration not properly configured")
-        return False
-        
-    try:
-        # Validate access token first
-        token_url = f"https://graph.facebook.com/v18.0/me"
-        token_params = {'access_token': access_token, 'fields': 'id'}
-        token_response = requests.get(token_url, params=token_params, timeout=10)
-        
-        if token_response.status_code != 200:
-            print("Invalid Facebook access token")
-            return False
-            
-        token_data = token_response.json()
-        if token_data.get('id') != facebook_user_id:
-            print("Access token does not match user ID")
-            return False
-        
-        # Check if user likes/follows the page
-        url = f"https://graph.facebook.com/v18.0/{FACEBOOK_PAGE_ID}/likes"
-        params = {
-            'access_token': access_token,
-            'fields': 'id,name',
-            'limit': 100  # Limit response size
-        }
-        
-        response = requests.get(url, params=params, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            # Check if user is in the likes data
-            if 'data' in data:
-                for like in data['data']:
-                    if like.get('id') == facebook_user_id:
-                        return True
-        elif response.status_code == 400:
-            error_data = response.json()
-            print(f"Facebook API error: {error_data.get('error', {}).get('message', 'Unknown error')}")
-        else:
-            print(f"Facebook API returned status code: {response.status_code}")
-        
-        return False
-    except requests.exceptions.Timeout:
-        print("Facebook API request timed out")
-        return False
-    except requests.exceptions.RequestException as e:
-        print(f"Facebook API request error: {e}")
-        return False
-    except Exception as e:
-        print(f"Facebook verification error: {e}")
-        return False
+    return jsonify({
+        'success': True,
+        'queued': True,
+        'job_id': job.id,
+        'status_url': url_for('registration.verify_facebook_status', job_id=job.id)
+    }), 202
 
-def check_seat_availability(role_type, role_title, zone_id, lga_id, ward_id):
-    """Check if a leadership seat is available"""
+@registration.route('/verify-facebook/status/<int:job_id>')
+def verify_facebook_status(job_id):
+    """Lightweight polling endpoint for a queued Facebook verification"""
+    job = FacebookVerificationJob.query.get(job_id)
+    if not job or job.user_id != session.get('pending_user_id'):
+        return jsonify({'success': False, 'message': 'Verification not found'}), 404
     
-    # Executive seats (State level) - 20 total
-    if role_type == 'EXECUTIVE':
-        current_executives = User.query.filter_by(
-            role_type=RoleType.EXECUTIVE,
-            approval_status=ApprovalStatus.APPROVED
-        ).count()
-        return current_executives < 20
+    # A job whose worker died would otherwise be polled forever
+    fail_stranded_job(job)
+    if not job.finished:
+        return jsonify({'success': False, 'pending': True, 'status': job.status})
     
-    # Zonal Coordinator seats - 3 per zone
-    elif role_type == 'ZONAL_COORDINATOR' and zone_id:
-        current_zonal = User.query.filter_by(
-            role_type=RoleType.ZONAL_COORDINATOR,
-            zone_id=zone_id,
-            approval_status=ApprovalStatus.APPROVED
-        ).count()
-        return current_zonal < 3
+    if job.status == 'failed':
+        # Keep the registration pending so the user can retry
+        return jsonify({
+            'success': False,
+            'status': job.status,
+            'message': 'We could not reach Facebook to verify your follow. Please try again.'
+        })
     
-    # LGA Leader seats - 10 per LGA
-    elif role_type == 'LGA_LEADER' and lga_id:
-        current_lga = User.query.filter_by(
-            role_type=RoleType.LGA_LEADER,
-            lga_id=lga_id,
-            approval_status=ApprovalStatus.APPROVED
-        ).count()
-        return current_lga < 10
+    # Clear session
+    session.pop('pending_user_id', None)
+    session.pop('facebook_verification_required', None)
     
-    # Ward Leader seats - 8 per ward
-    elif role_type == 'WARD_LEADER' and ward_id:
-        current_ward = User.query.filter_by(
-            role_type=RoleType.WARD_LEADER,
-            ward_id=ward_id,
-            approval_status=ApprovalStatus.APPROVED
-        ).count()
-        return current_ward < 8
+    if job.status == 'verified':
+        return jsonify({
+            'success': True,
+            'status': job.status,
+            'message': 'Facebook verification successful! Your registration is complete.',
+            'approved': job.user.approval_status == ApprovalStatus.APPROVED
+        })
     
-    return True
+    return jsonify({
+        'success': False,
+        'status': job.status,
+        'message': 'Please follow our official Facebook page to complete registration.'
+    })
+
+def check_seat_availability(role_type, role_title, zone_id, lga_id, ward_id):
+    """Check if a leadership seat is available"""
+    occupancy = get_seat_occupancy(role_type, zone_id, lga_id, ward_id)
+    if not occupancy['limited']:
+        return True
+    return occupancy['available'] > 0
 
 @registration.route('/api/lgas/<int:zone_id>')
 def get_lgas(zone_id):
@@ -326,13 +306,13 @@ def get_available_positions():
     
     # Get all positions for this role level
     all_positions = VALID_ROLE_POSITIONS.get(role_level.lower(), [])
-    available_positions = []
     
-    for position in all_positions:
-        # Check if this specific position is available
-        is_available = check_position_availability(role_level, position, zone_id, lga_id, ward_id)
-        if is_available:
-            available_positions.append(position)
+    # One occupancy lookup answers both the seat count and the taken titles
+    occupancy = get_seat_occupancy(role_level, zone_id, lga_id, ward_id)
+    if occupancy['limited'] and occupancy['available'] <= 0:
+        available_positions = []
+    else:
+        available_positions = [p for p in all_positions if p not in occupancy['taken_titles']]
     
     # Get seat limits and current counts for display
     seat_info = get_seat_info(role_level, zone_id, lga_id, ward_id)
@@ -344,60 +324,23 @@ def get_available_positions():
 
 def check_position_availability(role_type, role_title, zone_id, lga_id, ward_id):
     """Check if a specific position is available"""
+    occupancy = get_seat_occupancy(role_type, zone_id, lga_id, ward_id)
+    
     # First check general seat availability
-    if not check_seat_availability(role_type, role_title, zone_id, lga_id, ward_id):
+    if occupancy['limited'] and occupancy['available'] <= 0:
         return False
     
     # Then check if this specific title is already taken
-    query_filters = {
-        'role_type': RoleType[role_type],
-        'role_title': role_title,
-        'approval_status': ApprovalStatus.APPROVED
-    }
-    
-    # Add location filters based on role type
-    if role_type == 'ZONAL_COORDINATOR' and zone_id:
-        query_filters['zone_id'] = zone_id
-    elif role_type == 'LGA_LEADER' and lga_id:
-        query_filters['lga_id'] = lga_id
-    elif role_type == 'WARD_LEADER' and ward_id:
-        query_filters['ward_id'] = ward_id
-    
-    # Check if position is already filled
-    existing_user = User.query.filter_by(**query_filters).first()
-    return existing_user is None
+    return role_title not in occupancy['taken_titles']
 
 def get_seat_info(role_type, zone_id, lga_id, ward_id):
     """Get seat information for display"""
-    if role_type == 'EXECUTIVE':
-        current_count = User.query.filter_by(
-            role_type=RoleType.EXECUTIVE,
-            approval_status=ApprovalStatus.APPROVED
-        ).count()
-        return {'current': current_count, 'total': 20, 'available': 20 - current_count}
-    
-    elif role_type == 'ZONAL_COORDINATOR' and zone_id:
-        current_count = User.query.filter_by(
-            role_type=RoleType.ZONAL_COORDINATOR,
-            zone_id=zone_id,
-            approval_status=ApprovalStatus.APPROVED
-        ).count()
-        return {'current': current_count, 'total': 3, 'available': 3 - current_count}
+    occupancy = get_seat_occupancy(role_type, zone_id, lga_id, ward_id)
+    if not occupancy['limited'] or not occupancy['total']:
+        return {'current': 0, 'total': 0, 'available': 0}
     
-    elif role_type == 'LGA_LEADER' and lga_id:
-        current_count = User.query.filter_by(
-            role_type=RoleType.LGA_LEADER,
-            lga_id=lga_id,
-            approval_status=ApprovalStatus.APPROVED
-        ).count()
-        return {'current': current_count, 'total': 10, 'available': 10 - current_count}
-    
-    elif role_type == 'WARD_LEADER' and ward_id:
-        current_count = User.query.filter_by(
-            role_type=RoleType.WARD_LEADER,
-            ward_id=ward_id,
-            approval_status=ApprovalStatus.APPROVED
-        ).count()
-        return {'current': current_count, 'total': 8, 'available': 8 - current_count}
-    
-    return {'current': 0, 'total': 0, 'available': 0}
\ No newline at end of file
+    return {
+        'current': occupancy['current'],
+        'total': occupancy['total'],
+        'available': occupancy['available']
+    }
@@ -1,11 +1,21 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app, Response, abort, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash
 from werkzeug.utils import secure_filename
 from datetime import datetime
-import os
 from models import *
 from utils.email_service import email_service
+from utils.email_outbox import enqueue_email, outbox_worker
+from utils.notifications import notify_duty_assigned
+from utils.event_bus import get_event_bus, publish_counts, event_stream, cooperative, SYNC_WORKER_STREAM_SECONDS
+from utils.dashboard_widgets import WIDGETS, can_load, dashboard_widgets, load_widget
+from utils.activity_feed import record_activity, activity_feed, can_view_feed
+from utils.audit_log import audit, audit_entries, audit_summary
+from utils.compliance import latest_snapshot, take_snapshot, snapshot_trends, TREND_METRICS
+from utils.seat_index import invalidate_seat_index
+from utils.seat_reservations import reassign_seat, vacate_seats
+from utils.image_pipeline import image_pipeline, store_original, release_stored
+from utils.upload_intake import validate_upload
 
 staff = Blueprint('staff', __name__)
 
@@ -69,22 +79,20 @@ def forgot_password():
             user = User.query.filter_by(email=email).first()
             
             if user:
-                # Generate reset token and send email
+                # Generate reset token and queue the email in the same transaction
                 token = user.generate_reset_token()
-                db.session.commit()
-                
-                # Create reset link
                 reset_link = url_for('staff.reset_password', token=token, _external=True)
+                subject, html, text = email_service.build_password_reset_email(reset_link, user.full_name)
+                enqueue_email(user.email, subject, html=html, text=text,
+                              idempotency_key=f'password-reset-{user.reset_token}')
+                db.session.commit()
                 
-                # Send reset email
-                email_service.send_password_reset_email(
-                    to=user.email,
-                    reset_link=reset_link,
-                    user_name=user.full_name
-                )
+                # Sent by the background worker so a slow mail API does not hold this request
+                outbox_worker.notify()
                 
         except Exception as e:
-            current_app.logger.error(f'Failed to send reset email: {str(e)}')
+            db.session.rollback()
+            current_app.logger.error(f'Failed to queue reset email: {str(e)}')
             # Still show success message for security
         
         # Always show the same generic message regardless of whether email exists
@@ -187,73 +195,8 @@ def admin_dashboard():
         flash('Access denied.', 'error')
         return redirect(url_for('core.home'))
     
-    from datetime import datetime, timedelta
-    from sqlalchemy import func
-    
-    # Use cached statistics for better performance
-    from utils.cache_utils import (
-        get_user_statistics, get_campaign_statistics, get_event_statistics,
-        get_role_statistics, get_zone_statistics
-    )
-    
-    # Get all cached statistics
-    user_stats = get_user_statistics()
-    campaign_stats = get_campaign_statistics()
-    event_stats = get_event_statistics()
-    role_stats = get_role_statistics()
-    zone_data = get_zone_statistics()
-    
-    # Extract individual values
-    total_users = user_stats['total_users']
-    total_members = user_stats['total_members']
-    pending_approvals = user_stats['pending_approvals']
-    new_members_this_month = user_stats['new_members_this_month']
-    active_campaigns = campaign_stats['active_campaigns']
-    upcoming_events = event_stats['upcoming_events']
-    
-    # Define thirty_days_ago for recent activities
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    
-    # Recent activities (mock data for now - could be replaced with actual activity tracking)
-    recent_activities = []
-    recent_users = User.query.filter(User.created_at >= thirty_days_ago).order_by(User.created_at.desc()).limit(10).all()
-    for user in recent_users:
-        recent_activities.append({
-            'description': f'New {user.role_type.value.replace("_", " ").title()} registration',
-            'user': user,
-            'created_at': user.created_at,
-            'type': 'registration'
-        })
-    
-    # Get pending users for admin review
-    pending_users = User.query.filter_by(approval_status=ApprovalStatus.PENDING).order_by(User.created_at.desc()).limit(10).all()
-    
-    # Monthly growth data (last 6 months)
-    monthly_data = []
-    for i in range(6):
-        month_start = (datetime.utcnow() - timedelta(days=30*i)).replace(day=1)
-        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-        month_users = User.query.filter(
-            User.created_at >= month_start,
-            User.created_at <= month_end
-        ).count()
-        monthly_data.insert(0, {
-            'month': month_start.strftime('%B %Y'),
-            'users': month_users
-        })
-    
-    return render_template('staff/admin_dashboard.html', 
-                         total_users=total_users,
-                         total_members=total_members,
-                         pending_approvals=pending_approvals,
-                         active_campaigns=active_campaigns,
-                         upcoming_events=upcoming_events,
-                         new_members_this_month=new_members_this_month,
-                         role_stats=role_stats,
-                         zones=zone_data,
-                         recent_activities=recent_activities,
-                         pending_users=pending_users,
-                         monthly_data=monthly_data)
+    # Panels load separately as widgets
+    return render_template('staff/admin_dashboard.html', widgets=dashboard_widgets('admin', current_user))
 
 @staff.route('/executive')
 @login_required
@@ -262,112 +205,56 @@ def executive_dashboard():
         flash('Access denied.', 'error')
         return redirect(url_for('core.home'))
     
-    from datetime import datetime, timedelta
-    from sqlalchemy import func
-    
-    # State-wide statistics for State Coordinator
-    total_users = User.query.count()
-    total_members = User.query.filter_by(approval_status=ApprovalStatus.APPROVED).count()
-    pending_approvals = User.query.filter_by(approval_status=ApprovalStatus.PENDING).count()
-    
-    # Get campaign data
-    try:
-        active_campaigns = Campaign.query.filter_by(published=True).count()
-        recent_campaigns = Campaign.query.order_by(Campaign.created_at.desc()).limit(5).all()
-    except:
-        active_campaigns = 0
-        recent_campaigns = []
-    
-    # Get event data
-    try:
-        total_events = Event.query.count()
-        upcoming_events = Event.query.filter(Event.event_date >= datetime.utcnow()).count()
-    except:
-        total_events = 0
-        upcoming_events = 0
+    # Panels load separately as widgets; the summary widget starts the live stream
+    return render_template('staff/executive_dashboard.html', widgets=dashboard_widgets('executive', current_user))
+
+@staff.route('/dashboard/widget/<name>')
+@login_required
+def dashboard_widget(name):
+    """One dashboard panel as JSON: its HTML, and for live widgets the stream cursor it is current to"""
+    widget = WIDGETS.get(name)
+    if widget is None:
+        abort(404)
+    if not can_load(widget, current_user):
+        abort(403)
+    
+    html, cursor = load_widget(widget, current_user)
+    return jsonify({'html': html, 'cursor': cursor})
+
+@staff.route('/activity')
+@login_required
+def activity_feed_page():
+    """Next page of an activity feed as JSON, for its "Load more" button"""
+    scope = request.args.get('scope', 'state')
+    if not can_view_feed(current_user, scope):
+        abort(403)
     
-    # Get duty logs data
     try:
-        total_duties = DutyLog.query.count()
-        pending_duties = DutyLog.query.filter_by(completion_status='pending').count()
-        completed_duties = DutyLog.query.filter_by(completion_status='completed').count()
-    except:
-        total_duties = 0
-        pending_duties = 0
-        completed_duties = 0
-    
-    # Role distribution for state overview
-    role_stats = {}
-    for role in RoleType:
-        if role != RoleType.GENERAL_MEMBER:  # Skip general members
-            count = User.query.filter_by(role_type=role, approval_status=ApprovalStatus.APPROVED).count()
-            role_stats[role.value] = count
-    
-    # Geographic distribution
-    zones = Zone.query.all()
-    zone_data = []
-    for zone in zones:
-        zone_users = User.query.filter_by(zone_id=zone.id, approval_status=ApprovalStatus.APPROVED).count()
-        zone_lgas = LGA.query.filter_by(zone_id=zone.id).count()
-        zone_data.append({
-            'id': zone.id,
-            'name': zone.name,
-            'users': zone_users,
-            'lgas': zone_lgas,
-            'performance': min(100, (zone_users / 100) * 100) if zone_users else 0
-        })
-    
-    # Recent activities
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    recent_activities = []
-    recent_users = User.query.filter(User.created_at >= thirty_days_ago).order_by(User.created_at.desc()).limit(15).all()
-    for user in recent_users:
-        recent_activities.append({
-            'description': f'New {user.role_type.value.replace("_", " ").title()} registration',
-            'user': user,
-            'created_at': user.created_at,
-            'type': 'registration',
-            'status': user.approval_status.value
-        })
-    
-    # Get pending users for State Coordinator review
-    pending_users = User.query.filter_by(approval_status=ApprovalStatus.PENDING).order_by(User.created_at.desc()).limit(20).all()
-    
-    # State coordination metrics
-    new_members_this_month = User.query.filter(User.created_at >= thirty_days_ago).count()
-    
-    # Get leadership distribution by zones
-    leadership_distribution = []
-    for zone in zones:
-        coordinators = User.query.filter_by(zone_id=zone.id, role_type=RoleType.ZONAL_COORDINATOR, approval_status=ApprovalStatus.APPROVED).count()
-        lga_leaders = User.query.filter_by(zone_id=zone.id, role_type=RoleType.LGA_LEADER, approval_status=ApprovalStatus.APPROVED).count()
-        ward_leaders = User.query.filter_by(zone_id=zone.id, role_type=RoleType.WARD_LEADER, approval_status=ApprovalStatus.APPROVED).count()
-        
-        leadership_distribution.append({
-            'zone_name': zone.name,
-            'coordinators': coordinators,
-            'lga_leaders': lga_leaders,
-            'ward_leaders': ward_leaders,
-            'total_leaders': coordinators + lga_leaders + ward_leaders
-        })
+        entries, next_cursor = activity_feed(scope, request.args.get('cursor'))
+    except ValueError:
+        abort(400)
     
-    return render_template('staff/executive_dashboard.html',
-                         total_users=total_users,
-                         total_members=total_members,
-                         pending_approvals=pending_approvals,
-                         active_campaigns=active_campaigns,
-                         recent_campaigns=recent_campaigns,
-                         total_events=total_events,
-                         upcoming_events=upcoming_events,
-                         total_duties=total_duties,
-                         pending_duties=pending_duties,
-                         completed_duties=completed_duties,
-                         role_stats=role_stats,
-                         zones=zone_data,
-                         recent_activities=recent_activities,
-                         pending_users=pending_users,
-                         new_members_this_month=new_members_this_month,
-                         leadership_distribution=leadership_distribution)
+    return jsonify({
+        'html': render_template('staff/_activity_rows.html', entries=entries),
+        'next_url': url_for('staff.activity_feed_page', scope=scope, cursor=next_cursor) if next_cursor else None,
+    })
+
+@staff.route('/dashboard/stream')
+@login_required
+def dashboard_stream():
+    """Server-Sent Events carrying count changes to open admin and executive dashboards"""
+    if current_user.role_type not in [RoleType.ADMIN, RoleType.EXECUTIVE]:
+        abort(403)
+    
+    bus = get_event_bus()
+    # Resume after the last event the browser saw, or after the page it was rendered with
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or bus.last_id()
+    # Under gevent an idle stream is cheap; otherwise its thread is released quickly and the browser reconnects
+    max_duration = current_app.config.get('EVENT_STREAM_SECONDS') or \
+        (3600 if cooperative() else SYNC_WORKER_STREAM_SECONDS)
+    
+    return Response(event_stream(bus, last_id, max_duration), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @staff.route('/media-director')
 @login_required
@@ -503,70 +390,8 @@ def zonal_dashboard():
         flash('Access denied.', 'error')
         return redirect(url_for('core.home'))
     
-    from datetime import datetime, timedelta
-    
-    # Get zonal-specific data
-    zone_lgas = LGA.query.filter_by(zone_id=current_user.zone_id).all()
-    zone_users = User.query.filter_by(zone_id=current_user.zone_id, approval_status=ApprovalStatus.APPROVED).all()
-    
-    # Zone performance metrics
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    new_members_this_month = User.query.filter(
-        User.zone_id == current_user.zone_id,
-        User.created_at >= thirty_days_ago,
-        User.approval_status == ApprovalStatus.APPROVED
-    ).count()
-    
-    # LGA performance data
-    lga_performance = []
-    for lga in zone_lgas:
-        lga_users = User.query.filter_by(lga_id=lga.id, approval_status=ApprovalStatus.APPROVED).count()
-        lga_performance.append({
-            'id': lga.id,
-            'name': lga.name,
-            'users': lga_users,
-            'performance': min(100, (lga_users / 50) * 100) if lga_users else 0  # Performance based on target of 50 members per LGA
-        })
-    
-    # Zone statistics
-    total_lgas = len(zone_lgas)
-    total_members = len(zone_users)
-    pending_lga_approvals = User.query.filter_by(
-        zone_id=current_user.zone_id,
-        approval_status=ApprovalStatus.PENDING,
-        role_type=RoleType.LGA_LEADER
-    ).count()
-    
-    # Zone events and activities
-    try:
-        zone_events = Event.query.filter_by(zone_id=current_user.zone_id).count()
-    except:
-        zone_events = 0
-    
-    # Recent zone activities
-    recent_activities = []
-    recent_users = User.query.filter(
-        User.zone_id == current_user.zone_id,
-        User.created_at >= thirty_days_ago
-    ).order_by(User.created_at.desc()).limit(10).all()
-    
-    for user in recent_users:
-        recent_activities.append({
-            'description': f'New {user.role_type.value.replace("_", " ").title()} from {user.lga.name if user.lga else "Unknown LGA"}',
-            'timestamp': user.created_at,
-            'type': 'registration'
-        })
-    
-    return render_template('staff/zonal_dashboard.html', 
-                         zone_lgas=zone_lgas,
-                         zone_users=zone_users,
-                         total_lgas=total_lgas,
-                         total_members=total_members,
-                         pending_lga_approvals=pending_lga_approvals,
-                         zone_events=zone_events,
-                         new_members_this_month=new_members_this_month,
-                         lga_performance=lga_performance,
-                         recent_activities=recent_activities)
+    # Panels load separately as widgets, cached per zone
+    return render_template('staff/zonal_dashboard.html', widgets=dashboard_widgets('zonal', current_user))
 
 @staff.route('/lga')
 @login_required
@@ -575,70 +400,8 @@ def lga_dashboard():
         flash('Access denied.', 'error')
         return redirect(url_for('core.home'))
     
-    from datetime import datetime, timedelta
-    
-    # Get LGA-specific data
-    lga_wards = Ward.query.filter_by(lga_id=current_user.lga_id).all()
-    lga_users = User.query.filter_by(lga_id=current_user.lga_id, approval_status=ApprovalStatus.APPROVED).all()
-    
-    # LGA performance metrics
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    new_members_this_month = User.query.filter(
-        User.lga_id == current_user.lga_id,
-        User.created_at >= thirty_days_ago,
-        User.approval_status == ApprovalStatus.APPROVED
-    ).count()
-    
-    # Ward performance data
-    ward_performance = []
-    for ward in lga_wards:
-        ward_users = User.query.filter_by(ward_id=ward.id, approval_status=ApprovalStatus.APPROVED).count()
-        ward_performance.append({
-            'id': ward.id,
-            'name': ward.name,
-            'users': ward_users,
-            'performance': min(100, (ward_users / 20) * 100) if ward_users else 0  # Performance based on target of 20 members per ward
-        })
-    
-    # LGA statistics
-    total_wards = len(lga_wards)
-    total_members = len(lga_users)
-    pending_ward_approvals = User.query.filter_by(
-        lga_id=current_user.lga_id,
-        approval_status=ApprovalStatus.PENDING,
-        role_type=RoleType.WARD_LEADER
-    ).count()
-    
-    # LGA events and activities
-    try:
-        lga_events = Event.query.filter_by(lga_id=current_user.lga_id).count()
-    except:
-        lga_events = 0
-    
-    # Recent LGA activities
-    recent_activities = []
-    recent_users = User.query.filter(
-        User.lga_id == current_user.lga_id,
-        User.created_at >= thirty_days_ago
-    ).order_by(User.created_at.desc()).limit(10).all()
-    
-    for user in recent_users:
-        recent_activities.append({
-            'description': f'New {user.role_type.value.replace("_", " ").title()} from {user.ward.name if user.ward else "Unknown Ward"}',
-            'timestamp': user.created_at,
-            'type': 'registration'
-        })
-    
-    return render_template('staff/lga_dashboard.html', 
-                         lga_wards=lga_wards,
-                         lga_users=lga_users,
-                         total_wards=total_wards,
-                         total_members=total_members,
-                         pending_ward_approvals=pending_ward_approvals,
-                         lga_events=lga_events,
-                         new_members_this_month=new_members_this_month,
-                         ward_performance=ward_performance,
-                         recent_activities=recent_activities)
+    # Panels load separately as widgets, cached per LGA
+    return render_template('staff/lga_dashboard.html', widgets=dashboard_widgets('lga', current_user))
 
 @staff.route('/ward')
 @login_required
@@ -716,12 +479,20 @@ def promote_user(user_id):
         old_role = user.role_type.value
         user.role_type = promotion_map[user.role_type]
         user.updated_at = datetime.utcnow()
+        # Move the seat in the same transaction; a full level undoes the promotion
+        if not reassign_seat(user):
+            new_role = user.role_type.value.replace("_", " ").title()
+            db.session.rollback()
+            flash(f'{user.full_name} cannot be promoted: every {new_role} seat is taken.', 'error')
+            return redirect(request.referrer or url_for('staff.manage_members'))
+        record_activity('promotion', f'Promoted from {old_role.replace("_", " ").title()} to {user.role_type.value.replace("_", " ").title()}',
+                        user, actor=current_user)
         db.session.commit()
+        invalidate_seat_index()
         
         flash(f'{user.full_name} has been promoted from {old_role.replace("_", " ").title()} to {user.role_type.value.replace("_", " ").title()}.', 'success')
         
-        # Log the action (could be expanded to a proper audit trail)
-        current_app.logger.info(f'{current_user.role_type.value.title()} {current_user.full_name} promoted user {user.full_name} from {old_role} to {user.role_type.value}')
+        audit('promote_user', user, old_role=old_role, new_role=user.role_type.value)
     else:
         flash(f'{user.full_name} cannot be promoted further or promotion path not defined.', 'warning')
     
@@ -759,12 +530,20 @@ def demote_user(user_id):
         old_role = user.role_type.value
         user.role_type = demotion_map[user.role_type]
         user.updated_at = datetime.utcnow()
+        # Move the seat in the same transaction; a full level undoes the demotion
+        if not reassign_seat(user):
+            new_role = user.role_type.value.replace("_", " ").title()
+            db.session.rollback()
+            flash(f'{user.full_name} cannot be demoted: every {new_role} seat is taken.', 'error')
+            return redirect(request.referrer or url_for('staff.manage_members'))
+        record_activity('demotion', f'Demoted from {old_role.replace("_", " ").title()} to {user.role_type.value.replace("_", " ").title()}',
+                        user, actor=current_user)
         db.session.commit()
+        invalidate_seat_index()
         
         flash(f'{user.full_name} has been demoted from {old_role.replace("_", " ").title()} to {user.role_type.value.replace("_", " ").title()}.', 'warning')
         
-        # Log the action
-        current_app.logger.info(f'{current_user.role_type.value.title()} {current_user.full_name} demoted user {user.full_name} from {old_role} to {user.role_type.value}')
+        audit('demote_user', user, old_role=old_role, new_role=user.role_type.value)
     else:
         flash(f'{user.full_name} cannot be demoted further.', 'warning')
     
@@ -830,12 +609,23 @@ def swap_positions():
     user2.role_title = user1_old_title
     user2.updated_at = datetime.utcnow()
     
+    # Move both seats in the same transaction, vacating them first so swapped titles don't collide
+    vacate_seats(user1, user2)
+    for swapped_user in (user1, user2):
+        if not reassign_seat(swapped_user):
+            name, new_role = swapped_user.full_name, swapped_user.role_type.value.replace("_", " ").title()
+            db.session.rollback()
+            flash(f'Positions not swapped: no {new_role} seat is available for {name}.', 'error')
+            return redirect(request.referrer or url_for('staff.manage_members'))
+    record_activity('swap', f'Swapped positions with {user2.full_name}', user1, user2, actor=current_user)
+    
     db.session.commit()
+    invalidate_seat_index()
     
     flash(f'Positions swapped successfully between {user1.full_name} and {user2.full_name}.', 'success')
     
-    # Log the action
-    current_app.logger.info(f'{current_user.role_type.value.title()} {current_user.full_name} swapped positions between {user1.full_name} and {user2.full_name}')
+    audit('swap_positions', user1, other_id=user2.id, other_name=user2.full_name,
+          role=user1.role_type.value, other_role=user2.role_type.value)
     
     return redirect(request.referrer or url_for('staff.manage_members'))
 
@@ -873,12 +663,17 @@ def assign_duty_to_member():
     duty.completion_status = 'pending'
     
     db.session.add(duty)
+    db.session.flush()
+    notify_duty_assigned(duty, user, current_user)
+    record_activity('duty_assigned', f'Duty assigned: {duty_description}', user, actor=current_user)
     db.session.commit()
+    outbox_worker.notify()
+    publish_counts(total_duties=1, pending_duties=1)
     
     flash(f'Duty assigned to {user.full_name} successfully.', 'success')
     
-    # Log the action
-    current_app.logger.info(f'{current_user.role_type.value.title()} {current_user.full_name} assigned duty to {user.full_name}: {duty_description}')
+    audit('assign_duty', user, duty_id=duty.id, description=duty_description,
+          due_date=due_date.date().isoformat() if due_date else None)
     
     return redirect(request.referrer or url_for('staff.manage_members'))
 
@@ -941,12 +736,20 @@ def change_user_role(user_id):
             user.ward_id = None
         
         user.updated_at = datetime.utcnow()
+        # Move the seat in the same transaction; a full level undoes the role change
+        if not reassign_seat(user):
+            db.session.rollback()
+            flash(f'{user.full_name} role not changed: every {new_role.replace("_", " ").title()} seat there is taken.', 'error')
+            return redirect(request.referrer or url_for('staff.manage_members'))
+        record_activity('role_change', f'Role changed from {old_role.replace("_", " ").title()} to {user.role_type.value.replace("_", " ").title()}',
+                        user, actor=current_user)
         db.session.commit()
+        invalidate_seat_index()
         
         flash(f'{user.full_name} role changed from {old_role.replace("_", " ").title()} to {new_role.replace("_", " ").title() if new_role else "Unknown"}.', 'success')
         
-        # Log the action
-        current_app.logger.info(f'{current_user.role_type.value.title()} {current_user.full_name} changed {user.full_name} role from {old_role} to {new_role}')
+        audit('change_user_role', user, old_role=old_role, new_role=new_role,
+              zone_id=user.zone_id, lga_id=user.lga_id, ward_id=user.ward_id)
         
     except ValueError:
         flash('Invalid role selected.', 'error')
@@ -981,12 +784,15 @@ def dismiss_user(user_id):
         old_role = user.role_type.value
         user.approval_status = ApprovalStatus.REJECTED
         user.updated_at = datetime.utcnow()
+        vacate_seats(user)
+        record_activity('dismissal', f'Dismissed from the organization ({old_role.replace("_", " ").title()})',
+                        user, actor=current_user)
         db.session.commit()
+        invalidate_seat_index()
         
         flash(f'{user.full_name} has been dismissed from the organization.', 'warning')
         
-        # Log the action
-        current_app.logger.info(f'{current_user.role_type.value.title()} {current_user.full_name} dismissed user {user.full_name} ({old_role})')
+        audit('dismiss_user', user, role=old_role)
         
     except Exception as e:
         flash(f'Error dismissing user: {str(e)}', 'error')
@@ -1064,18 +870,10 @@ def ict_admin_dashboard():
             'performance': min(100, (zone_users / 50) * 100) if zone_users else 0
         })
     
-    # Recent activities for audit logs
+    # Audit log from the state activity feed
     thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    recent_activities = []
-    recent_users = User.query.filter(User.created_at >= thirty_days_ago).order_by(User.created_at.desc()).limit(20).all()
-    for user in recent_users:
-        recent_activities.append({
-            'description': f'New {user.role_type.value.replace("_", " ").title()} registration',
-            'user': user,
-            'created_at': user.created_at,
-            'type': 'registration',
-            'status': user.approval_status.value
-        })
+    recent_activities, next_cursor = activity_feed('state', limit=20)
+    recent_activities_next = url_for('staff.activity_feed_page', scope='state', cursor=next_cursor) if next_cursor else None
     
     # All pending users for admin review
     pending_users = User.query.filter_by(approval_status=ApprovalStatus.PENDING).order_by(User.created_at.desc()).limit(50).all()
@@ -1113,6 +911,7 @@ def ict_admin_dashboard():
                          role_stats=role_stats,
                          zones=zone_data,
                          recent_activities=recent_activities,
+                         recent_activities_next=recent_activities_next,
                          pending_users=pending_users,
                          system_health=system_health,
                          total_donations=total_donations,
@@ -1125,135 +924,86 @@ def auditor_general_dashboard():
         flash('Access denied.', 'error')
         return redirect(url_for('core.home'))
     
-    from datetime import datetime, timedelta
-    from sqlalchemy import func
-    
-    # Financial oversight data for auditor general
-    try:
-        total_donations = Donation.query.filter_by(active=True).count()
-        inactive_donations = Donation.query.filter_by(active=False).count()
-        recent_donations = Donation.query.filter(
-            Donation.created_at >= datetime.utcnow() - timedelta(days=30)
-        ).count()
-    except:
-        total_donations = 0
-        inactive_donations = 0
-        recent_donations = 0
-    
-    # Member audit statistics
-    total_users = User.query.count()
-    approved_members = User.query.filter_by(approval_status=ApprovalStatus.APPROVED).count()
-    pending_approvals = User.query.filter_by(approval_status=ApprovalStatus.PENDING).count()
-    rejected_users = User.query.filter_by(approval_status=ApprovalStatus.REJECTED).count()
+    # Compliance figures come from the latest stored snapshot, compared with earlier ones
+    snapshot = latest_snapshot()
     
-    # Role distribution audit
-    role_audit = {}
-    for role in RoleType:
-        count = User.query.filter_by(role_type=role, approval_status=ApprovalStatus.APPROVED).count()
-        role_audit[role.value] = count
+    # Recent audit trail from the state activity feed
+    recent_activities, _ = activity_feed('state', limit=10)
     
-    # Geographic audit - Zone analysis
-    zones = Zone.query.all()
-    zone_audit = []
-    for zone in zones:
-        zone_users = User.query.filter_by(zone_id=zone.id, approval_status=ApprovalStatus.APPROVED).count()
-        zone_lgas = LGA.query.filter_by(zone_id=zone.id).count()
-        zone_audit.append({
-            'id': zone.id,
-            'name': zone.name,
-            'approved_users': zone_users,
-            'total_lgas': zone_lgas,
-            'compliance_rate': min(100, (zone_users / max(zone_lgas * 10, 1)) * 100)  # Target 10 members per LGA
-        })
+    # Privileged staff actions, optionally narrowed to one kind
+    audit_action = request.args.get('audit_action') or None
+    audit_log, next_cursor = audit_entries(action=audit_action)
+    audit_log_next = url_for('staff.audit_log_page', action=audit_action, cursor=next_cursor) if next_cursor else None
     
-    # Disciplinary audit
-    try:
-        total_disciplinary = DisciplinaryAction.query.count()
-        active_disciplinary = DisciplinaryAction.query.filter_by(status='active').count()
-        resolved_disciplinary = DisciplinaryAction.query.filter_by(status='resolved').count()
-        recent_disciplinary = DisciplinaryAction.query.filter(
-            DisciplinaryAction.created_at >= datetime.utcnow() - timedelta(days=30)
-        ).count()
-    except:
-        total_disciplinary = 0
-        active_disciplinary = 0
-        resolved_disciplinary = 0
-        recent_disciplinary = 0
+    return render_template('staff/auditor_general_dashboard.html',
+                         snapshot=snapshot,
+                         trends=snapshot_trends(snapshot),
+                         trend_metrics=TREND_METRICS,
+                         recent_activities=recent_activities,
+                         audit_log=audit_log,
+                         audit_log_next=audit_log_next,
+                         audit_action=audit_action,
+                         audit_counts=audit_summary(),
+                         **snapshot.metrics)
+
+@staff.route('/auditor-general/snapshot', methods=['POST'])
+@login_required
+def refresh_compliance_snapshot():
+    """Take a compliance snapshot now instead of waiting for the schedule"""
+    if current_user.role_type != RoleType.AUDITOR_GENERAL:
+        flash('Access denied.', 'error')
+        return redirect(url_for('core.home'))
     
-    # Campaign and event audit
-    try:
-        total_campaigns = Campaign.query.count()
-        published_campaigns = Campaign.query.filter_by(published=True).count()
-        total_events = Event.query.count()
-        recent_events = Event.query.filter(
-            Event.created_at >= datetime.utcnow() - timedelta(days=30)
-        ).count()
-    except:
-        total_campaigns = 0
-        published_campaigns = 0
-        total_events = 0
-        recent_events = 0
-    
-    # Compliance summary for the auditor general
-    compliance_metrics = {
-        'member_approval_rate': round((approved_members / max(total_users, 1)) * 100, 2),
-        'disciplinary_resolution_rate': round((resolved_disciplinary / max(total_disciplinary, 1)) * 100, 2),
-        'campaign_publication_rate': round((published_campaigns / max(total_campaigns, 1)) * 100, 2),
-        'zones_above_target': len([z for z in zone_audit if z['compliance_rate'] >= 80])
+    take_snapshot('manual', current_user)
+    flash('Compliance figures have been recalculated.', 'success')
+    return redirect(url_for('staff.auditor_general_dashboard'))
+
+@staff.route('/auditor-general/audit-log')
+@login_required
+def audit_log_page():
+    """
+    Audit log entries as JSON, newest first
+
+    Filters (all optional): action, actor_id, target_id, since and until
+    (YYYY-MM-DD, until exclusive); cursor comes from the previous page's next_url.
+    """
+    if current_user.role_type not in [RoleType.AUDITOR_GENERAL, RoleType.ADMIN]:
+        abort(403)
+    
+    filters = {
+        'action': request.args.get('action') or None,
+        'actor_id': request.args.get('actor_id', type=int),
+        'target_id': request.args.get('target_id', type=int),
     }
-    
-    # Recent audit activities (last 30 days)
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    recent_activities = []
-    
-    # Add recent user registrations to audit trail
-    recent_users = User.query.filter(User.created_at >= thirty_days_ago).order_by(User.created_at.desc()).limit(10).all()
-    for user in recent_users:
-        recent_activities.append({
-            'description': f'New {user.role_type.value.replace("_", " ").title()} registration: {user.full_name}',
-            'timestamp': user.created_at,
-            'type': 'registration',
-            'status': user.approval_status.value
-        })
-    
-    # Add recent disciplinary actions to audit trail
     try:
-        recent_disc = DisciplinaryAction.query.filter(
-            DisciplinaryAction.created_at >= thirty_days_ago
-        ).order_by(DisciplinaryAction.created_at.desc()).limit(5).all()
-        for action in recent_disc:
-            recent_activities.append({
-                'description': f'Disciplinary action: {action.action_type} issued',
-                'timestamp': action.created_at,
-                'type': 'disciplinary',
-                'status': action.status
-            })
-    except:
-        pass
-    
-    # Sort activities by timestamp
-    recent_activities.sort(key=lambda x: x['timestamp'], reverse=True)
-    
-    return render_template('staff/auditor_general_dashboard.html',
-                         total_donations=total_donations,
-                         inactive_donations=inactive_donations,
-                         recent_donations=recent_donations,
-                         total_users=total_users,
-                         approved_members=approved_members,
-                         pending_approvals=pending_approvals,
-                         rejected_users=rejected_users,
-                         role_audit=role_audit,
-                         zone_audit=zone_audit,
-                         total_disciplinary=total_disciplinary,
-                         active_disciplinary=active_disciplinary,
-                         resolved_disciplinary=resolved_disciplinary,
-                         recent_disciplinary=recent_disciplinary,
-                         total_campaigns=total_campaigns,
-                         published_campaigns=published_campaigns,
-                         total_events=total_events,
-                         recent_events=recent_events,
-                         compliance_metrics=compliance_metrics,
-                         recent_activities=recent_activities)
+        since = request.args.get('since')
+        until = request.args.get('until')
+        entries, next_cursor = audit_entries(
+            since=datetime.strptime(since, '%Y-%m-%d') if since else None,
+            until=datetime.strptime(until, '%Y-%m-%d') if until else None,
+            cursor=request.args.get('cursor'),
+            **filters
+        )
+    except ValueError:
+        abort(400)
+    
+    return jsonify({
+        'entries': [{
+            'id': entry.id,
+            'action': entry.action,
+            'actor_id': entry.actor_id,
+            'actor_name': entry.actor_name,
+            'actor_role': entry.actor_role,
+            'target_id': entry.target_id,
+            'target_name': entry.target_name,
+            'details': entry.details,
+            'ip_address': entry.ip_address,
+            'created_at': entry.created_at.isoformat(),
+        } for entry in entries],
+        'html': render_template('staff/_audit_rows.html', entries=entries),
+        'next_url': url_for('staff.audit_log_page', since=request.args.get('since'), until=request.args.get('until'),
+                            cursor=next_cursor, **filters) if next_cursor else None,
+    })
 
 @staff.route('/profile/edit', methods=['GET', 'POST'])
 @login_required
@@ -1297,46 +1047,32 @@ def edit_profile():
             current_user.bio = bio if bio else None
             current_user.updated_at = datetime.utcnow()
             
-            # Handle photo upload
+            # Handle photo upload; the photo is optimized in the background
             photo = request.files.get('photo')
+            photo_uploaded = False
             if photo and photo.filename:
-                # Validate file type and content
-                allowed_extensions = {'png', 'jpg', 'jpeg', 'gif'}
-                if '.' in photo.filename and photo.filename.rsplit('.', 1)[1].lower() in allowed_extensions:
-                    # Additional MIME type validation
-                    from werkzeug.utils import secure_filename
-                    import mimetypes
-                    mime_type, _ = mimetypes.guess_type(photo.filename)
-                    allowed_mimes = {'image/png', 'image/jpeg', 'image/jpg', 'image/gif'}
-                    
-                    if mime_type not in allowed_mimes:
-                        flash('Invalid file type. Please upload a valid image file.', 'error')
-                        return render_template('staff/edit_profile.html', user=current_user)
-                    filename = secure_filename(f"{current_user.username}_{photo.filename}")
-                    upload_path = os.path.join('static/uploads/photos', filename)
-                    
-                    # Create directory if it doesn't exist
-                    os.makedirs(os.path.dirname(upload_path), exist_ok=True)
-                    
-                    # Delete old photo if exists
-                    if current_user.photo:
-                        old_photo_path = os.path.join('static', current_user.photo)
-                        if os.path.exists(old_photo_path):
-                            try:
-                                os.remove(old_photo_path)
-                            except Exception as e:
-                                # Log error but don't fail the update
-                                pass
-                    
-                    photo.save(upload_path)
-                    current_user.photo = f'uploads/photos/{filename}'
-                else:
-                    flash('Invalid file type. Please upload PNG, JPG, JPEG, or GIF files only.', 'error')
+                # Validate file type, content and size
+                photo_error = validate_upload(photo, max_size_mb=5)
+                if photo_error:
+                    flash(photo_error, 'error')
                     return render_template('staff/edit_profile.html', user=current_user)
+                
+                # Release the old photo, thumbnail and variants
+                old_photo = current_user.photo
+                if old_photo and '/' not in old_photo:
+                    old_photo = f'uploads/photos/{old_photo}'
+                release_stored(old_photo, current_user.photo_thumbnail, current_user.photo_variants)
+                
+                current_user.photo = store_original(photo)
+                current_user.photo_thumbnail = None
+                current_user.photo_variants = None
+                photo_uploaded = True
             
             # Increment edit count
             current_user.increment_edit_count()
             
+            if photo_uploaded:
+                image_pipeline.process_user_photo(current_user)
             db.session.commit()
             
             # Show appropriate message based on remaining edits
@@ -0,0 +1,86 @@
+"""
+Maintenance commands, run with `flask --app app <command>`
+"""
+from datetime import timedelta
+import click
+
+
+def register_commands(app):
+    """Register maintenance CLI commands on the app"""
+
+    @app.cli.command('gc-blobs')
+    @click.option('--grace-hours', default=1.0, show_default=True,
+                  help='Keep unreferenced blobs and stray files younger than this.')
+    @click.option('--recount', is_flag=True, help='Recompute reference counts from the database first.')
+    @click.option('--dry-run', is_flag=True, help='Report what would be removed without deleting.')
+    def gc_blobs(grace_hours, recount, dry_run):
+        """Delete uploads no row references any more."""
+        from utils.blob_store import collect_garbage
+        result = collect_garbage(timedelta(hours=grace_hours), recount=recount, dry_run=dry_run)
+        action = 'Would remove' if dry_run else 'Removed'
+        click.echo(f"{action} {result['removed']} files ({result['bytes_freed'] / (1024 * 1024):.1f} MB); "
+                   f"corrected {result['recounted']} reference counts.")
+
+    @app.cli.command('backfill-image-metadata')
+    @click.option('--workers', type=int, help='Worker processes (default: one per CPU).')
+    @click.option('--force', is_flag=True, help='Re-read images that are already indexed.')
+    def backfill_image_metadata(workers, force):
+        """Index dimensions, size and placeholders of existing uploads."""
+        from utils.image_metadata import backfill
+        result = backfill(workers=workers, force=force)
+        click.echo(f"Indexed {result['recorded']} images; {result['failed']} unreadable, "
+                   f"{result['missing']} missing on disk.")
+
+    @app.cli.command('reoptimize-uploads')
+    @click.option('--workers', type=int, help='Worker processes (default: one per CPU).')
+    @click.option('--dry-run', is_flag=True, help='Report the savings without changing files or rows.')
+    @click.option('--reset', is_flag=True, help='Ignore the checkpoint of an interrupted run.')
+    @click.option('--verbose', is_flag=True, help='Print the outcome for every file.')
+    def reoptimize_uploads(workers, dry_run, reset, verbose):
+        """Optimize legacy uploads and move them into the blob store."""
+        from utils.reoptimize import reoptimize_uploads as run
+        progress = (lambda path, outcome: click.echo(f"{path}: {outcome}")) if verbose else None
+        result = run(workers=workers, dry_run=dry_run, reset=reset, progress=progress)
+        saved = result['bytes_before'] - result['bytes_after']
+        action = 'Would save' if dry_run else 'Saved'
+        click.echo(f"Processed {result['processed']} images, {result['failed']} failed, "
+                   f"{result['skipped']} skipped. {action} {saved / (1024 * 1024):.1f} MB "
+                   f"({result['bytes_before'] / (1024 * 1024):.1f} MB -> {result['bytes_after'] / (1024 * 1024):.1f} MB).")
+
+    @app.cli.command('drain-email-outbox')
+    @click.option('--retry-dead', is_flag=True, help='Give dead messages a fresh set of attempts first.')
+    def drain_email_outbox(retry_dead):
+        """Send queued emails that are due now."""
+        from utils.email_outbox import drain, requeue_dead
+        if retry_dead:
+            click.echo(f"Requeued {requeue_dead()} dead messages.")
+        result = drain()
+        click.echo(f"Sent {result['sent']} emails; {result['failed']} failed.")
+
+    @app.cli.command('email-batch-status')
+    @click.argument('batch')
+    def email_batch_status(batch):
+        """Show how far a notification batch has been sent."""
+        from utils.email_outbox import batch_progress
+        progress = batch_progress(batch)
+        click.echo(f"{progress['sent']}/{progress['total']} sent, {progress['pending'] + progress['sending']} "
+                   f"waiting, {progress['dead']} dead.")
+
+    @app.cli.command('backfill-activity-feed')
+    def backfill_activity_feed():
+        """Seed an empty activity feed with past registrations."""
+        from utils.activity_feed import backfill_feed
+        recorded = backfill_feed()
+        if recorded is None:
+            click.echo("The activity feed already has entries; nothing to do.")
+        else:
+            click.echo(f"Recorded {recorded} registrations.")
+
+    @app.cli.command('compliance-snapshot')
+    def compliance_snapshot():
+        """Store a snapshot of the auditor general's compliance figures (run from cron)."""
+        from utils.compliance import take_snapshot
+        snapshot = take_snapshot('scheduled')
+        rates = snapshot.metrics['compliance_metrics']
+        click.echo(f"Snapshot {snapshot.id} taken at {snapshot.taken_at:%Y-%m-%d %H:%M}: "
+                   f"{rates['member_approval_rate']}% approved, {rates['zones_above_target']} zones above target.")
@@ -0,0 +1,28 @@
+"""
+Gunicorn settings, read automatically from the working directory
+
+Workers are threaded (gthread) by default, so a dashboard event stream
+(/staff/dashboard/stream) holds one thread for a few seconds before the
+browser reconnects. GUNICORN_WORKER_CLASS=gevent serves requests in
+greenlets instead, keeping idle streams open cheaply; it needs the "gevent"
+extra and has not been exercised with the process pools and background
+threads the app starts, so it is opt-in.
+
+Dashboard events only reach the clients of the worker that published them
+unless they go through Redis, so starting more than one worker (WEB_CONCURRENCY
+or -w) without EVENT_BUS_REDIS_URL logs a warning: dashboards then miss events
+published by other workers until the page is reloaded.
+"""
+import os
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+
+def on_starting(server):
+    if server.cfg.workers > 1 and not os.environ.get('EVENT_BUS_REDIS_URL'):
+        # Not fatal: dashboards work, but their live counts may drift until the page is reloaded
+        server.log.warning(f"{server.cfg.workers} workers without EVENT_BUS_REDIS_URL: live dashboard "
+                           f"events only reach dashboards connected to the publishing worker")
@@ -38,11 +38,15 @@ class User(UserMixin, db.Model):
     phone = db.Column(db.String(20))
     bio = db.Column(db.Text)
     photo = db.Column(db.String(255))
+    photo_thumbnail = db.Column(db.String(255))
+    photo_status = db.Column(db.String(20))  # pending, ready, failed
+    photo_variants = db.Column(db.JSON)  # Responsive variants, see utils.image_utils.generate_variants
     
     # Role and hierarchy
     role_type = db.Column(db.Enum(RoleType), default=RoleType.GENERAL_MEMBER)
     role_title = db.Column(db.String(100))
     approval_status = db.Column(db.Enum(ApprovalStatus), default=ApprovalStatus.PENDING)
+    approved_at = db.Column(db.DateTime)
     
     # Location assignment
     zone_id = db.Column(db.Integer, db.ForeignKey('zones.id'))
@@ -62,7 +66,7 @@ class User(UserMixin, db.Model):
     profile_edit_count = db.Column(db.Integer, default=0)
     
     # Timestamps
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # Registration series and windows
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     last_login = db.Column(db.DateTime)
     
@@ -206,6 +210,8 @@ class Campaign(db.Model):
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
     featured_image = db.Column(db.String(255))
+    featured_image_status = db.Column(db.String(20))  # pending, ready, failed
+    featured_image_variants = db.Column(db.JSON)
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     published = db.Column(db.Boolean, default=False)
     featured = db.Column(db.Boolean, default=False)
@@ -238,6 +244,10 @@ class Event(db.Model):
 
 class Media(db.Model):
     __tablename__ = 'media'
+    __table_args__ = (
+        # Keyset pagination of the public gallery, newest first
+        db.Index('ix_media_gallery', 'file_type', 'public', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -248,8 +258,17 @@ class Media(db.Model):
     public = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Image pipeline
+    thumbnail_path = db.Column(db.String(255))
+    variants = db.Column(db.JSON)
+    processing_status = db.Column(db.String(20), default='ready')  # pending, ready, failed
+    processing_error = db.Column(db.String(255))
+    processed_at = db.Column(db.DateTime)
+    
     # Relationships
     uploaded_by = db.relationship('User', backref='media_uploads')
+    image_info = db.relationship('ImageMetadata', primaryjoin='foreign(Media.file_path) == ImageMetadata.path',
+                                 viewonly=True, uselist=False)
 
 class DutyLog(db.Model):
     __tablename__ = 'duty_logs'
@@ -344,4 +363,178 @@ class MemberStats(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
-    user = db.relationship('User', backref=db.backref('member_stats', uselist=False))
\ No newline at end of file
+    user = db.relationship('User', backref=db.backref('member_stats', uselist=False))
+
+class SeatReservation(db.Model):
+    """Leadership seat holds and confirmed seats, one row per occupied seat"""
+    __tablename__ = 'seat_reservations'
+    __table_args__ = (
+        # A seat number or a title can only be held once per role and location,
+        # so concurrent registrations cannot overfill a scope
+        db.UniqueConstraint('role_type', 'scope_key', 'seat_number', name='uq_seat_reservation_slot'),
+        db.UniqueConstraint('role_type', 'scope_key', 'role_title', name='uq_seat_reservation_title'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, unique=True)
+    role_type = db.Column(db.Enum(RoleType), nullable=False)
+    role_title = db.Column(db.String(100))
+    scope_key = db.Column(db.String(30), nullable=False)  # state, zone:<id>, lga:<id>, ward:<id>
+    seat_number = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), default='held')  # held, confirmed
+    expires_at = db.Column(db.DateTime)  # Only set while held
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    user = db.relationship('User', backref=db.backref('seat_reservation', uselist=False))
+
+class FacebookVerificationJob(db.Model):
+    """Background Facebook page-follow verification for a pending registration"""
+    __tablename__ = 'facebook_verification_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    facebook_user_id = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(20), default='queued')  # queued, running, verified, not_following, failed
+    attempts = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)  # Start of the current attempt; its lease runs from here
+    completed_at = db.Column(db.DateTime)
+    
+    # Relationships
+    user = db.relationship('User', backref='facebook_verification_jobs')
+    
+    @property
+    def finished(self):
+        return self.status in ('verified', 'not_following', 'failed')
+
+class Blob(db.Model):
+    """Content-addressed upload stored once under its SHA-256 digest"""
+    __tablename__ = 'blobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(255), unique=True, nullable=False)  # Relative to static/
+    digest = db.Column(db.String(64), nullable=False, index=True)
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    orphaned_at = db.Column(db.DateTime)  # Set when the last reference is released
+
+class ImageMetadata(db.Model):
+    """Dimensions, size and placeholder of a stored image, recorded by the image pipeline"""
+    __tablename__ = 'image_metadata'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(255), unique=True, nullable=False)  # Relative to static/
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    format = db.Column(db.String(10))  # jpeg, png, webp, ...
+    bytes = db.Column(db.Integer, nullable=False, index=True)
+    dominant_color = db.Column(db.String(7))  # #rrggbb
+    placeholder = db.Column(db.Text)  # Tiny LQIP data URI
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    @property
+    def placeholder_style(self):
+        """Inline style showing the placeholder until the image itself paints"""
+        background = self.dominant_color or 'transparent'
+        if self.placeholder:
+            background += f' url({self.placeholder}) center / cover no-repeat'
+        return f'background: {background};'
+
+class EmailOutbox(db.Model):
+    """Outgoing email, written with the change that triggers it and sent by the outbox worker"""
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        # The worker polls for due messages
+        db.Index('ix_email_outbox_due', 'status', 'next_attempt_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    idempotency_key = db.Column(db.String(100), unique=True, nullable=False)
+    batch = db.Column(db.String(100), index=True)  # Notification fan-out the message belongs to
+    to = db.Column(db.String(255), nullable=False)
+    cc = db.Column(db.JSON)
+    subject = db.Column(db.String(255), nullable=False)
+    html = db.Column(db.Text)
+    text = db.Column(db.Text)
+    # Templated messages are rendered by the worker: subject, html and text are filled in then
+    template = db.Column(db.String(50))  # Key of utils.email_templates.EMAIL_TEMPLATES
+    context = db.Column(db.JSON)  # Variables shared by the batch, plus '_base_url' for url_for()
+    recipient = db.Column(db.JSON)  # Per-recipient variables, e.g. recipient_name
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, sending, sent, dead
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+class Notification(db.Model):
+    """In-app notification shown in a user's navbar badge and notification list"""
+    __tablename__ = 'notifications'
+    __table_args__ = (
+        # Unread counts, and each user's list newest first
+        db.Index('ix_notifications_user_unread', 'user_id', 'read_at'),
+        db.Index('ix_notifications_user_created', 'user_id', 'created_at', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    kind = db.Column(db.String(50), nullable=False)  # approval_pending, account_approved, duty_assigned
+    message = db.Column(db.String(255), nullable=False)
+    link = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    read_at = db.Column(db.DateTime)
+
+
+class ActivityFeedEntry(db.Model):
+    """Append-only record of organization activity, one row per feed (state, zone, LGA, ward) it appears in"""
+    __tablename__ = 'activity_feed'
+    __table_args__ = (
+        # Each dashboard's feed is one range of this index, newest first
+        db.Index('ix_activity_feed_scope', 'scope', 'created_at', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(30), nullable=False)  # state, zone:<id>, lga:<id>, ward:<id>
+    kind = db.Column(db.String(30), nullable=False)  # registration, approval, rejection, promotion, demotion, swap, role_change, dismissal, duty_assigned, duty_completed, disciplinary, disciplinary_resolved
+    description = db.Column(db.String(255), nullable=False)
+    actor_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    subject_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    subject_name = db.Column(db.String(200))  # Kept so feeds render without loading users
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class AuditLog(db.Model):
+    """Privileged staff actions, written in batches by utils.audit_log"""
+    __tablename__ = 'audit_log'
+    __table_args__ = (
+        # The auditor's filters: by action, by who acted and by whom it was done to, newest first
+        db.Index('ix_audit_log_action', 'action', 'created_at', 'id'),
+        db.Index('ix_audit_log_actor', 'actor_id', 'created_at', 'id'),
+        db.Index('ix_audit_log_target', 'target_id', 'created_at', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    action = db.Column(db.String(40), nullable=False)  # promote_user, demote_user, swap_positions, change_user_role, dismiss_user, assign_duty
+    actor_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    actor_name = db.Column(db.String(200))
+    actor_role = db.Column(db.String(30))
+    target_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    target_name = db.Column(db.String(200))
+    details = db.Column(db.JSON)  # Action-specific fields, e.g. old_role and new_role
+    ip_address = db.Column(db.String(45))
+    created_at = db.Column(db.DateTime, nullable=False, index=True)  # When the action was taken, not written
+
+
+class ComplianceSnapshot(db.Model):
+    """Dated copy of the auditor general's compliance figures, see utils.compliance"""
+    __tablename__ = 'compliance_snapshots'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    taken_at = db.Column(db.DateTime, nullable=False, index=True)
+    trigger = db.Column(db.String(20), nullable=False)  # scheduled, manual, stale
+    taken_by_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    metrics = db.Column(db.JSON, nullable=False)  # Everything the dashboard shows, keyed as its template variables
@@ -0,0 +1,173 @@
+"""
+Test fixtures
+The app module builds its app on import, so the database (a temporary SQLite
+file, shared between threads) and the outside services are pointed at
+throwaway locations before it is imported. fake_graph and fake_mail serve a
+scripted Graph API and mail API on local ports.
+"""
+import itertools
+import json
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+_tmp = tempfile.mkdtemp(prefix='kpn-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp, 'test.db')
+os.environ.setdefault('REPL_IDENTITY', 'test')
+os.environ.setdefault('MAIL_API_ENDPOINT', 'http://127.0.0.1:9/unused')
+os.environ['EMAIL_OUTBOX_WORKER'] = '0'  # Tests drain the outbox themselves
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from app import app as flask_app
+from extensions import db
+from models import User, Zone, RoleType, ApprovalStatus
+
+flask_app.instance_path = _tmp  # Reports and caches written by tests stay out of instance/
+
+_serial = itertools.count(1)
+
+
+@pytest.fixture
+def app():
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with flask_app.app_context():
+        flask_app.cache.clear()
+        yield flask_app
+        db.session.rollback()
+
+
+@pytest.fixture(autouse=True)
+def no_outbox_worker(monkeypatch):
+    """Leave queued email in the outbox; tests that send it call drain() themselves"""
+    from utils.email_outbox import outbox_worker
+    monkeypatch.setattr(outbox_worker, 'notify', lambda: None)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_zone(app):
+    def make_zone():
+        n = next(_serial)
+        zone = Zone(name=f'Test Zone {n}', slug=f'test-zone-{n}')
+        db.session.add(zone)
+        db.session.commit()
+        return zone
+    return make_zone
+
+
+@pytest.fixture
+def make_user(app):
+    def make_user(role_type=RoleType.GENERAL_MEMBER, approval_status=ApprovalStatus.PENDING, **fields):
+        n = next(_serial)
+        user = User(**{
+            'full_name': f'Test User {n}', 'username': f'test_user_{n}', 'email': f'test{n}@example.com',
+            'role_type': role_type, 'approval_status': approval_status, **fields
+        })
+        user.set_password('password')
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make_user
+
+
+@pytest.fixture
+def login(client):
+    def login(user):
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user.id)
+            session['_fresh'] = True
+    return login
+
+
+class FakeAPI:
+    """
+    Local stand-in for a JSON HTTP API (the Graph API, the mail API)
+
+    route() scripts the (status, JSON body) responses for a path, in order,
+    repeating the last one. Requests are recorded with their method, query
+    string, headers and JSON body, and connections are counted so tests can
+    see keep-alive reuse.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        self.connections = 0
+        self._lock = threading.Lock()
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, like the real APIs
+
+            def setup(self):
+                super().setup()
+                with api._lock:
+                    api.connections += 1
+
+            def _respond(self):
+                url = urlsplit(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                with api._lock:
+                    api.requests.append({'method': self.command, 'path': url.path, 'query': parse_qs(url.query),
+                                         'headers': dict(self.headers), 'json': body})
+                    responses = api.routes.get(url.path) or [(404, {'error': {'message': 'Unknown path'}})]
+                    status, response = responses.pop(0) if len(responses) > 1 else responses[0]
+                payload = json.dumps(response).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = _respond
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def route(self, path, *responses):
+        self.routes[path] = list(responses)
+
+    def paths(self):
+        return [request['path'] for request in self.requests]
+
+
+@pytest.fixture
+def fake_api():
+    """Start a FakeAPI on a free local port"""
+    servers = []
+
+    def start():
+        api = FakeAPI()
+        threading.Thread(target=api.server.serve_forever, daemon=True).start()
+        servers.append(api)
+        return api
+    yield start
+    for api in servers:
+        api.server.shutdown()
+        api.server.server_close()
+
+
+@pytest.fixture
+def fake_graph(fake_api):
+    return fake_api()
+
+
+@pytest.fixture
+def fake_mail(fake_api, monkeypatch):
+    """Fake mail API that email_service sends to"""
+    from utils.email_service import email_service
+    api = fake_api()
+    monkeypatch.setattr(email_service, 'api_endpoint', f'{api.url}/send')
+    return api
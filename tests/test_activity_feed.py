@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from extensions import db
+from models import ActivityFeedEntry, LGA, Ward, RoleType, ApprovalStatus
+from utils.activity_feed import activity_feed, can_view_feed, record_activity
+
+
+@pytest.fixture
+def ward(make_zone):
+    zone = make_zone()
+    lga = LGA(name=f'LGA of {zone.name}', zone_id=zone.id)
+    db.session.add(lga)
+    db.session.flush()
+    ward = Ward(name=f'Ward of {zone.name}', lga_id=lga.id)
+    db.session.add(ward)
+    db.session.commit()
+    return ward
+
+
+def _entries(scope, times):
+    """Feed entries at the given times, returned in insertion order"""
+    entries = [ActivityFeedEntry(scope=scope, kind='registration', description=f'Entry {n}', created_at=moment)
+               for n, moment in enumerate(times)]
+    db.session.add_all(entries)
+    db.session.commit()
+    return entries
+
+
+def test_state_roles_may_view_every_feed(app, make_user):
+    for role_type in (RoleType.ADMIN, RoleType.EXECUTIVE):
+        user = make_user(role_type)
+        assert can_view_feed(user, 'state') and can_view_feed(user, 'zone:999') and can_view_feed(user, 'ward:1')
+
+
+def test_leaders_may_only_view_their_own_locations_feed(app, make_user, ward):
+    zone_id = ward.lga.zone_id
+    coordinator = make_user(RoleType.ZONAL_COORDINATOR, zone_id=zone_id)
+    lga_leader = make_user(RoleType.LGA_LEADER, zone_id=zone_id, lga_id=ward.lga_id)
+
+    assert can_view_feed(coordinator, f'zone:{zone_id}')
+    assert not can_view_feed(coordinator, f'zone:{zone_id + 1}')
+    assert not can_view_feed(coordinator, 'state')
+    assert not can_view_feed(coordinator, f'lga:{ward.lga_id}')
+    assert can_view_feed(lga_leader, f'lga:{ward.lga_id}')
+    assert not can_view_feed(lga_leader, f'ward:{ward.id}')
+    for malformed in ('zone:', f'zone:{zone_id}x', f'region:{zone_id}', f'zone:-{zone_id}'):
+        assert not can_view_feed(coordinator, malformed)
+
+
+def test_activity_reaches_the_feeds_of_each_subjects_location(app, make_user, ward):
+    zone_id = ward.lga.zone_id
+    member = make_user(zone_id=zone_id, lga_id=ward.lga_id, ward_id=ward.id)
+    neighbour = make_user(zone_id=zone_id)
+
+    assert record_activity('swap', 'Swapped roles', member, neighbour, None) == 4
+    db.session.commit()
+
+    scopes = {scope for scope, in db.session.query(ActivityFeedEntry.scope).filter_by(description='Swapped roles')}
+    assert scopes == {'state', f'zone:{zone_id}', f'lga:{ward.lga_id}', f'ward:{ward.id}'}
+    entry, _ = activity_feed(f'ward:{ward.id}')
+    assert entry[0].subject_name == member.full_name
+
+
+def test_cursor_pages_cover_the_feed_once_newest_first(app, ward):
+    scope = f'ward:{ward.id}'
+    moment = datetime(2024, 5, 1, 12, 0)
+    # Entries sharing a timestamp are ordered by ID
+    entries = _entries(scope, [moment - timedelta(minutes=1), moment, moment, moment, moment + timedelta(minutes=1)])
+
+    page, cursor = activity_feed(scope, limit=2)
+    seen = list(page)
+    # An entry added meanwhile does not shift the later pages
+    _entries(scope, [moment + timedelta(minutes=2)])
+    while cursor:
+        page, cursor = activity_feed(scope, cursor, limit=2)
+        seen += page
+
+    expected = [entries[4], entries[3], entries[2], entries[1], entries[0]]
+    assert [entry.id for entry in seen] == [entry.id for entry in expected]
+
+
+def test_malformed_cursor_is_rejected(app):
+    with pytest.raises(ValueError):
+        activity_feed('state', cursor='not-a-cursor')
+
+
+def test_feed_page_endpoint_checks_the_scope(client, make_user, login, make_zone):
+    zone, other = make_zone(), make_zone()
+    _entries(f'zone:{zone.id}', [datetime(2024, 5, 1, 12, minute) for minute in range(20)])
+    login(make_user(RoleType.ZONAL_COORDINATOR, ApprovalStatus.APPROVED, zone_id=zone.id))
+
+    response = client.get(f'/staff/activity?scope=zone:{zone.id}')
+    assert response.status_code == 200
+    assert response.json['html'].count('<tr>') == 15 and 'Entry 19' in response.json['html']
+    following = client.get(response.json['next_url']).json
+    assert following['html'].count('<tr>') == 5 and following['next_url'] is None
+
+    assert client.get(f'/staff/activity?scope=zone:{other.id}').status_code == 403
+    assert client.get('/staff/activity?scope=state').status_code == 403
+    assert client.get(f'/staff/activity?scope=zone:{zone.id}&cursor=bogus').status_code == 400
@@ -0,0 +1,79 @@
+from datetime import datetime
+
+import pytest
+from flask_login import login_user
+
+from extensions import db
+from models import AuditLog, RoleType, ApprovalStatus
+from utils import audit_log
+from utils.audit_log import AuditTrail, audit_entries
+
+
+@pytest.fixture
+def trail(app, monkeypatch):
+    """An AuditTrail whose background thread never flushes on its own"""
+    monkeypatch.setitem(app.config, 'AUDIT_FLUSH_INTERVAL', 3600)
+    return AuditTrail()
+
+
+@pytest.fixture
+def failing_writes(monkeypatch):
+    """Makes the audit log unwritable until the returned function is called"""
+    def execute(*args, **kwargs):
+        raise RuntimeError('database is unavailable')
+    monkeypatch.setattr(db.session, 'execute', execute)
+    return lambda: monkeypatch.delattr(db.session, 'execute')
+
+
+def _record(trail, target, *actions):
+    for action in actions:
+        trail.record({'action': action, 'target_id': target.id, 'created_at': datetime.utcnow()})
+
+
+def _written(target):
+    return [row.action for row in AuditLog.query.filter_by(target_id=target.id).order_by(AuditLog.id)]
+
+
+def test_failed_flush_keeps_the_records_in_order(app, trail, make_user, failing_writes):
+    target = make_user()
+    _record(trail, target, 'promote_user', 'demote_user')
+
+    assert trail.flush() == 0
+    _record(trail, target, 'dismiss_user')
+    failing_writes()
+
+    assert trail.flush() == 3
+    assert _written(target) == ['promote_user', 'demote_user', 'dismiss_user']
+    assert trail.flush() == 0 and trail.dropped == 0
+
+
+def test_buffer_drops_the_oldest_records_beyond_its_limit(app, trail, make_user, failing_writes, monkeypatch):
+    monkeypatch.setattr(audit_log, 'BUFFER_LIMIT', 3)
+    target = make_user()
+    _record(trail, target, 'first', 'second', 'third')
+
+    assert trail.flush() == 0
+    _record(trail, target, 'fourth', 'fifth')
+    assert trail.dropped == 2
+    failing_writes()
+
+    assert trail.flush() == 3
+    assert _written(target) == ['third', 'fourth', 'fifth']
+
+
+def test_flush_without_records_writes_nothing(app, trail):
+    assert trail.flush() == 0
+
+
+def test_audited_actions_are_listed_at_once(app, make_user, monkeypatch):
+    monkeypatch.setitem(app.config, 'AUDIT_FLUSH_INTERVAL', 3600)
+    actor, target = make_user(RoleType.ADMIN, ApprovalStatus.APPROVED), make_user()
+
+    with app.test_request_context(environ_base={'REMOTE_ADDR': '10.0.0.7'}):
+        login_user(actor)
+        audit_log.audit('promote_user', target, old_role='general_member', new_role='ward_leader')
+
+    # Still buffered; listing the log writes it first
+    (entry,), _ = audit_entries(target_id=target.id)
+    assert (entry.actor_id, entry.actor_role, entry.ip_address) == (actor.id, 'admin', '10.0.0.7')
+    assert entry.details == {'old_role': 'general_member', 'new_role': 'ward_leader'}
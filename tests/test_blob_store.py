@@ -0,0 +1,120 @@
+import errno
+import io
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from extensions import db
+from models import Blob
+from utils import blob_store
+from utils.storage import FileSystemStorage
+
+
+@pytest.fixture
+def storage(app, tmp_path):
+    """An empty blob store in a temporary directory"""
+    Blob.query.delete()
+    db.session.commit()
+    previous = app.extensions.get('upload_storage')
+    storage = app.extensions['upload_storage'] = FileSystemStorage(str(tmp_path / 'static'), str(tmp_path / 'scratch'))
+    yield storage
+    app.extensions['upload_storage'] = previous
+
+
+def _age(storage, path, hours=2):
+    """Make a blob look orphaned (and its file written) long ago"""
+    Blob.query.filter_by(path=path).update({Blob.orphaned_at: datetime.utcnow() - timedelta(hours=hours)})
+    db.session.commit()
+    stamp = (datetime.now() - timedelta(hours=hours)).timestamp()
+    os.utime(storage._path(path), (stamp, stamp))
+
+
+def _put(content):
+    path = blob_store.put_stream(io.BytesIO(content), '.txt')
+    db.session.commit()
+    return path
+
+
+def test_collects_old_orphans_and_keeps_referenced_blobs(storage):
+    orphan, kept = _put(b'orphan'), _put(b'referenced')
+    blob_store.acquire(kept)
+    db.session.commit()
+    _age(storage, orphan), _age(storage, kept)
+
+    result = blob_store.collect_garbage()
+
+    assert result['removed'] == 1
+    assert not storage.exists(orphan) and Blob.query.filter_by(path=orphan).first() is None
+    assert storage.exists(kept) and Blob.query.filter_by(path=kept).one().ref_count == 1
+
+
+def test_orphan_republished_after_listing_is_kept(storage):
+    path = _put(b'republished')
+    _age(storage, path)
+    blob = Blob.query.filter_by(path=path).one()
+    cutoff = datetime.utcnow() - blob_store.GC_GRACE_PERIOD
+
+    # An upload of the same content lands between the listing and the delete
+    assert _put(b'republished') == path
+
+    assert not blob_store._delete_orphan(storage, blob.id, path, cutoff)
+    assert storage.exists(path) and Blob.query.filter_by(path=path).count() == 1
+
+
+def test_failed_file_delete_keeps_the_row(storage, monkeypatch):
+    path = _put(b'undeletable')
+    _age(storage, path)
+
+    def fail(key):
+        raise OSError('read-only')
+    monkeypatch.setattr(storage, 'delete', fail)
+
+    assert blob_store.collect_garbage()['removed'] == 0
+    assert Blob.query.filter_by(path=path).count() == 1
+
+
+def test_stray_files_are_removed_unless_an_upload_claims_them(storage):
+    stray, claimed = _put(b'stray'), _put(b'claimed')
+    Blob.query.filter(Blob.path.in_([stray, claimed])).delete(synchronize_session=False)
+    db.session.commit()
+    _age(storage, stray), _age(storage, claimed)
+
+    # An upload reusing the old file records its row first
+    assert _put(b'claimed') == claimed
+    assert not blob_store._delete_stray(storage, claimed, 7)
+
+    assert blob_store.collect_garbage()['removed'] == 1
+    assert not storage.exists(stray) and Blob.query.filter_by(path=stray).first() is None
+    assert storage.exists(claimed)
+
+
+def test_scratch_files_stay_outside_the_served_directory(storage):
+    scratch = blob_store.temp_dir()
+    assert not scratch.startswith(storage.root)
+
+    path = _put(b'published')
+
+    served = [os.path.relpath(os.path.join(directory, name), storage.root).replace(os.sep, '/')
+              for directory, _, names in os.walk(storage.root) for name in names]
+    assert served == [path]
+    assert os.listdir(scratch) == []
+
+
+def test_publishing_from_another_filesystem_copies_then_renames(storage, monkeypatch):
+    real_replace = os.replace
+    calls = []
+
+    def cross_device_once(source, target):
+        calls.append(source)
+        if len(calls) == 1:
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+        return real_replace(source, target)
+    monkeypatch.setattr(os, 'replace', cross_device_once)
+
+    path = _put(b'copied across')
+
+    with storage.open(path) as stored:
+        assert stored.read() == b'copied across'
+    assert len(calls) == 2 and os.listdir(blob_store.temp_dir()) == []
+    assert [name for name in os.listdir(os.path.dirname(storage._path(path)))] == [os.path.basename(path)]
@@ -0,0 +1,72 @@
+import csv
+import io
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from models import User, EmailOutbox, RoleType
+from utils.bulk_import import run_import, report_path, BulkImportError
+from utils.email_outbox import drain
+
+
+def _upload(text, filename='members.csv'):
+    return FileStorage(stream=io.BytesIO(text.encode()), filename=filename)
+
+
+@pytest.fixture
+def importer(app):
+    with app.test_request_context():
+        yield User.query.filter_by(role_type=RoleType.ADMIN).first()
+
+
+def _report(result):
+    with open(report_path(result['report_id']), newline='') as report:
+        return list(csv.DictReader(report))
+
+
+def test_header_is_checked_even_without_rows(importer):
+    with pytest.raises(BulkImportError, match='email'):
+        run_import(_upload('Full Name,Username\n'), importer)
+
+
+def test_short_rows_do_not_fail_the_header_check(importer):
+    result = run_import(_upload('full_name,username,email,phone\nShort Row,short_row\n'), importer)
+
+    assert result['failed'] == 1
+    assert _report(result)[0]['error'] == 'Missing email'
+
+
+def test_report_is_in_row_order(importer):
+    result = run_import(_upload(
+        'full_name,username,email,password\n'
+        'Ordered One,ordered_one,ordered.one@example.com,secret-password\n'
+        'Broken Row,broken_row,not-an-email,\n'
+        'Ordered Two,ordered_two,ordered.two@example.com,secret-password\n'
+    ), importer)
+
+    assert (result['imported'], result['failed'], result['invited']) == (2, 1, 0)
+    assert [(line['row'], line['status']) for line in _report(result)] == [
+        ('2', 'imported'), ('3', 'error'), ('4', 'imported')]
+
+
+def test_members_without_a_password_are_invited(importer, fake_mail):
+    result = run_import(_upload(
+        'full_name,username,email,password\n'
+        'Invited Member,invited_member,invited.member@example.com,\n'
+        'Own Password,own_password,own.password@example.com,secret-password\n'
+    ), importer)
+
+    assert result['invited'] == 1
+    invited = User.query.filter_by(username='invited_member').one()
+    assert invited.reset_token and invited.reset_token_expires
+    assert User.query.filter_by(username='own_password').one().check_password('secret-password')
+
+    [message] = EmailOutbox.query.filter_by(to='invited.member@example.com').all()
+    assert message.idempotency_key == 'account-invite-invited_member'
+    assert message.template == 'account_invite' and message.html is None
+    assert not EmailOutbox.query.filter_by(to='own.password@example.com').count()
+
+    fake_mail.route('/send', (200, {'id': 'sent'}))
+    drain()
+    [sent] = [request['json'] for request in fake_mail.requests if request['json']['to'] == message.to]
+    assert 'invited_member' in sent['html'] and 'http://localhost/staff/reset-password/' in sent['text']
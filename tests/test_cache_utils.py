@@ -0,0 +1,62 @@
+from utils.cache_utils import cached_query, invalidate_media_caches, invalidate_cache_pattern, shared_timeout, PROCESS_LOCAL_TIMEOUT
+from utils.seat_index import get_seat_occupancy
+
+
+def _counted(key_prefix):
+    calls = []
+
+    @cached_query(key_prefix=key_prefix)
+    def query():
+        calls.append(1)
+        return len(calls)
+    return query, calls
+
+
+def test_invalidation_drops_only_its_prefix(app):
+    media, media_calls = _counted('media_')
+    stats, stats_calls = _counted('stats_')
+    app.cache.set('unrelated', 'kept')
+    media(), stats()
+
+    invalidate_media_caches()
+
+    assert media() == 2
+    assert stats() == 1
+    assert app.cache.get('unrelated') == 'kept'
+
+
+def test_pattern_invalidation_is_repeatable(app):
+    query, calls = _counted('zones_')
+    for expected in (1, 2, 3):
+        assert query() == expected
+        assert query() == expected
+        invalidate_cache_pattern('zones_*')
+
+
+def test_per_process_cache_timeouts_are_capped_with_several_workers(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'CACHE_TYPE', 'SimpleCache')
+    monkeypatch.setitem(app.config, 'WEB_CONCURRENCY', 1)
+    assert shared_timeout(600) == 600
+
+    monkeypatch.setitem(app.config, 'WEB_CONCURRENCY', 4)
+    assert shared_timeout(600) == PROCESS_LOCAL_TIMEOUT
+    assert shared_timeout(10) == 10
+
+    monkeypatch.setitem(app.config, 'CACHE_TYPE', 'RedisCache')
+    assert shared_timeout(600) == 600
+
+
+def test_seat_index_entries_expire_quickly_in_a_per_process_cache(app, make_zone, monkeypatch):
+    monkeypatch.setitem(app.config, 'WEB_CONCURRENCY', 4)
+    timeouts = {}
+    real_set = app.cache.set
+
+    def recording_set(key, value, timeout=None):
+        timeouts[key] = timeout
+        return real_set(key, value, timeout=timeout)
+    monkeypatch.setattr(app.cache, 'set', recording_set)
+
+    get_seat_occupancy('ZONAL_COORDINATOR', zone_id=make_zone().id)
+
+    [timeout] = [timeout for key, timeout in timeouts.items() if 'ZONAL_COORDINATOR' in key]
+    assert timeout == PROCESS_LOCAL_TIMEOUT
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from extensions import db
+from models import ComplianceSnapshot
+from utils.compliance import latest_snapshot, snapshot_trends, SNAPSHOT_MAX_AGE
+
+
+@pytest.fixture
+def snapshots(app):
+    """Stores snapshots with given ages and approval rates, in a table emptied for the test"""
+    ComplianceSnapshot.query.delete()
+    db.session.commit()
+    now = datetime.utcnow()
+
+    def snapshots(*taken):
+        stored = [ComplianceSnapshot(taken_at=now - age, trigger='scheduled', metrics={
+            'approved_members': rate,
+            'compliance_metrics': {'member_approval_rate': rate},
+            'zone_audit': [{'id': zone_id, 'compliance_rate': rate} for zone_id in zones],
+        }) for age, rate, zones in taken]
+        db.session.add_all(stored)
+        db.session.commit()
+        return stored
+    return snapshots
+
+
+def test_first_snapshot_is_taken_on_demand(snapshots):
+    snapshot = latest_snapshot()
+
+    assert snapshot.trigger == 'stale' and 'compliance_metrics' in snapshot.metrics
+    assert ComplianceSnapshot.query.count() == 1
+
+
+def test_recent_snapshot_is_reused(snapshots):
+    recent, = snapshots((SNAPSHOT_MAX_AGE - timedelta(minutes=5), 50, []))
+
+    assert latest_snapshot().id == recent.id
+    assert ComplianceSnapshot.query.count() == 1
+
+
+def test_stale_snapshot_is_replaced(snapshots):
+    stale, = snapshots((SNAPSHOT_MAX_AGE + timedelta(minutes=5), 50, []))
+    # A longer max_age still accepts it
+    assert latest_snapshot(max_age=timedelta(days=1)).id == stale.id
+
+    fresh = latest_snapshot()
+    assert fresh.id != stale.id and fresh.trigger == 'stale'
+    assert fresh.taken_at > stale.taken_at
+    assert ComplianceSnapshot.query.count() == 2
+
+
+def test_trends_compare_with_the_newest_snapshot_of_each_period(snapshots):
+    day = timedelta(days=1)
+    current, previous, week, _, month, _ = snapshots(
+        (timedelta(0), 80, [1, 2]),
+        (day, 75, [1]),
+        (7 * day, 70, [1, 2]),  # Exactly a week old still counts as a week back
+        (9 * day, 60, [1, 2]),
+        (31 * day, 50, [2]),
+        (40 * day, 10, [1, 2]),
+    )
+
+    trends = {trend['period']: trend for trend in snapshot_trends(current)}
+
+    assert [trends[period]['taken_at'] for period in ('previous', 'week', 'month')] == \
+        [previous.taken_at, week.taken_at, month.taken_at]
+    assert trends['previous']['changes'] == {'member_approval_rate': 5, 'approved_members': 5}
+    assert trends['week']['changes']['member_approval_rate'] == 10
+    assert trends['month']['changes']['approved_members'] == 30
+    # Zones are compared only where the earlier snapshot has them
+    assert trends['previous']['zones'] == {1: 5}
+    assert trends['month']['zones'] == {2: 30}
+
+
+def test_trends_skip_periods_without_an_earlier_snapshot(snapshots):
+    current, previous = snapshots((timedelta(0), 80, []), (timedelta(days=2), 70, []))
+
+    assert [trend['period'] for trend in snapshot_trends(current)] == ['previous']
+    assert snapshot_trends(previous) == []
@@ -0,0 +1,43 @@
+import pytest
+
+from models import RoleType, ApprovalStatus
+from utils.dashboard_widgets import WIDGETS, load_widget
+
+
+@pytest.mark.parametrize('role_type, name', [
+    (RoleType.GENERAL_MEMBER, 'admin_summary'),
+    (RoleType.EXECUTIVE, 'admin_summary'),
+    (RoleType.ADMIN, 'executive_summary'),
+    (RoleType.ZONAL_COORDINATOR, 'recent_activities'),
+    (RoleType.LGA_LEADER, 'zone_summary'),
+])
+def test_widgets_of_other_roles_are_forbidden(client, make_user, login, role_type, name):
+    login(make_user(role_type, ApprovalStatus.APPROVED))
+
+    assert client.get(f'/staff/dashboard/widget/{name}').status_code == 403
+
+
+def test_allowed_widget_is_served_as_json(client, make_user, login):
+    login(make_user(RoleType.ADMIN, ApprovalStatus.APPROVED))
+
+    response = client.get('/staff/dashboard/widget/admin_summary')
+    assert response.status_code == 200
+    assert response.json['html'] and response.json['cursor'] is None
+    assert client.get('/staff/dashboard/widget/no_such_widget').status_code == 404
+
+
+def test_anonymous_visitors_are_sent_to_log_in(client):
+    assert client.get('/staff/dashboard/widget/admin_summary').status_code == 302
+
+
+def test_zone_widgets_are_cached_per_zone(app, make_user, make_zone):
+    zones = [make_zone(), make_zone()]
+    coordinators = [make_user(RoleType.ZONAL_COORDINATOR, ApprovalStatus.APPROVED, zone_id=zone.id)
+                    for zone in zones]
+
+    with app.test_request_context():
+        for zone, coordinator in zip(zones, coordinators):
+            html, _ = load_widget(WIDGETS['zone_staff'], coordinator)
+            assert f'Active Members in {zone.name} Zone' in html
+            assert coordinator.full_name in html
+        assert app.cache.get(f'widget_zone_staff_{zones[0].id}') is not None
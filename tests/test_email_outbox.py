@@ -0,0 +1,120 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from extensions import db
+from models import EmailOutbox
+from utils import email_outbox
+from utils.email_outbox import enqueue_email, drain, OutboxWorker
+
+
+@pytest.fixture(autouse=True)
+def empty_outbox(app):
+    EmailOutbox.query.delete()
+    db.session.commit()
+
+
+def _queue(key='message-1'):
+    message = enqueue_email('member@example.com', 'Hello', html='<p>Hi</p>', text='Hi', idempotency_key=key)
+    db.session.commit()
+    return message
+
+
+def _reload(message):
+    db.session.expire_all()
+    return db.session.get(EmailOutbox, message.id)
+
+
+def test_sends_with_the_idempotency_key(fake_mail):
+    fake_mail.route('/send', (200, {'id': 'sent-1'}))
+    message = _queue()
+
+    assert drain() == {'sent': 1, 'failed': 0}
+
+    message = _reload(message)
+    assert message.status == 'sent' and message.attempts == 1 and message.sent_at
+    [request] = fake_mail.requests
+    assert request['method'] == 'POST'
+    assert request['headers']['Idempotency-Key'] == 'message-1'
+    assert request['json'] == {'to': 'member@example.com', 'subject': 'Hello', 'text': 'Hi', 'html': '<p>Hi</p>'}
+
+
+def test_server_errors_are_retried_with_backoff(fake_mail):
+    fake_mail.route('/send', (503, {'message': 'Try later'}), (200, {'id': 'sent-1'}))
+    message = _queue()
+
+    before = datetime.utcnow()
+    assert drain() == {'sent': 0, 'failed': 1}
+    message = _reload(message)
+    assert message.status == 'pending' and message.attempts == 1
+    assert message.last_error == 'Try later'
+    delay = (message.next_attempt_at - before).total_seconds()
+    assert email_outbox.BACKOFF_BASE * 0.8 - 1 <= delay <= email_outbox.BACKOFF_BASE * 1.2 + 1
+
+    # Not due yet, so nothing is sent
+    assert drain() == {'sent': 0, 'failed': 0}
+
+    message.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    assert drain() == {'sent': 1, 'failed': 0}
+    assert _reload(message).status == 'sent'
+    # The retry carries the same key, so the mail API can drop a duplicate
+    assert [r['headers']['Idempotency-Key'] for r in fake_mail.requests] == ['message-1', 'message-1']
+
+
+def test_backoff_doubles_up_to_the_maximum():
+    assert [round(email_outbox.backoff_delay(n).total_seconds() / 30 / 0.8) >= 2 ** (n - 1)
+            for n in range(1, 5)] == [True] * 4
+    assert email_outbox.backoff_delay(30).total_seconds() <= email_outbox.BACKOFF_MAX * 1.2
+
+
+def test_permanent_client_errors_go_straight_to_dead(fake_mail):
+    fake_mail.route('/send', (422, {'message': 'Invalid recipient'}))
+    message = _queue()
+
+    assert drain() == {'sent': 0, 'failed': 1}
+
+    message = _reload(message)
+    assert message.status == 'dead' and message.attempts == 1
+    assert message.next_attempt_at is None
+    assert message.last_error == 'Invalid recipient'
+
+
+def test_rate_limits_are_retried_not_dead(fake_mail):
+    fake_mail.route('/send', (429, {'message': 'Slow down'}))
+    message = _queue()
+
+    drain()
+
+    assert _reload(message).status == 'pending'
+
+
+def test_messages_die_after_max_attempts(fake_mail):
+    fake_mail.route('/send', (500, {'message': 'Broken'}))
+    message = _queue()
+    message.attempts = email_outbox.MAX_ATTEMPTS - 1
+    db.session.commit()
+
+    drain()
+
+    assert _reload(message).status == 'dead'
+
+
+def test_worker_started_at_boot_sends_messages_left_from_before(app, fake_mail):
+    fake_mail.route('/send', (200, {'id': 'sent-1'}))
+    message = _queue()
+    app.config['EMAIL_OUTBOX_POLL_INTERVAL'] = 0.1
+
+    # No notify(): the message was queued before this process started
+    worker = OutboxWorker()
+    worker.start(app)
+    try:
+        deadline = time.monotonic() + 5
+        while _reload(message).status != 'sent' and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        worker.stop(timeout=5)
+        app.config.pop('EMAIL_OUTBOX_POLL_INTERVAL')
+
+    assert _reload(message).status == 'sent'
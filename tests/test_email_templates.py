@@ -0,0 +1,62 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from utils.email_templates import (
+    parse_stylesheet, inline_css, html_to_text, get_registry, render_email, render_batch
+)
+
+
+def test_stylesheet_rules_are_inlined_with_the_tags_own_style_last():
+    rules = parse_stylesheet('/* note */ p { margin: 0; } .note, a.button { color: red; }')
+    assert rules == [('p', None, 'margin: 0'), (None, 'note', 'color: red'), ('a', 'button', 'color: red')]
+
+    html = inline_css('<p class="note" style="margin: 5px">Hi</p><a class="button" href="#">Go</a>'
+                      '<span class="button">x</span><br/>', rules)
+
+    assert html == ('<p style="margin: 0; color: red; margin: 5px;">Hi</p>'
+                    '<a href="#" style="color: red;">Go</a><span class="button">x</span><br/>')
+
+
+def test_text_part_keeps_links_and_list_items():
+    text = html_to_text('<html><head><style>p {}</style></head><body><h2>Duties &amp; events</h2>'
+                        '<ul><li>First</li><li>Second</li></ul>'
+                        '<p>Open <a href="https://kpn.example.com/a?b=1&amp;c=2">your dashboard</a>.<br>'
+                        'Or <a href="https://kpn.example.com">https://kpn.example.com</a></p></body></html>')
+
+    assert text == ('Duties & events\n\n- First\n- Second\n\n'
+                    'Open your dashboard: https://kpn.example.com/a?b=1&c=2.\n'
+                    'Or https://kpn.example.com\n')
+
+
+@pytest.fixture
+def event():
+    return SimpleNamespace(title='Rally & March', event_date=datetime(2024, 5, 1, 15, 0),
+                           location='Kano', description=None)
+
+
+def test_registered_email_is_compiled_once_with_its_css_inlined(app, event):
+    with app.test_request_context():
+        subject, html, text = render_email('event_created', event=event, recipient_name='Amina')
+
+    # Subjects are plain text, bodies are escaped
+    assert subject == 'KPN - New Event: Rally & March'
+    assert 'Rally &amp; March' in html and 'Rally & March' in text
+    assert 'class="button"' not in html and 'border-radius: 6px' in html
+    assert 'Dear Amina' in text and 'View Events:' in text
+    assert get_registry().get('event_created') is get_registry().get('event_created')
+
+
+def test_batch_substitutes_each_recipient_escaped_only_in_html(app, event):
+    recipients = [{'recipient_name': 'Amina'}, {'recipient_name': '<b>Sani</b>'}]
+
+    with app.test_request_context():
+        messages = render_batch('event_created', recipients, event=event)
+        single = render_email('event_created', event=event, recipient_name='Amina')
+
+    assert messages[0] == single
+    subject, html, text = messages[1]
+    assert '<strong>&lt;b&gt;Sani&lt;/b&gt;</strong>' in html
+    assert 'Dear <b>Sani</b>' in text
+    assert render_batch('event_created', [], event=event) == []
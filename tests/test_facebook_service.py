@@ -0,0 +1,215 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from extensions import db
+from models import FacebookVerificationJob, RoleType, ApprovalStatus
+from utils import facebook_service as fb
+from utils.facebook_service import FacebookService, FacebookAPIError
+
+PAGE_ID = '1001'
+LIKES = f'/{PAGE_ID}/likes'
+
+
+@pytest.fixture
+def service(app, fake_graph, monkeypatch):
+    """A FacebookService talking to the fake Graph API, with backoff delays recorded instead of slept"""
+    monkeypatch.setattr(fb, 'FACEBOOK_APP_ID', 'app-id')
+    monkeypatch.setattr(fb, 'FACEBOOK_APP_SECRET', 'app-secret')
+    monkeypatch.setattr(fb, 'FACEBOOK_PAGE_ID', PAGE_ID)
+    monkeypatch.setattr(fb, 'FACEBOOK_PAGE_ACCESS_TOKEN', None)
+    delays = []
+    monkeypatch.setattr(fb.time, 'sleep', delays.append)
+
+    service = FacebookService(base_url=fake_graph.url, max_workers=2)
+    service.delays = delays
+    yield service
+    if service._executor is not None:
+        service._executor.shutdown(wait=True)
+
+
+def _run(service, user, facebook_user_id='42'):
+    job = service.enqueue_verification(user.id, facebook_user_id, 'user-token')
+    service.executor.shutdown(wait=True)
+    db.session.expire_all()
+    return db.session.get(FacebookVerificationJob, job.id)
+
+
+def test_requests_share_one_keep_alive_connection(service, fake_graph):
+    fake_graph.route('/me', (200, {'id': '42'}))
+
+    for _ in range(10):
+        assert service.graph_get('me', {'access_token': 'token'}).status_code == 200
+
+    assert fake_graph.connections == 1
+    assert fake_graph.paths() == ['/me'] * 10
+
+
+def test_retryable_statuses_back_off_then_succeed(service, fake_graph):
+    fake_graph.route('/me', (503, {}), (429, {}), (200, {'id': '42'}))
+
+    response = service.graph_get('me', {'access_token': 'token'})
+
+    assert response.json() == {'id': '42'}
+    assert len(fake_graph.requests) == 3
+    assert len(service.delays) == 2
+    assert 0.5 <= service.delays[0] < 0.75 and 1 <= service.delays[1] < 1.25
+
+
+def test_gives_up_after_max_retries(service, fake_graph):
+    fake_graph.route('/me', (502, {}))
+
+    with pytest.raises(FacebookAPIError):
+        service.graph_get('me', {'access_token': 'token'})
+
+    assert len(fake_graph.requests) == fb.MAX_RETRIES + 1
+    assert len(service.delays) == fb.MAX_RETRIES
+
+
+def test_client_errors_are_not_retried(service, fake_graph):
+    fake_graph.route('/me', (400, {'error': {'message': 'Invalid token'}}))
+
+    assert service.graph_get('me', {'access_token': 'token'}).status_code == 400
+    assert len(fake_graph.requests) == 1
+    assert service.delays == []
+
+
+def test_job_verifies_a_follower(service, fake_graph, make_user):
+    user = make_user()
+    fake_graph.route('/me', (200, {'id': '42'}))
+    fake_graph.route(LIKES, (200, {'data': [{'id': '7'}, {'id': '42'}]}))
+
+    job = _run(service, user)
+
+    assert job.status == 'verified'
+    assert job.attempts == 1
+    assert job.completed_at is not None
+    assert job.user.facebook_verified
+    # General members who follow the page are approved straight away
+    assert job.user.role_type == RoleType.GENERAL_MEMBER
+    assert job.user.approval_status == ApprovalStatus.APPROVED
+
+
+def test_job_reports_not_following(service, fake_graph, make_user):
+    user = make_user()
+    fake_graph.route('/me', (200, {'id': '42'}))
+    fake_graph.route(LIKES, (200, {'data': [{'id': '7'}]}))
+
+    job = _run(service, user)
+
+    assert job.status == 'not_following'
+    assert not job.user.facebook_verified
+    assert job.user.approval_status == ApprovalStatus.PENDING
+
+
+def test_job_fails_when_likes_returns_an_error(service, fake_graph, make_user):
+    user = make_user()
+    fake_graph.route('/me', (200, {'id': '42'}))
+    fake_graph.route(LIKES, (403, {'error': {'message': 'Permissions error'}}))
+
+    job = _run(service, user)
+
+    assert job.status == 'failed'
+    assert '403' in job.error and 'Permissions error' in job.error
+    assert job.completed_at is not None
+    assert not job.user.facebook_verified
+
+
+def test_job_fails_when_the_api_stays_down(service, fake_graph, make_user):
+    user = make_user()
+    fake_graph.route('/me', (503, {}))
+
+    job = _run(service, user)
+
+    assert job.status == 'failed'
+    assert 'unavailable' in job.error
+    assert len(fake_graph.requests) == fb.MAX_RETRIES + 1
+
+
+def _status(client, user, job):
+    with client.session_transaction() as session:
+        session['pending_user_id'] = user.id
+    response = client.get(f'/register/verify-facebook/status/{job.id}').get_json()
+    with client.session_transaction() as session:
+        return response, 'pending_user_id' in session
+
+
+def test_throttled_miss_looks_up_the_user(service, fake_graph, make_user, client):
+    fake_graph.route('/me', (200, {'id': '7'}), (200, {'id': '42'}))
+    fake_graph.route(LIKES, (200, {'data': [{'id': '7'}]}))
+    assert service.verify_page_follow('7', 'other-token')
+
+    # 42 followed the page after the follower set was loaded moments ago
+    fake_graph.route(f'/42/likes/{PAGE_ID}', (200, {'data': [{'id': PAGE_ID}]}))
+    user = make_user()
+    job = _run(service, user)
+
+    assert job.status == 'verified'
+    assert fake_graph.paths().count(LIKES) == 1
+    assert service.followers.contains('42', 'token')
+    response, pending = _status(client, user, job)
+    assert response['success'] and not pending
+
+
+def test_throttled_miss_for_a_non_follower(service, fake_graph, make_user):
+    fake_graph.route('/me', (200, {'id': '7'}), (200, {'id': '42'}))
+    fake_graph.route(LIKES, (200, {'data': [{'id': '7'}]}))
+    assert service.verify_page_follow('7', 'other-token')
+    fake_graph.route(f'/42/likes/{PAGE_ID}', (200, {'data': []}))
+
+    job = _run(service, make_user())
+
+    assert job.status == 'not_following'
+
+
+def test_failed_lookup_keeps_the_registration_pending(service, fake_graph, make_user, client):
+    fake_graph.route('/me', (200, {'id': '7'}), (200, {'id': '42'}))
+    fake_graph.route(LIKES, (200, {'data': [{'id': '7'}]}))
+    assert service.verify_page_follow('7', 'other-token')
+    fake_graph.route(f'/42/likes/{PAGE_ID}', (400, {'error': {'message': 'Expired token'}}))
+    user = make_user()
+
+    job = _run(service, user)
+
+    assert job.status == 'failed'
+    response, pending = _status(client, user, job)
+    assert response['status'] == 'failed' and pending
+
+
+def _stranded_job(user, status, **times):
+    job = FacebookVerificationJob(user_id=user.id, facebook_user_id='42', status=status, **times)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def test_job_stranded_by_a_dead_worker_is_failed(app, client, make_user):
+    user = make_user()
+    job = _stranded_job(user, 'running', started_at=datetime.utcnow() - fb.JOB_LEASE - timedelta(seconds=1))
+
+    response, pending = _status(client, user, job)
+
+    assert response['status'] == 'failed' and pending
+    db.session.expire_all()
+    job = db.session.get(FacebookVerificationJob, job.id)
+    assert job.error == 'Verification did not finish' and job.completed_at is not None
+
+
+def test_job_never_started_is_failed_after_the_lease(app, client, make_user):
+    user = make_user()
+    job = _stranded_job(user, 'queued', created_at=datetime.utcnow() - fb.JOB_LEASE - timedelta(seconds=1))
+
+    response, _ = _status(client, user, job)
+
+    assert response['status'] == 'failed'
+
+
+def test_running_job_within_its_lease_is_still_pending(app, client, make_user):
+    user = make_user()
+    # Queued long ago, but its current attempt started moments ago
+    job = _stranded_job(user, 'running', created_at=datetime.utcnow() - timedelta(hours=1),
+                        started_at=datetime.utcnow())
+
+    response, pending = _status(client, user, job)
+
+    assert response['pending'] and response['status'] == 'running' and pending
@@ -0,0 +1,37 @@
+import os
+import runpy
+from types import SimpleNamespace
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'gunicorn.conf.py')
+
+
+def _start(monkeypatch, workers, redis_url=None):
+    if redis_url:
+        monkeypatch.setenv('EVENT_BUS_REDIS_URL', redis_url)
+    else:
+        monkeypatch.delenv('EVENT_BUS_REDIS_URL', raising=False)
+    monkeypatch.setenv('WEB_CONCURRENCY', str(workers))
+    config = runpy.run_path(CONFIG)
+    warnings = []
+    config['on_starting'](SimpleNamespace(cfg=SimpleNamespace(workers=config['workers']),
+                                          log=SimpleNamespace(warning=warnings.append)))
+    return warnings
+
+
+def test_several_workers_without_the_redis_event_bus_start_with_a_warning(monkeypatch):
+    warning, = _start(monkeypatch, 4)
+    assert 'EVENT_BUS_REDIS_URL' in warning
+
+    assert _start(monkeypatch, 4, redis_url='redis://localhost:6379/0') == []
+
+
+def test_a_single_worker_may_use_the_memory_bus(monkeypatch):
+    assert _start(monkeypatch, 1) == []
+
+
+def test_gevent_workers_are_opt_in(monkeypatch):
+    monkeypatch.delenv('GUNICORN_WORKER_CLASS', raising=False)
+    assert runpy.run_path(CONFIG)['worker_class'] == 'gthread'
+
+    monkeypatch.setenv('GUNICORN_WORKER_CLASS', 'gevent')
+    assert runpy.run_path(CONFIG)['worker_class'] == 'gevent'
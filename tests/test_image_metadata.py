@@ -0,0 +1,52 @@
+import os
+import shutil
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from extensions import db
+from models import Media, ImageMetadata
+from utils import image_metadata
+
+
+class BoundedCacheStorage:
+    """Fetches into a download cache that deletes the least recently fetched file past capacity"""
+
+    def __init__(self, directory, sources, capacity):
+        self.directory, self.sources, self.capacity = directory, sources, capacity
+        self.cached = OrderedDict()
+
+    def fetch(self, key):
+        source = self.sources.get(key)
+        if source is None:
+            return None
+        path = os.path.join(self.directory, f'cached-{len(self.cached)}-{os.path.basename(key)}')
+        shutil.copyfile(source, path)
+        self.cached[key] = path
+        while len(self.cached) > self.capacity:
+            os.remove(self.cached.popitem(last=False)[1])
+        return path
+
+
+def test_backfill_reads_each_file_before_the_cache_evicts_it(app, make_user, monkeypatch, tmp_path):
+    source = tmp_path / 'source.png'
+    Image.new('RGB', (40, 30), 'red').save(source)
+    uploader = make_user()
+    paths = [f'uploads/blobs/{uuid.uuid4().hex}.png' for _ in range(12)]
+    db.session.add_all(Media(title='Photo', file_path=path, file_type='photo', uploaded_by_id=uploader.id)
+                       for path in paths)
+    db.session.commit()
+
+    cache_dir = tmp_path / 'cache'
+    cache_dir.mkdir()
+    storage = BoundedCacheStorage(str(cache_dir), {path: str(source) for path in paths}, capacity=4)
+    monkeypatch.setitem(app.extensions, 'upload_storage', storage)
+    monkeypatch.setattr(image_metadata, 'ProcessPoolExecutor', ThreadPoolExecutor)
+
+    result = image_metadata.backfill(workers=2)
+
+    assert result['failed'] == 0 and result['recorded'] == len(paths)
+    widths = {info.path: info.width for info in ImageMetadata.query.filter(ImageMetadata.path.in_(paths))}
+    assert widths == {path: 40 for path in paths}
@@ -0,0 +1,41 @@
+import pytest
+
+from extensions import db
+from models import Media
+from utils.image_pipeline import image_pipeline, IMAGE_PROFILES
+
+
+@pytest.fixture
+def submitted(monkeypatch):
+    calls = []
+    monkeypatch.setattr(image_pipeline, '_submit', lambda *args: calls.append(args))
+    return calls
+
+
+def _photo(make_user, path='uploads/blobs/aa/bb/aabb.jpg'):
+    item = Media(title='Rally', file_path=path, file_type='photo', uploaded_by_id=make_user().id)
+    db.session.add(item)
+    return item
+
+
+def test_photo_is_submitted_once_the_callers_transaction_commits(app, make_user, submitted):
+    item = _photo(make_user)
+
+    image_pipeline.process_media(item)
+    assert submitted == []
+    db.session.commit()
+
+    assert submitted == [(Media, item.id, item.file_path, IMAGE_PROFILES['media'])]
+    assert db.session.get(Media, item.id).processing_status == 'pending'
+
+
+def test_rolled_back_upload_is_never_submitted(app, make_user, submitted):
+    item = _photo(make_user, 'uploads/blobs/cc/dd/ccdd.jpg')
+
+    image_pipeline.process_media(item)
+    db.session.rollback()
+    db.session.commit()
+
+    # Nothing was committed on the caller's behalf
+    assert Media.query.filter_by(file_path='uploads/blobs/cc/dd/ccdd.jpg').count() == 0
+    assert submitted == []
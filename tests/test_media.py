@@ -0,0 +1,70 @@
+import uuid
+
+import pytest
+from PIL import Image
+
+from blueprints.media import media_image_url
+from extensions import db
+from models import Media, RoleType, ApprovalStatus
+from utils.cache_utils import invalidate_media_caches
+
+
+def test_gallery_feed_links_thumbnails_through_the_storage_backend(app, client, make_user, monkeypatch):
+    class CDNStorage:
+        def url(self, key, expires=None):
+            return f'https://cdn.example.com/{key}'
+    monkeypatch.setitem(app.extensions, 'upload_storage', CDNStorage())
+
+    thumbnail = 'uploads/blobs/ab/cd/abcd.jpg'
+    db.session.add(Media(title='Rally', file_path='uploads/blobs/ef/01/ef01.jpg', file_type='photo',
+                         thumbnail_path=thumbnail, uploaded_by_id=make_user().id))
+    db.session.commit()
+    invalidate_media_caches()
+
+    items = client.get('/media/feed/photo').get_json()['items']
+
+    assert items[0]['thumbnail'] == f'https://cdn.example.com/{thumbnail}'
+
+
+@pytest.fixture
+def photo(app, make_user, monkeypatch, tmp_path):
+    source = tmp_path / 'photo.jpg'
+    Image.new('RGB', (800, 600), 'green').save(source)
+
+    class LocalStorage:
+        def fetch(self, key):
+            return str(source)
+    monkeypatch.setitem(app.extensions, 'upload_storage', LocalStorage())
+
+    def photo(public):
+        item = Media(title='Rally', file_path=f'uploads/blobs/{uuid.uuid4().hex}.jpg', file_type='photo',
+                     public=public, uploaded_by_id=make_user().id)
+        db.session.add(item)
+        db.session.commit()
+        return item
+    return photo
+
+
+def test_resized_public_photos_are_cached_by_shared_caches(app, client, photo):
+    item = photo(public=True)
+    with app.test_request_context():
+        url = media_image_url(item, 320, 240, 'jpg')
+
+    response = client.get(url)
+
+    assert response.status_code == 200
+    assert response.cache_control.public and response.cache_control.immutable
+    assert response.cache_control.max_age == 31536000
+
+
+def test_resized_private_photos_are_only_cached_by_the_browser(app, client, login, make_user, photo):
+    item = photo(public=False)
+    with app.test_request_context():
+        url = media_image_url(item, 320, 240, 'jpg')
+    login(make_user(role_type=RoleType.ADMIN, approval_status=ApprovalStatus.APPROVED))
+
+    response = client.get(url)
+
+    assert response.status_code == 200 and response.mimetype == 'image/jpeg'
+    assert response.cache_control.private and not response.cache_control.public
+    assert not response.cache_control.immutable and response.cache_control.max_age == 3600
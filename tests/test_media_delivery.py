@@ -0,0 +1,137 @@
+import os
+
+import pytest
+
+from extensions import db
+from models import Media, RoleType, ApprovalStatus
+from utils.media_delivery import REDIRECT_URL_EXPIRY
+from utils.storage import FileSystemStorage
+
+CONTENT = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def video(app, make_user, monkeypatch, tmp_path):
+    """Stores a video at a path and returns its /media/file URL"""
+    storage = FileSystemStorage(str(tmp_path / 'static'), str(tmp_path / 'scratch'))
+    monkeypatch.setitem(app.extensions, 'upload_storage', storage)
+
+    def video(path='uploads/blobs/aa/bb/aabbcc.mp4', public=True, stored=True):
+        if stored:
+            os.makedirs(os.path.dirname(storage._path(path)), exist_ok=True)
+            with open(storage._path(path), 'wb') as f:
+                f.write(CONTENT)
+        item = Media(title='Rally', file_path=path, file_type='video', public=public,
+                     uploaded_by_id=make_user().id)
+        db.session.add(item)
+        db.session.commit()
+        return f'/media/file/{item.id}'
+    video.storage = storage
+    return video
+
+
+def test_ranges_are_served_partially(client, video):
+    url = video()
+
+    response = client.get(url, headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(CONTENT)}'
+    assert response.data == CONTENT[100:200]
+
+    tail = client.get(url, headers={'Range': 'bytes=-10'})
+    assert tail.status_code == 206 and tail.data == CONTENT[-10:]
+
+    whole = client.get(url)
+    assert whole.status_code == 200 and whole.data == CONTENT
+    assert whole.headers['Accept-Ranges'] == 'bytes' and whole.mimetype == 'video/mp4'
+
+
+def test_unsatisfiable_range_is_refused(client, video):
+    response = client.get(video(), headers={'Range': f'bytes={len(CONTENT)}-'})
+
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(CONTENT)}'
+
+
+def test_conditional_requests_use_the_etag(client, video):
+    url = video()
+    etag = client.get(url).headers['ETag']
+
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+    # A range of a file that changed since is answered with the whole file
+    stale = client.get(url, headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert stale.status_code == 200 and stale.data == CONTENT
+    resumed = client.get(url, headers={'Range': 'bytes=0-9', 'If-Range': etag})
+    assert resumed.status_code == 206 and resumed.data == CONTENT[:10]
+
+
+def test_blobs_are_cached_as_immutable(client, video):
+    blob = client.get(video())
+    assert blob.cache_control.public and blob.cache_control.immutable
+    assert blob.cache_control.max_age == 31536000
+
+    legacy = client.get(video('uploads/videos/rally.mp4'))
+    assert legacy.cache_control.public and not legacy.cache_control.immutable
+    assert legacy.cache_control.max_age == 3600
+
+
+def test_private_videos_are_hidden_from_visitors(client, video):
+    assert client.get(video(public=False)).status_code == 404
+
+
+def test_private_videos_are_cached_privately(client, video, login, make_user):
+    url = video(public=False)
+    login(make_user(RoleType.ADMIN, ApprovalStatus.APPROVED))
+
+    response = client.get(url, headers={'Range': 'bytes=0-9'})
+    assert response.status_code == 206
+    assert response.cache_control.private and not response.cache_control.public
+
+
+def test_missing_file_is_not_found(client, video):
+    assert client.get(video(stored=False)).status_code == 404
+
+
+def test_transfer_can_be_handed_to_nginx(app, client, video, monkeypatch):
+    monkeypatch.setitem(app.config, 'MEDIA_OFFLOAD', 'x-accel-redirect')
+    monkeypatch.setitem(app.config, 'MEDIA_ACCEL_PREFIX', '/internal/')
+
+    response = client.get(video())
+
+    assert response.headers['X-Accel-Redirect'] == '/internal/uploads/blobs/aa/bb/aabbcc.mp4'
+    assert response.data == b'' and response.mimetype == 'video/mp4'
+
+
+def test_transfer_can_be_handed_to_apache(app, client, video, monkeypatch):
+    monkeypatch.setitem(app.config, 'MEDIA_OFFLOAD', 'x-sendfile')
+
+    response = client.get(video())
+
+    assert response.headers['X-Sendfile'] == video.storage._path('uploads/blobs/aa/bb/aabbcc.mp4')
+    assert response.data == b''
+
+
+def test_remote_files_redirect_to_a_presigned_url(app, client, make_user, monkeypatch):
+    class RemoteStorage:
+        is_local = False
+
+        def local_path(self, key):
+            return None
+
+        def exists(self, key):
+            return key.endswith('stored.mp4')
+
+        def url(self, key, expires=None):
+            return f'https://bucket.example.com/{key}?expires={expires}'
+    monkeypatch.setitem(app.extensions, 'upload_storage', RemoteStorage())
+    items = [Media(title='Rally', file_path=f'uploads/videos/{name}.mp4', file_type='video',
+                   uploaded_by_id=make_user().id) for name in ('stored', 'missing')]
+    db.session.add_all(items)
+    db.session.commit()
+
+    response = client.get(f'/media/file/{items[0].id}')
+    assert response.status_code == 302
+    assert response.location == f'https://bucket.example.com/uploads/videos/stored.mp4?expires={REDIRECT_URL_EXPIRY}'
+    assert response.cache_control.private and response.cache_control.max_age == REDIRECT_URL_EXPIRY // 2
+
+    assert client.get(f'/media/file/{items[1].id}').status_code == 404
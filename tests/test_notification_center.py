@@ -0,0 +1,52 @@
+from extensions import db
+from utils.cache_utils import PROCESS_LOCAL_TIMEOUT
+from utils.notification_center import push, mark_read, load_counter, newer_than
+
+
+def test_counters_follow_commits_not_rollbacks(app, make_user):
+    user = make_user()
+    assert load_counter(user.id) == {'unread': 0, 'cursor': 0}
+
+    push([user.id], 'duty_assigned', 'Discarded')
+    db.session.rollback()
+    assert load_counter(user.id) == {'unread': 0, 'cursor': 0}
+
+    first, = push([user.id, user.id], 'duty_assigned', 'First')
+    second, = push([user.id], 'account_approved', 'Second')
+    db.session.commit()
+
+    # Read from the cache, which the commit updated
+    assert load_counter(user.id) == {'unread': 2, 'cursor': second}
+    assert [n.message for n in newer_than(user.id, first)] == ['Second']
+
+
+def test_mark_read_lowers_the_unread_count(app, make_user):
+    user = make_user()
+    ids = push([user.id], 'duty_assigned', 'One') + push([user.id], 'duty_assigned', 'Two')
+    db.session.commit()
+    load_counter(user.id)
+
+    assert mark_read(user.id, ids[:1]) == 1
+    assert load_counter(user.id)['unread'] == 1
+    assert mark_read(user.id) == 1
+    assert mark_read(user.id) == 0
+    assert load_counter(user.id) == {'unread': 0, 'cursor': ids[1]}
+
+    # The cached counter agrees with the database
+    app.cache.clear()
+    assert load_counter(user.id) == {'unread': 0, 'cursor': ids[1]}
+
+
+def test_counters_expire_quickly_in_a_per_process_cache(app, make_user, monkeypatch):
+    monkeypatch.setitem(app.config, 'WEB_CONCURRENCY', 4)
+    timeouts = []
+    real_set = app.cache.set
+
+    def recording_set(key, value, timeout=None):
+        timeouts.append(timeout)
+        return real_set(key, value, timeout=timeout)
+    monkeypatch.setattr(app.cache, 'set', recording_set)
+
+    load_counter(make_user().id)
+
+    assert timeouts == [PROCESS_LOCAL_TIMEOUT]
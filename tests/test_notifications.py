@@ -0,0 +1,57 @@
+from datetime import datetime
+
+import pytest
+
+from extensions import db
+from models import Event, EmailOutbox, ApprovalStatus
+from utils.email_outbox import enqueue_template, drain, batch_progress
+from utils.notifications import notify_event_created
+
+
+@pytest.fixture(autouse=True)
+def empty_outbox(app):
+    EmailOutbox.query.delete()
+    db.session.commit()
+
+
+def test_event_emails_are_rendered_when_sent(app, make_zone, make_user, fake_mail):
+    zone = make_zone()
+    members = [make_user(approval_status=ApprovalStatus.APPROVED, zone_id=zone.id, full_name=name)
+               for name in ('Ada <Member>', 'Bola Member')]
+    organiser = make_user(approval_status=ApprovalStatus.APPROVED, zone_id=zone.id)
+
+    with app.test_request_context(base_url='https://kpn.example.org/'):
+        event = Event(title='Zonal Rally', location='Town Hall', event_date=datetime(2026, 11, 7, 10, 0),
+                      created_by_id=organiser.id, scope='zone', zone_id=zone.id)
+        db.session.add(event)
+        db.session.flush()
+        batch, queued = notify_event_created(event)
+        db.session.commit()
+
+    assert queued == 2
+    queued_rows = EmailOutbox.query.filter_by(batch=batch).all()
+    assert {row.to for row in queued_rows} == {member.email for member in members}
+    # Only the template and its variables go into the request's transaction
+    assert all(row.template == 'event_created' and row.html is None and row.subject == '' for row in queued_rows)
+    assert queued_rows[0].context['event']['title'] == 'Zonal Rally'
+
+    fake_mail.route('/send', (200, {'id': 'sent'}))
+    assert drain() == {'sent': 2, 'failed': 0}
+    assert batch_progress(batch)['sent'] == 2
+
+    sent = {request['json']['to']: request['json'] for request in fake_mail.requests}
+    first = sent[members[0].email]
+    assert first['subject'] == 'KPN - New Event: Zonal Rally'
+    assert 'Ada &lt;Member&gt;' in first['html'] and 'Saturday, 07 November 2026 at 10:00 AM' in first['html']
+    assert 'https://kpn.example.org/events' in first['text']
+    assert 'Bola Member' in sent[members[1].email]['html']
+
+
+def test_messages_whose_template_fails_to_render_are_dead(app, fake_mail):
+    enqueue_template('no_such_email', [{'to': 'member@example.com', 'values': {'recipient_name': 'Member'}}])
+    db.session.commit()
+
+    assert drain() == {'sent': 0, 'failed': 1}
+    message = EmailOutbox.query.one()
+    assert message.status == 'dead' and 'no_such_email' in message.last_error
+    assert not fake_mail.requests
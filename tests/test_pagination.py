@@ -0,0 +1,91 @@
+import base64
+from datetime import datetime, timedelta
+
+import pytest
+
+from extensions import db
+from models import Media
+from utils.pagination import encode_cursor, decode_cursor, keyset_page
+
+
+@pytest.fixture
+def videos(app, make_user):
+    """Stores public videos uploaded at the given times, in a table emptied for the test"""
+    Media.query.delete()
+    db.session.commit()
+    uploader = make_user()
+
+    def videos(times, public=True):
+        items = [Media(title=f'Video {n}', file_path=f'uploads/videos/{n}.mp4', file_type='video',
+                       public=public, created_at=moment, uploaded_by_id=uploader.id)
+                 for n, moment in enumerate(times)]
+        db.session.add_all(items)
+        db.session.commit()
+        return items
+    return videos
+
+
+def _newest_first(items):
+    return sorted(items, key=lambda item: (item.created_at, item.id), reverse=True)
+
+
+def test_cursor_round_trips_the_position():
+    moment = datetime(2024, 5, 1, 12, 30, 15, 123456)
+    cursor = encode_cursor(moment, 42)
+
+    assert '=' not in cursor and '/' not in cursor and '+' not in cursor
+    assert decode_cursor(cursor) == (moment, 42)
+
+
+@pytest.mark.parametrize('cursor', [
+    'not a cursor',
+    base64.urlsafe_b64encode(b'2024-05-01T12:00:00').decode(),
+    base64.urlsafe_b64encode(b'yesterday|42').decode(),
+    base64.urlsafe_b64encode(b'2024-05-01T12:00:00|forty-two').decode(),
+    base64.urlsafe_b64encode(b'\xff\xfe|1').decode(),
+])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        decode_cursor(cursor)
+
+
+def test_pages_cover_every_row_once_across_timestamp_ties(videos):
+    moment = datetime(2024, 5, 1, 12, 0)
+    items = videos([moment + timedelta(minutes=n % 3) for n in range(7)])
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        page, cursor = keyset_page(Media.query, Media.created_at, Media.id, cursor, limit=3)
+        seen += page
+        pages += 1
+        if cursor is None:
+            break
+
+    assert [item.id for item in seen] == [item.id for item in _newest_first(items)]
+    assert pages == 3
+
+
+def test_full_last_page_has_no_next_cursor(videos):
+    videos([datetime(2024, 5, 1, 12, n) for n in range(4)])
+
+    page, cursor = keyset_page(Media.query, Media.created_at, Media.id, limit=4)
+
+    assert len(page) == 4 and cursor is None
+
+
+def test_gallery_feed_pages_through_public_videos(client, videos):
+    start = datetime(2024, 5, 1, 12, 0)
+    public = videos([start + timedelta(minutes=n) for n in range(15)])
+    videos([start + timedelta(minutes=30)], public=False)
+
+    first = client.get('/media/feed/video').json
+    second = client.get(first['next_url']).json
+
+    ids = [item['id'] for item in first['items'] + second['items']]
+    assert len(first['items']) == 12 and second['next_cursor'] is None
+    assert ids == [item.id for item in _newest_first(public)]
+
+
+def test_gallery_feed_rejects_bad_requests(client, videos):
+    assert client.get('/media/feed/video?cursor=bogus').status_code == 400
+    assert client.get('/media/feed/audio').status_code == 404
@@ -0,0 +1,84 @@
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from extensions import db
+from models import Media
+from utils import reoptimize
+
+
+class LegacyStorage:
+    def __init__(self, directory, keys):
+        self.directory, self.keys = directory, keys
+        self.source = os.path.join(directory, 'source.jpg')
+        with open(self.source, 'wb') as source:
+            source.write(b'x' * 2048)
+
+    def iter_files(self, prefix):
+        for key in self.keys:
+            yield key, 0, 2048
+
+    def fetch(self, key):
+        return self.source
+
+    def scratch_dir(self):
+        return self.directory
+
+
+@pytest.fixture
+def legacy(app, make_user, monkeypatch, tmp_path):
+    keys = [f'uploads/media/{name}-{uuid.uuid4().hex[:6]}.jpg' for name in ('a', 'b', 'c', 'd')]
+    uploader = make_user()
+    db.session.add_all(Media(title='Legacy', file_path=key, file_type='photo', uploaded_by_id=uploader.id)
+                       for key in keys)
+    db.session.commit()
+    monkeypatch.setitem(app.extensions, 'upload_storage', LegacyStorage(str(tmp_path), keys))
+    monkeypatch.setattr(reoptimize, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(reoptimize.ImagePipeline, '_record', staticmethod(lambda *args: True))
+    return keys
+
+
+def _process_failing(failing, processed):
+    def process_image(source, work_dir, **profile):
+        processed.append(source)
+        if failing:
+            failing.pop()
+            return {'success': False, 'error': 'Unreadable image'}
+        path = os.path.join(work_dir, 'out.jpg')
+        with open(path, 'wb') as output:
+            output.write(b'y' * 1024)
+        return {'success': True, 'path': path}
+    return process_image
+
+
+def test_interrupted_run_resumes_with_the_files_that_failed(app, legacy, monkeypatch):
+    first, stop = legacy[0], legacy[-1]
+    processed = []
+    # The first file fails; the run is interrupted once the last one is reached
+    monkeypatch.setattr(reoptimize, 'process_image', _process_failing([first], processed))
+    outcomes = {}
+
+    def progress(path, outcome):
+        outcomes[path] = outcome
+        if path == stop:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        reoptimize.reoptimize_uploads(workers=1, reset=True, progress=progress)
+
+    with open(reoptimize.checkpoint_path()) as checkpoint:
+        done = {line.strip() for line in checkpoint}
+    assert outcomes[first].startswith('failed') and first not in done
+    assert done == {path for path, outcome in outcomes.items() if 'KB' in outcome and path != stop}
+
+    # The resumed run converts what failed or was cut off, and skips the rest
+    resumed = []
+    monkeypatch.setattr(reoptimize, 'process_image', _process_failing([], resumed))
+    converted = []
+    report = reoptimize.reoptimize_uploads(workers=1, progress=lambda path, outcome: converted.append(path))
+
+    assert set(converted) == set(legacy) - done
+    assert report['processed'] == len(converted) and report['failed'] == 0
+    assert not os.path.exists(reoptimize.checkpoint_path())
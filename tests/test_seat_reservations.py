@@ -0,0 +1,198 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import blueprints.leadership as leadership_views
+from extensions import db
+from models import User, SeatReservation, RoleType, ApprovalStatus
+from utils import seat_reservations
+from utils.seat_index import get_seat_occupancy
+from utils.seat_reservations import reserve_seat, take_seat
+
+
+def _race(app, user_ids):
+    """Call reserve_seat for every user at once, one thread and session each"""
+    start = threading.Barrier(len(user_ids))
+    results = {}
+
+    def run(user_id):
+        with app.app_context():
+            user = db.session.get(User, user_id)
+            start.wait()
+            results[user_id] = reserve_seat(user)
+
+    threads = [threading.Thread(target=run, args=(user_id,)) for user_id in user_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _reservations(zone):
+    return SeatReservation.query.filter_by(role_type=RoleType.ZONAL_COORDINATOR, scope_key=f'zone:{zone.id}').all()
+
+
+def test_concurrent_reservations_never_overfill(app, make_zone, make_user):
+    zone = make_zone()
+    users = [make_user(RoleType.ZONAL_COORDINATOR, zone_id=zone.id, role_title=f'Coordinator {n}')
+             for n in range(8)]
+
+    results = _race(app, [user.id for user in users])
+
+    assert sum(results.values()) == 3
+    reservations = _reservations(zone)
+    assert len(reservations) == 3
+    assert sorted(r.seat_number for r in reservations) == [1, 2, 3]
+    assert {r.user_id for r in reservations} == {user_id for user_id, won in results.items() if won}
+
+
+def test_concurrent_reservations_for_one_title(app, make_zone, make_user):
+    zone = make_zone()
+    users = [make_user(RoleType.ZONAL_COORDINATOR, zone_id=zone.id, role_title='Zonal Secretary')
+             for _ in range(6)]
+
+    results = _race(app, [user.id for user in users])
+
+    assert sum(results.values()) == 1
+    assert [r.role_title for r in _reservations(zone)] == ['Zonal Secretary']
+
+
+def test_conflict_is_retried_without_losing_the_transaction(app, make_zone, make_user, monkeypatch, caplog):
+    zone = make_zone()
+    rival = make_user(RoleType.ZONAL_COORDINATOR, zone_id=zone.id)
+    real_try_reserve = seat_reservations._try_reserve
+    calls = []
+
+    def try_reserve_against_rival(user_id, role, role_title, scope_key, *args):
+        # The first attempt loses seat 1 to a rival, as if it committed between read and insert
+        reserved = real_try_reserve(user_id, role, role_title, scope_key, *args)
+        if not calls:
+            db.session.add(SeatReservation(user_id=rival.id, role_type=role, scope_key=scope_key,
+                                           seat_number=1, status='held'))
+        calls.append(user_id)
+        return reserved
+
+    monkeypatch.setattr(seat_reservations, '_try_reserve', try_reserve_against_rival)
+
+    # Registration inserts the user and takes the hold in one transaction
+    user = User(full_name='New Registrant', username='new_registrant', email='new.registrant@example.com',
+                role_type=RoleType.ZONAL_COORDINATOR, zone_id=zone.id, approval_status=ApprovalStatus.PENDING)
+    user.set_password('password')
+    db.session.add(user)
+    db.session.flush()
+    with caplog.at_level(logging.INFO):
+        assert take_seat(user)
+    db.session.commit()
+
+    assert len(calls) == 2
+    assert 'Seat reservation conflict' in caplog.text
+    assert db.session.get(User, user.id) is not None
+    [reservation] = _reservations(zone)
+    assert reservation.user_id == user.id
+    assert reservation.status == 'held'
+
+
+def test_occupancy_counts_live_holds(app, make_zone, make_user):
+    zone = make_zone()
+    assert get_seat_occupancy('ZONAL_COORDINATOR', zone_id=zone.id)['available'] == 3
+
+    holder = make_user(RoleType.ZONAL_COORDINATOR, zone_id=zone.id, role_title='Zonal Secretary')
+    assert reserve_seat(holder)
+    occupancy = get_seat_occupancy('ZONAL_COORDINATOR', zone_id=zone.id)
+    assert occupancy['available'] == 2
+    assert occupancy['taken_titles'] == {'Zonal Secretary'}
+
+    # An expired hold no longer takes a seat
+    lapsed = make_user(RoleType.ZONAL_COORDINATOR, zone_id=zone.id)
+    db.session.add(SeatReservation(user_id=lapsed.id, role_type=RoleType.ZONAL_COORDINATOR,
+                                   scope_key=f'zone:{zone.id}', seat_number=3, status='held',
+                                   expires_at=datetime.utcnow() - timedelta(minutes=1)))
+    db.session.commit()
+    app.cache.clear()
+    assert get_seat_occupancy('ZONAL_COORDINATOR', zone_id=zone.id)['available'] == 2
+
+
+def test_promotion_into_a_full_level_is_rolled_back(app, client, login, make_zone, make_user):
+    zone = make_zone()
+    for _ in range(3):
+        coordinator = make_user(RoleType.ZONAL_COORDINATOR, ApprovalStatus.APPROVED, zone_id=zone.id)
+        assert reserve_seat(coordinator, status='confirmed')
+    leader = make_user(RoleType.LGA_LEADER, ApprovalStatus.APPROVED, zone_id=zone.id)
+    login(User.query.filter_by(role_title='State Coordinator').first())
+
+    client.post(f'/staff/executive/promote-user/{leader.id}')
+
+    db.session.expire_all()
+    assert db.session.get(User, leader.id).role_type == RoleType.LGA_LEADER
+    assert len(_reservations(zone)) == 3
+
+
+def _admin():
+    return User.query.filter_by(role_type=RoleType.ADMIN).first()
+
+
+def test_failed_approval_does_not_confirm_the_seat(app, client, login, make_zone, make_user, monkeypatch):
+    zone = make_zone()
+    registrant = make_user(RoleType.ZONAL_COORDINATOR, zone_id=zone.id)
+    assert reserve_seat(registrant)
+    login(_admin())
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('Mail outbox unavailable')
+    monkeypatch.setattr(leadership_views, 'notify_account_approved', fail)
+
+    with pytest.raises(RuntimeError):
+        client.get(f'/leadership/approve/{registrant.id}')
+    db.session.rollback()
+
+    assert db.session.get(User, registrant.id).approval_status == ApprovalStatus.PENDING
+    [reservation] = _reservations(zone)
+    assert reservation.user_id == registrant.id and reservation.status == 'held'
+
+
+def test_approval_into_a_full_level_leaves_the_user_pending(app, client, login, make_zone, make_user):
+    zone = make_zone()
+    for _ in range(3):
+        assert reserve_seat(make_user(RoleType.ZONAL_COORDINATOR, ApprovalStatus.APPROVED, zone_id=zone.id),
+                            status='confirmed')
+    registrant = make_user(RoleType.ZONAL_COORDINATOR, zone_id=zone.id)
+    login(_admin())
+
+    client.get(f'/leadership/approve/{registrant.id}')
+
+    db.session.expire_all()
+    assert db.session.get(User, registrant.id).approval_status == ApprovalStatus.PENDING
+    assert registrant.id not in {r.user_id for r in _reservations(zone)}
+
+
+def test_approval_confirms_the_hold(app, client, login, make_zone, make_user):
+    zone = make_zone()
+    registrant = make_user(RoleType.ZONAL_COORDINATOR, zone_id=zone.id)
+    assert reserve_seat(registrant)
+    login(_admin())
+
+    client.get(f'/leadership/approve/{registrant.id}')
+
+    db.session.expire_all()
+    assert db.session.get(User, registrant.id).approval_status == ApprovalStatus.APPROVED
+    [reservation] = _reservations(zone)
+    assert reservation.status == 'confirmed' and reservation.expires_at is None
+
+
+def test_rejection_and_dismissal_give_up_the_seat(app, client, login, make_zone, make_user):
+    zone = make_zone()
+    registrant = make_user(RoleType.ZONAL_COORDINATOR, zone_id=zone.id)
+    member = make_user(RoleType.ZONAL_COORDINATOR, ApprovalStatus.APPROVED, zone_id=zone.id)
+    assert reserve_seat(registrant) and reserve_seat(member, status='confirmed')
+    login(_admin())
+
+    client.get(f'/leadership/reject/{registrant.id}')
+    client.post(f'/staff/executive/dismiss-user/{member.id}')
+
+    db.session.expire_all()
+    assert db.session.get(User, registrant.id).approval_status == ApprovalStatus.REJECTED
+    assert db.session.get(User, member.id).approval_status == ApprovalStatus.REJECTED
+    assert _reservations(zone) == []
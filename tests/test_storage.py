@@ -0,0 +1,145 @@
+import io
+import os
+from types import SimpleNamespace
+
+import boto3
+import pytest
+import requests
+from moto import mock_aws
+
+from utils import storage as storage_module
+from utils.storage import S3Storage
+
+
+@pytest.fixture
+def s3(tmp_path):
+    return S3Storage('uploads', endpoint_url='http://127.0.0.1:9', region='us-east-1',
+                     access_key='key', secret_key='secret', cache_dir=str(tmp_path), cache_max_bytes=250)
+
+
+def test_presigned_urls_are_reused_for_most_of_their_lifetime(s3, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(storage_module.time, 'monotonic', lambda: clock[0])
+    signed = []
+    presign = s3._presign
+    monkeypatch.setattr(s3, '_presign', lambda key, expires: signed.append(key) or presign(key, expires))
+
+    first = s3.url('uploads/blobs/aa/bb/one.jpg')
+    assert s3.url('uploads/blobs/aa/bb/one.jpg') == first
+    s3.url('uploads/blobs/aa/bb/two.jpg')
+    assert signed == ['uploads/blobs/aa/bb/one.jpg', 'uploads/blobs/aa/bb/two.jpg']
+
+    clock[0] += storage_module.PRESIGNED_URL_REUSE + 1
+    s3.url('uploads/blobs/aa/bb/one.jpg')
+    assert signed[-1] == 'uploads/blobs/aa/bb/one.jpg' and len(signed) == 3
+
+
+def test_public_url_needs_no_signing(tmp_path):
+    s3 = S3Storage('uploads', endpoint_url='http://127.0.0.1:9', region='us-east-1',
+                   public_url='https://cdn.example.com/', cache_dir=str(tmp_path))
+    assert s3.url('uploads/blobs/aa/bb/one.jpg') == 'https://cdn.example.com/uploads/blobs/aa/bb/one.jpg'
+
+
+def test_download_cache_evicts_least_recently_used(s3, monkeypatch):
+    downloads = []
+
+    def download_file(bucket, key, path, Config=None):
+        downloads.append(key)
+        with open(path, 'wb') as f:
+            f.write(b'x' * 100)
+    monkeypatch.setattr(s3.client, 'download_file', download_file)
+
+    first, second = s3.fetch('blobs/a.jpg'), s3.fetch('blobs/b.jpg')
+    s3.fetch('blobs/a.jpg')  # Used again, so b is now the oldest
+    third = s3.fetch('blobs/c.jpg')
+
+    assert downloads == ['blobs/a.jpg', 'blobs/b.jpg', 'blobs/c.jpg']
+    assert os.path.exists(first) and os.path.exists(third)
+    assert not os.path.exists(second)
+    assert s3._cached_total == 200
+
+
+@pytest.fixture
+def bucket(tmp_path):
+    """S3Storage against moto's in-memory S3"""
+    with mock_aws():
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket='kpn-uploads')
+        yield S3Storage('kpn-uploads', region='us-east-1', access_key='key', secret_key='secret',
+                        cache_dir=str(tmp_path / 'cache'))
+
+
+def _local_file(storage, content):
+    path = os.path.join(storage.scratch_dir(), f'upload-{len(content)}')
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+
+def test_stored_objects_round_trip(bucket):
+    source = _local_file(bucket, b'\xff\xd8 jpeg bytes')
+    bucket.put_file('uploads/blobs/aa/bb/one.jpg', source)
+    bucket.put_stream('uploads/blobs/aa/bb/two.png', io.BytesIO(b'png bytes'))
+
+    assert not os.path.exists(source)
+    assert bucket.exists('uploads/blobs/aa/bb/one.jpg') and bucket.size('uploads/blobs/aa/bb/one.jpg') == 13
+    assert bucket.read_range('uploads/blobs/aa/bb/one.jpg', 0, 1) == b'\xff\xd8'
+    assert bucket.open('uploads/blobs/aa/bb/two.png').read() == b'png bytes'
+    head = bucket.client.head_object(Bucket='kpn-uploads', Key='uploads/blobs/aa/bb/two.png')
+    assert head['ContentType'] == 'image/png'
+
+    fetched = bucket.fetch('uploads/blobs/aa/bb/one.jpg')
+    with open(fetched, 'rb') as f:
+        assert f.read() == b'\xff\xd8 jpeg bytes'
+    assert bucket.fetch('uploads/blobs/aa/bb/missing.jpg') is None
+
+    bucket.delete('uploads/blobs/aa/bb/one.jpg')
+    assert not bucket.exists('uploads/blobs/aa/bb/one.jpg')
+    with pytest.raises(FileNotFoundError):
+        bucket.size('uploads/blobs/aa/bb/one.jpg')
+
+
+def test_large_files_are_uploaded_in_parts(bucket, monkeypatch):
+    monkeypatch.setattr(bucket.transfer_config, 'multipart_threshold', 5 * 1024 * 1024)
+    monkeypatch.setattr(bucket.transfer_config, 'multipart_chunksize', 5 * 1024 * 1024)
+    content = os.urandom(5 * 1024 * 1024) + b'tail'
+
+    bucket.put_file('uploads/videos/rally.mp4', _local_file(bucket, content))
+
+    head = bucket.client.head_object(Bucket='kpn-uploads', Key='uploads/videos/rally.mp4')
+    assert head['ETag'].strip('"').endswith('-2')
+    assert bucket.read_range('uploads/videos/rally.mp4', len(content) - 4, len(content) - 1) == b'tail'
+
+
+def test_direct_multipart_upload_through_presigned_part_urls(bucket):
+    key = 'uploads/videos/direct.mp4'
+    parts = [os.urandom(5 * 1024 * 1024), b'last part']
+    upload_id = bucket.create_multipart_upload(key)
+
+    etags = []
+    for number, body in enumerate(parts, start=1):
+        response = requests.put(bucket.presign_upload_part(key, upload_id, number), data=body)
+        assert response.status_code == 200
+        etags.append((number, response.headers['ETag']))
+    bucket.complete_multipart_upload(key, upload_id, list(reversed(etags)))
+
+    assert bucket.size(key) == sum(len(body) for body in parts)
+    assert bucket.read_range(key, bucket.size(key) - 9, bucket.size(key) - 1) == b'last part'
+
+    abandoned = bucket.create_multipart_upload('uploads/videos/abandoned.mp4')
+    bucket.abort_multipart_upload('uploads/videos/abandoned.mp4', abandoned)
+    assert not bucket.client.list_multipart_uploads(Bucket='kpn-uploads').get('Uploads')
+
+
+def test_iter_files_lists_every_page_under_the_prefix(bucket, monkeypatch):
+    keys = [f'uploads/blobs/aa/bb/{n:02d}.jpg' for n in range(5)]
+    for key in keys:
+        bucket.put_stream(key, io.BytesIO(b'blob'))
+    bucket.put_stream('uploads/blobs-old/other.jpg', io.BytesIO(b'outside'))
+    paginate = bucket.client.get_paginator('list_objects_v2').paginate
+    monkeypatch.setattr(bucket.client, 'get_paginator', lambda name: SimpleNamespace(
+        paginate=lambda **kwargs: paginate(PaginationConfig={'PageSize': 2}, **kwargs)))
+
+    listed = list(bucket.iter_files('uploads/blobs'))
+
+    assert [key for key, _, _ in listed] == keys
+    assert all(size == 4 and modified > 0 for _, modified, size in listed)
@@ -0,0 +1,99 @@
+import uuid
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+from extensions import db
+from models import User
+from utils import time_series
+from utils.time_series import bucket_start, count_by_bucket, series
+
+
+@pytest.fixture
+def joined(make_zone):
+    """Registers zone members at given moments; returns the criterion selecting them"""
+    zone = make_zone()
+
+    def joined(*moments):
+        # Added directly: hashing a password per member would dominate the test's run time
+        db.session.add_all(User(username=f'joined_{uuid.uuid4().hex}', email=f'{uuid.uuid4().hex}@example.com',
+                                password_hash='-', full_name='Member', zone_id=zone.id, created_at=moment)
+                           for moment in moments)
+        db.session.commit()
+        return User.zone_id == zone.id
+    joined.zone = zone
+    return joined
+
+
+def _expected(moments, bucket):
+    counts = {}
+    for moment in moments:
+        start = bucket_start(moment.date(), bucket)
+        counts[start] = counts.get(start, 0) + 1
+    return counts
+
+
+# 2024-03-04 is a Monday; the fortnight covers both ends of every day, Sundays included
+FORTNIGHT = [datetime.combine(date(2024, 3, 4) + timedelta(days=n), at)
+             for n in range(14) for at in (time(0, 0), time(23, 59, 59))]
+
+
+@pytest.mark.parametrize('bucket', ['day', 'week'])
+def test_sqlite_buckets_match_bucket_start(app, joined, bucket):
+    in_zone = joined(*FORTNIGHT)
+
+    counts = count_by_bucket(User.created_at, bucket, date(2024, 3, 1), in_zone)
+
+    assert counts == _expected(FORTNIGHT, bucket)
+    if bucket == 'week':
+        assert counts == {date(2024, 3, 4): 14, date(2024, 3, 11): 14}
+
+
+def test_sunday_night_and_monday_morning_fall_in_different_weeks(app, joined):
+    sunday, monday = datetime(2024, 3, 10, 23, 59, 59), datetime(2024, 3, 11, 0, 0)
+    in_zone = joined(sunday, monday)
+
+    assert count_by_bucket(User.created_at, 'week', date(2024, 3, 1), in_zone) == {
+        date(2024, 3, 4): 1, date(2024, 3, 11): 1
+    }
+
+
+def test_month_buckets_split_at_midnight_and_across_years(app, joined):
+    moments = [datetime(2023, 12, 31, 23, 59, 59), datetime(2024, 1, 1), datetime(2024, 2, 29, 12, 0),
+               datetime(2024, 3, 1)]
+    in_zone = joined(*moments)
+
+    counts = count_by_bucket(User.created_at, 'month', date(2023, 12, 1), in_zone)
+
+    assert counts == {date(2023, 12, 1): 1, date(2024, 1, 1): 1, date(2024, 2, 1): 1, date(2024, 3, 1): 1}
+
+
+def test_rows_before_since_are_not_counted(app, joined):
+    in_zone = joined(datetime(2024, 2, 29, 23, 59, 59), datetime(2024, 3, 1))
+
+    assert count_by_bucket(User.created_at, 'day', date(2024, 3, 1), in_zone) == {date(2024, 3, 1): 1}
+
+
+def test_other_dialects_bucket_in_python(app, joined, monkeypatch):
+    in_zone = joined(*FORTNIGHT)
+    monkeypatch.setattr(time_series, '_truncate', lambda *args: None)
+
+    assert count_by_bucket(User.created_at, 'week', date(2024, 3, 1), in_zone) == _expected(FORTNIGHT, 'week')
+
+
+def test_series_fills_empty_buckets_and_scopes_to_the_zone(app, joined, make_user):
+    now = datetime.utcnow()
+    joined(now, now - timedelta(weeks=2))
+    make_user(created_at=now)  # Outside the zone
+
+    weeks = series('registrations', 'week', 3, scope='zone', scope_id=joined.zone.id)
+
+    current = bucket_start(now.date(), 'week')
+    assert [week['start'] for week in weeks] == [current - timedelta(weeks=n) for n in (2, 1, 0)]
+    assert [week['count'] for week in weeks] == [1, 0, 1]
+    assert all(week['start'].weekday() == 0 for week in weeks)
+
+
+def test_unknown_bucket_is_rejected(app):
+    with pytest.raises(ValueError):
+        count_by_bucket(User.created_at, 'quarter', date(2024, 1, 1))
@@ -0,0 +1,94 @@
+import hashlib
+import io
+import os
+
+import pytest
+from flask import request
+
+from utils.upload_intake import sniff, validate_upload, IntakeFile, DEFAULT_TYPE_LIMITS, MB, SNIFF_BYTES
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 40
+MP4 = b'\x00\x00\x00\x18ftypmp42' + b'\x00' * 40
+
+
+@pytest.mark.parametrize('header, expected', [
+    (b'\xff\xd8\xff\xe0' + b'\x00' * 28, ('image', '.jpg', 'image/jpeg')),
+    (PNG, ('image', '.png', 'image/png')),
+    (b'GIF89a' + b'\x00' * 26, ('image', '.gif', 'image/gif')),
+    (b'RIFF\x00\x00\x00\x00WEBPVP8 ', ('image', '.webp', 'image/webp')),
+    (b'\x00\x00\x00\x1cftypavif', ('image', '.avif', 'image/avif')),
+    (b'RIFF\x00\x00\x00\x00AVI LIST', ('video', '.avi', 'video/x-msvideo')),
+    (b'\x1a\x45\xdf\xa3\x9f\x42\x86\x81', ('video', '.webm', 'video/webm')),
+    (b'\x00\x00\x00\x14ftypqt  ', ('video', '.mov', 'video/quicktime')),
+    (MP4, ('video', '.mp4', 'video/mp4')),
+    (b'%PDF-1.7\n', (None, None, None)),
+    (b'<?php echo 1; ?>', (None, None, None)),
+    (b'\x00\x00\x00\x18ftypheic', (None, None, None)),
+])
+def test_files_are_identified_by_their_leading_bytes(header, expected):
+    assert sniff(header) == expected
+
+
+def test_intake_file_hashes_and_sniffs_while_streaming(tmp_path):
+    content = PNG + os.urandom(100_000)
+    intake = IntakeFile(str(tmp_path), DEFAULT_TYPE_LIMITS)
+    # Chunks smaller than the sniffed header, as the parser may deliver them
+    for start in range(0, len(content), SNIFF_BYTES // 4):
+        intake.write(content[start:start + SNIFF_BYTES // 4])
+    intake.seek(0)
+
+    assert (intake.kind, intake.mimetype, intake.error) == ('image', 'image/png', None)
+    assert intake.size == len(content) and intake.digest == hashlib.sha256(content).hexdigest()
+    assert intake.read() == content
+    intake.close()
+    assert not os.path.exists(intake.path)
+
+
+def test_intake_file_stops_storing_past_the_limit_for_its_type(tmp_path):
+    intake = IntakeFile(str(tmp_path), {'image': 1 * MB, None: 4 * MB})
+    intake.write(PNG)
+    for _ in range(2):
+        intake.write(b'\x00' * (MB // 2))
+
+    assert intake.error == 'File too large. Maximum size is 1MB.'
+    assert os.path.getsize(intake.path) == 0
+    intake.close()
+
+
+def test_short_file_is_sniffed_when_the_parser_rewinds(tmp_path):
+    intake = IntakeFile(str(tmp_path), DEFAULT_TYPE_LIMITS)
+    intake.write(b'GIF89a')
+    intake.seek(0)
+
+    assert intake.kind == 'image' and intake.ext == '.gif'
+    intake.close()
+
+
+def _validate(app, content, filename, **kwargs):
+    data = {'file': (io.BytesIO(content), filename)}
+    with app.test_request_context('/upload', method='POST', data=data, content_type='multipart/form-data'):
+        file = request.files['file']
+        assert isinstance(file.stream, IntakeFile)
+        return validate_upload(file, **kwargs)
+
+
+def test_uploads_are_validated_by_content_not_name(app):
+    assert _validate(app, PNG, 'photo.png') is None
+    assert _validate(app, PNG, 'renamed.txt') is None
+    assert _validate(app, b'<?php echo 1; ?>' * 4, 'shell.jpg').startswith('Invalid file type')
+    assert _validate(app, MP4, 'clip.jpg').startswith('Invalid file type')
+    assert _validate(app, MP4, 'clip.mp4', kinds=('image', 'video')) is None
+
+
+def test_tighter_size_limit_applies_after_intake(app):
+    content = PNG + b'\x00' * MB
+
+    assert _validate(app, content, 'photo.png') is None
+    assert _validate(app, content, 'photo.png', max_size_mb=1) == 'File too large. Maximum size is 1MB.'
+
+
+def test_per_type_limits_can_be_configured(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'UPLOAD_TYPE_LIMITS', {'video': 1 * MB})
+
+    assert _validate(app, MP4 + b'\x00' * MB, 'clip.mp4', kinds=('video',)) == \
+        'File too large. Maximum size is 1MB.'
@@ -0,0 +1,117 @@
+"""
+Activity feed
+Registrations, approvals, role changes, duties and disciplinary actions are
+appended to activity_feed in the same transaction as the change. An activity
+gets one row for the state feed and one for each of the zone, LGA and ward
+feeds of the member it concerns, so every dashboard reads its feed as one
+keyset-paginated range of the (scope, created_at, id) index, with the text
+already written.
+"""
+from datetime import datetime
+from sqlalchemy import insert
+from extensions import db
+from models import ActivityFeedEntry, User, LGA, Ward, RoleType
+from utils.pagination import keyset_page
+
+FEED_PAGE_SIZE = 15
+STATE_FEED_ROLES = (RoleType.ADMIN, RoleType.EXECUTIVE, RoleType.ICT_ADMIN, RoleType.AUDITOR_GENERAL)
+
+
+def _scope_keys(zone_id, lga_id, ward_id):
+    return ['state'] + [f'{level}:{location_id}' for level, location_id in
+                        (('zone', zone_id), ('lga', lga_id), ('ward', ward_id)) if location_id]
+
+
+def feed_scopes(zone_id=None, lga_id=None, ward_id=None):
+    """Feeds an activity at a location appears in: the state's and those of its zone, LGA and ward"""
+    if ward_id and not lga_id:
+        lga_id = db.session.query(Ward.lga_id).filter(Ward.id == ward_id).scalar()
+    if lga_id and not zone_id:
+        zone_id = db.session.query(LGA.zone_id).filter(LGA.id == lga_id).scalar()
+    return _scope_keys(zone_id, lga_id, ward_id)
+
+
+def record_activity(kind, description, *subjects, actor=None):
+    """
+    Append an activity to the feeds in the current transaction
+
+    Args:
+        kind: Activity type, e.g. 'promotion' (see ActivityFeedEntry.kind)
+        description: Text shown in the feed (up to 255 characters)
+        *subjects: Members the activity concerns; it appears in the feeds of
+            each one's location, and the first is shown as its member
+        actor: User who performed it (optional)
+
+    Returns:
+        int: Number of feed rows written
+    """
+    subjects = [subject for subject in subjects if subject is not None]
+    scopes = ['state']
+    for subject in subjects:
+        scopes += feed_scopes(subject.zone_id, subject.lga_id, subject.ward_id)
+    subject = subjects[0] if subjects else None
+    now = datetime.utcnow()
+    rows = [{
+        'scope': scope,
+        'kind': kind,
+        'description': description[:255],
+        'actor_id': actor.id if actor else None,
+        'subject_id': subject.id if subject else None,
+        'subject_name': subject.full_name if subject else None,
+        'created_at': now,
+    } for scope in dict.fromkeys(scopes)]
+    db.session.execute(insert(ActivityFeedEntry), rows)
+    return len(rows)
+
+
+def can_view_feed(user, scope):
+    """Whether a user may read a feed: the state feed for state-level roles, otherwise their own location's"""
+    if user.role_type in STATE_FEED_ROLES:
+        return True
+    level, _, location_id = scope.partition(':')
+    if level not in ('zone', 'lga', 'ward') or not location_id.isdigit():
+        return False
+    return getattr(user, f'{level}_id') == int(location_id)
+
+
+def activity_feed(scope='state', cursor=None, limit=FEED_PAGE_SIZE):
+    """
+    One page of a feed, newest first
+
+    Returns:
+        tuple: (entries, next_cursor); next_cursor is None on the last page
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    return keyset_page(ActivityFeedEntry.query.filter_by(scope=scope),
+                       ActivityFeedEntry.created_at, ActivityFeedEntry.id, cursor, limit)
+
+
+def backfill_feed():
+    """
+    Seed an empty feed with past registrations
+
+    Returns:
+        int: Number of registrations recorded, or None if the feed already has entries
+    """
+    if db.session.query(ActivityFeedEntry.id).first() is not None:
+        return None
+    lga_zones = dict(db.session.query(LGA.id, LGA.zone_id))
+    ward_lgas = dict(db.session.query(Ward.id, Ward.lga_id))
+    rows = []
+    for user in User.query.yield_per(500):
+        lga_id = user.lga_id or ward_lgas.get(user.ward_id)
+        zone_id = user.zone_id or lga_zones.get(lga_id)
+        rows += [{
+            'scope': scope,
+            'kind': 'registration',
+            'description': f'New {user.role_type.value.replace("_", " ").title()} registration',
+            'subject_id': user.id,
+            'subject_name': user.full_name,
+            'created_at': user.created_at or datetime.utcnow(),
+        } for scope in _scope_keys(zone_id, lga_id, user.ward_id)]
+    if rows:
+        db.session.execute(insert(ActivityFeedEntry), rows)
+    db.session.commit()
+    return len({row['subject_id'] for row in rows})
@@ -0,0 +1,177 @@
+"""
+Audit trail of privileged staff actions
+audit() records who did what to whom as a structured row rather than a log
+line. Records are buffered in memory and a background thread writes them to
+audit_log in batches: every FLUSH_INTERVAL seconds, sooner once FLUSH_BATCH
+are waiting, and a last time when the process exits, so a crash loses at most
+the last interval's records. If the database cannot be reached the buffer
+holds up to BUFFER_LIMIT records and drops the oldest beyond that.
+
+audit_entries() and audit_summary() query the log through its indexes on
+(action | actor_id | target_id, created_at, id).
+"""
+import atexit
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from flask import current_app, request, has_request_context
+from flask_login import current_user
+from sqlalchemy import insert, func
+from extensions import db
+from models import AuditLog
+from utils.pagination import keyset_page
+
+FLUSH_BATCH = 100  # Waiting records that trigger an early flush
+FLUSH_INTERVAL = 5  # Seconds; the most a crash can lose
+BUFFER_LIMIT = 10000  # Records kept while writes fail
+AUDIT_PAGE_SIZE = 25
+
+
+class AuditTrail:
+    """In-memory buffer of audit records and the thread that writes them; started by the first record()"""
+
+    def __init__(self):
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # One writer at a time keeps records in order
+        self._wake = threading.Event()
+        self._thread = None
+        self._app = None
+        self.dropped = 0
+
+    def record(self, entry):
+        """Buffer a record (a dict of AuditLog columns) for the next batch"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._app = current_app._get_current_object()
+                self._thread = threading.Thread(target=self._run, name='audit-log', daemon=True)
+                self._thread.start()
+            self._buffer.append(entry)
+            self._trim()
+            waiting = len(self._buffer)
+        if waiting >= FLUSH_BATCH:
+            self._wake.set()
+
+    def flush(self):
+        """
+        Write every buffered record in one batch
+
+        Returns:
+            int: Records written; 0 if there were none or the write failed
+                (the records are then kept for the next attempt)
+        """
+        if self._app is None:
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._buffer)
+                self._buffer.clear()
+            if not batch:
+                return 0
+            try:
+                # A context of its own, so the write never shares a request's session
+                with self._app.app_context():
+                    db.session.execute(insert(AuditLog), batch)
+                    db.session.commit()
+            except Exception as e:
+                logging.error(f"Audit log flush failed, {len(batch)} records kept: {e}")
+                with self._lock:
+                    self._buffer.extendleft(reversed(batch))
+                    self._trim()
+                return 0
+            return len(batch)
+
+    def _trim(self):
+        # Caller holds self._lock
+        while len(self._buffer) > BUFFER_LIMIT:
+            self._buffer.popleft()
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logging.warning(f"Audit log buffer full; {self.dropped} records dropped so far")
+
+    def _run(self):
+        interval = self._app.config.get('AUDIT_FLUSH_INTERVAL', FLUSH_INTERVAL)
+        while True:
+            self._wake.wait(interval)
+            self._wake.clear()
+            self.flush()
+
+
+# Create global instance; whatever is still buffered is written on shutdown
+audit_trail = AuditTrail()
+atexit.register(audit_trail.flush)
+
+
+def audit(action, target=None, **details):
+    """
+    Record a privileged action by the current user
+
+    Call once the change is committed; the record is written with the next
+    batch.
+
+    Args:
+        action: What was done, e.g. 'promote_user' (see AuditLog.action)
+        target: User it was done to (optional)
+        **details: Action-specific fields stored as JSON, e.g. old_role='ward_leader'
+    """
+    actor = current_user if has_request_context() and current_user.is_authenticated else None
+    audit_trail.record({
+        'action': action,
+        'actor_id': actor.id if actor else None,
+        'actor_name': actor.full_name if actor else None,
+        'actor_role': actor.role_type.value if actor else None,
+        'target_id': target.id if target else None,
+        'target_name': target.full_name if target else None,
+        'details': details or None,
+        'ip_address': request.remote_addr if has_request_context() else None,
+        'created_at': datetime.utcnow(),
+    })
+
+
+def audit_entries(action=None, actor_id=None, target_id=None, since=None, until=None,
+                  cursor=None, limit=AUDIT_PAGE_SIZE):
+    """
+    One page of the audit log, newest first
+
+    Buffered records are written first, so actions taken moments ago are
+    included. Filtering on one of action, actor_id or target_id reads a range
+    of that column's index.
+
+    Args:
+        action: Only this action
+        actor_id: Only actions taken by this user
+        target_id: Only actions taken on this user
+        since: Only actions at or after this datetime
+        until: Only actions before this datetime
+        cursor: Cursor of the previous page, or None for the first page
+        limit: Entries per page
+
+    Returns:
+        tuple: (entries, next_cursor); next_cursor is None on the last page
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    audit_trail.flush()
+    query = AuditLog.query
+    if action:
+        query = query.filter(AuditLog.action == action)
+    if actor_id:
+        query = query.filter(AuditLog.actor_id == actor_id)
+    if target_id:
+        query = query.filter(AuditLog.target_id == target_id)
+    if since:
+        query = query.filter(AuditLog.created_at >= since)
+    if until:
+        query = query.filter(AuditLog.created_at < until)
+    return keyset_page(query, AuditLog.created_at, AuditLog.id, cursor, limit)
+
+
+def audit_summary(days=30):
+    """Actions taken in the last few days, counted per action in one grouped query"""
+    audit_trail.flush()
+    since = datetime.utcnow() - timedelta(days=days)
+    return dict(db.session.query(AuditLog.action, func.count(AuditLog.id))
+                .filter(AuditLog.created_at >= since)
+                .group_by(AuditLog.action))
@@ -0,0 +1,296 @@
+"""
+Content-addressed blob store for uploads
+Files are hashed while they stream to disk and stored once under
+uploads/blobs/<aa>/<bb>/<sha256>.<ext> in the configured storage backend, so
+identical uploads share one file and every blob URL can be cached forever.
+Rows that reference a blob keep its ref_count current; collect_garbage()
+removes blobs nobody references.
+
+A publisher claims the Blob row before it looks for the file, and the
+collector deletes the row before the file in the same transaction. A file is
+therefore only removed once no upload can be reusing it.
+"""
+import os
+import time
+import logging
+import hashlib
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import Blob, Media, User, Campaign
+from utils.image_metadata import forget_metadata
+from utils.storage import get_storage
+
+BLOB_ROOT = 'uploads/blobs'
+CHUNK_SIZE = 64 * 1024
+GC_GRACE_PERIOD = timedelta(hours=1)  # Protects uploads whose rows are not committed yet
+
+# Columns that reference blobs; JSON columns hold responsive variant metadata
+REFERENCE_COLUMNS = [
+    (Media, 'file_path'), (Media, 'thumbnail_path'), (Media, 'variants'),
+    (User, 'photo'), (User, 'photo_thumbnail'), (User, 'photo_variants'),
+    (Campaign, 'featured_image'), (Campaign, 'featured_image_variants'),
+]
+
+
+def is_blob_path(path):
+    return isinstance(path, str) and path.startswith(f"{BLOB_ROOT}/")
+
+
+def blob_path(digest, ext):
+    """Sharded path of a blob relative to static/"""
+    return f"{BLOB_ROOT}/{digest[:2]}/{digest[2:4]}/{digest}{ext.lower()}"
+
+
+def temp_dir():
+    """Local scratch directory; on the filesystem backend publishing from here is a rename"""
+    return get_storage().scratch_dir()
+
+
+def referenced_paths(value):
+    """Paths referenced by a column value (a path or variant metadata)"""
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        return [source['path'] for sources in value.get('sources', {}).values() for source in sources]
+    return []
+
+
+def _publish(tmp_path, digest, size, ext):
+    relative_path = blob_path(digest, ext)
+    storage = get_storage()
+
+    # Claim the row first: restarting an orphan's grace period locks it against
+    # collect_garbage() until this transaction ends, and a new row does the same
+    touched = Blob.query.filter(Blob.path == relative_path, Blob.ref_count <= 0).update(
+        {Blob.orphaned_at: datetime.utcnow()}, synchronize_session=False
+    )
+    if not touched and db.session.query(Blob.id).filter_by(path=relative_path).first() is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(Blob(path=relative_path, digest=digest, size=size,
+                                    ref_count=0, orphaned_at=datetime.utcnow()))
+        except IntegrityError:
+            pass  # Recorded by a concurrent upload of the same content
+
+    if storage.exists(relative_path):
+        # Identical content is already stored
+        os.remove(tmp_path)
+    else:
+        storage.put_file(relative_path, tmp_path)
+    return relative_path
+
+
+def put_stream(stream, ext):
+    """
+    Store a stream as a blob, hashing it while it is written
+
+    Args:
+        stream: Readable binary stream
+        ext: File extension including the dot (e.g. '.jpg')
+
+    Returns:
+        str: Blob path (storage key)
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=temp_dir())
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        with os.fdopen(fd, 'wb') as destination:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                destination.write(chunk)
+                size += len(chunk)
+            destination.flush()
+            os.fsync(destination.fileno())
+        return _publish(tmp_path, digest.hexdigest(), size, ext)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def put_intake(intake):
+    """Publish an upload received by utils.upload_intake without copying it again"""
+    intake.finish()
+    relative_path = _publish(intake.path, intake.digest, intake.size, intake.ext or '')
+    intake.published = True
+    return relative_path
+
+
+def put_file(path):
+    """Move a local file (e.g. pipeline output in temp_dir()) into the store"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return _publish(path, digest.hexdigest(), os.path.getsize(path), os.path.splitext(path)[1])
+
+
+def acquire(*paths):
+    """Count a new reference to each blob path (other paths are ignored)"""
+    for count, group in _group(paths).items():
+        Blob.query.filter(Blob.path.in_(group)).update(
+            {Blob.ref_count: Blob.ref_count + count, Blob.orphaned_at: None},
+            synchronize_session=False
+        )
+
+
+def release(*paths):
+    """Drop a reference to each blob path; unreferenced blobs wait for collect_garbage()"""
+    groups = _group(paths)
+    for count, group in groups.items():
+        Blob.query.filter(Blob.path.in_(group)).update(
+            {Blob.ref_count: Blob.ref_count - count}, synchronize_session=False
+        )
+    released = [path for group in groups.values() for path in group]
+    if released:
+        Blob.query.filter(Blob.path.in_(released), Blob.ref_count <= 0, Blob.orphaned_at.is_(None)).update(
+            {Blob.orphaned_at: datetime.utcnow()}, synchronize_session=False
+        )
+
+
+def _group(paths):
+    """Group blob paths by how many times each occurs, for one UPDATE per count"""
+    groups = {}
+    for path, count in Counter(p for p in paths if is_blob_path(p)).items():
+        groups.setdefault(count, []).append(path)
+    return groups
+
+
+def recount_references():
+    """Recompute every ref_count from the referencing columns; returns the number corrected"""
+    counts = Counter()
+    for model, column in REFERENCE_COLUMNS:
+        attribute = getattr(model, column)
+        for (value,) in db.session.query(attribute).filter(attribute.isnot(None)):
+            counts.update(path for path in referenced_paths(value) if is_blob_path(path))
+
+    corrected = 0
+    for blob in Blob.query.all():
+        actual = counts.get(blob.path, 0)
+        if blob.ref_count != actual:
+            corrected += 1
+            blob.ref_count = actual
+        if actual and blob.orphaned_at:
+            blob.orphaned_at = None
+        elif not actual and not blob.orphaned_at:
+            blob.orphaned_at = datetime.utcnow()
+    db.session.commit()
+    return corrected
+
+
+def _delete_orphan(storage, blob_id, path, cutoff):
+    """
+    Delete an orphaned blob's row, then its file, in one transaction
+
+    The conditional DELETE skips a blob that was referenced or re-published
+    since it was listed, and holds the row until the file is gone, so a
+    concurrent _publish() waits and then records the content afresh.
+
+    Returns:
+        bool: True if the blob was removed
+    """
+    try:
+        deleted = Blob.query.filter(
+            Blob.id == blob_id, Blob.ref_count <= 0, Blob.orphaned_at < cutoff
+        ).delete(synchronize_session=False)
+        if deleted:
+            forget_metadata(path)
+            storage.delete(path)
+        db.session.commit()
+        return bool(deleted)
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Could not remove blob {path}: {e}")
+        return False
+
+
+def _delete_stray(storage, key, size):
+    """
+    Delete a file that has no Blob row, holding a placeholder row meanwhile
+
+    A _publish() reusing the file inserts or waits on the same unique path,
+    so either the file is kept for it or it is re-uploaded after the delete.
+
+    Returns:
+        bool: True if the file was removed
+    """
+    placeholder = Blob(path=key, digest='', size=size, ref_count=0, orphaned_at=datetime.utcnow())
+    try:
+        db.session.add(placeholder)
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        return False  # Claimed by an upload since the listing
+    try:
+        storage.delete(key)
+        db.session.delete(placeholder)
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Could not remove stray blob file {key}: {e}")
+        return False
+
+
+def collect_garbage(grace_period=GC_GRACE_PERIOD, recount=False, dry_run=False):
+    """
+    Delete unreferenced blobs and stray files older than the grace period
+
+    Args:
+        grace_period: How long an unreferenced blob or stray file is kept
+        recount: Recompute reference counts from the database first
+        dry_run: Report what would be removed without deleting anything
+
+    Returns:
+        dict: 'removed' files, 'bytes_freed' and 'recounted' references
+    """
+    recounted = recount_references() if recount else 0
+    cutoff = datetime.utcnow() - grace_period
+    removed = bytes_freed = 0
+
+    storage = get_storage()
+    orphans = db.session.query(Blob.id, Blob.path, Blob.size).filter(
+        Blob.ref_count <= 0, Blob.orphaned_at < cutoff
+    ).all()
+    db.session.commit()
+    for blob_id, path, size in orphans:
+        if dry_run:
+            removed += 1
+            bytes_freed += size
+            continue
+        if _delete_orphan(storage, blob_id, path, cutoff):
+            removed += 1
+            bytes_freed += size
+
+    # Files without a Blob row: crashed uploads, rolled-back requests, temp leftovers
+    known = {path for (path,) in db.session.query(Blob.path)}
+    db.session.commit()
+    cutoff_timestamp = time.time() - grace_period.total_seconds()
+    for key, modified, size in list(storage.iter_files(BLOB_ROOT)):
+        if key in known or modified >= cutoff_timestamp:
+            continue
+        if dry_run or _delete_stray(storage, key, size):
+            removed += 1
+            bytes_freed += size
+
+    scratch = temp_dir()
+    for directory, _, filenames in os.walk(scratch):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            if os.path.getmtime(path) >= cutoff_timestamp:
+                continue
+            removed += 1
+            bytes_freed += os.path.getsize(path)
+            if not dry_run:
+                os.remove(path)
+
+    if not dry_run:
+        # Prune emptied shard and work directories
+        storage.prune(BLOB_ROOT, cutoff_timestamp)
+
+    logging.info(f"Blob garbage collection removed {removed} files ({bytes_freed} bytes)")
+    return {'removed': removed, 'bytes_freed': bytes_freed, 'recounted': recounted}
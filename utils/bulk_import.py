@@ -0,0 +1,335 @@
+"""
+Bulk member import for registration drives
+Streams CSV/XLSX uploads row by row, validates in chunks, hashes passwords in a
+process pool and bulk-inserts User rows, writing a per-row report as it goes.
+Members imported without a password are emailed an invitation to set one,
+queued in the outbox with their rows.
+"""
+import csv
+import hashlib
+import io
+import os
+import re
+import secrets
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app, url_for
+from sqlalchemy import insert, func
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+from extensions import db
+from models import User, Zone, LGA, Ward, RoleType, ApprovalStatus
+from utils.email_outbox import enqueue_template, outbox_worker
+
+CHUNK_SIZE = 200
+REQUIRED_COLUMNS = ('full_name', 'username', 'email')
+OPTIONAL_COLUMNS = ('phone', 'password', 'zone', 'lga', 'ward')
+REPORT_COLUMNS = ('row', 'username', 'email', 'status', 'error')
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+INVITE_TTL = timedelta(days=7)  # How long the set-password link in an invitation works
+
+
+class BulkImportError(Exception):
+    """Raised when an import file cannot be read at all"""
+
+
+def _normalize_header(value):
+    return str(value or '').strip().lower().replace(' ', '_')
+
+
+def _iter_csv(stream):
+    """Yield the header, then row dicts, from a CSV stream without reading it into memory"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.reader(text)
+        header = [_normalize_header(h) for h in next(reader, [])]
+        yield header
+        for values in reader:
+            yield dict(zip(header, values))
+    finally:
+        text.detach()
+
+
+def _iter_xlsx(stream):
+    """Yield the header, then row dicts, from the first sheet of an XLSX workbook in read-only mode"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise BulkImportError('XLSX import requires the openpyxl package. Please upload a CSV file instead.')
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [_normalize_header(h) for h in next(rows, ())]
+        yield header
+        for values in rows:
+            yield dict(zip(header, ('' if v is None else str(v) for v in values)))
+    finally:
+        workbook.close()
+
+
+def iter_import_rows(file_storage):
+    """
+    Open an uploaded CSV or XLSX file
+
+    Returns:
+        tuple: (normalized header, iterator of row dicts)
+
+    Raises:
+        BulkImportError: If the file type is unsupported or the header lacks a required column
+    """
+    filename = (file_storage.filename or '').lower()
+    if filename.endswith('.xlsx'):
+        rows = _iter_xlsx(file_storage.stream)
+    elif filename.endswith('.csv'):
+        rows = _iter_csv(file_storage.stream)
+    else:
+        raise BulkImportError('Unsupported file type. Please upload a .csv or .xlsx file.')
+
+    header = next(rows, [])
+    missing = [c for c in REQUIRED_COLUMNS if c not in header]
+    if missing:
+        rows.close()
+        raise BulkImportError(f"Import file is missing columns: {', '.join(missing)}")
+    return header, rows
+
+
+def _chunks(rows, size):
+    chunk = []
+    for number, row in enumerate(rows, start=2):  # Row 1 is the header
+        chunk.append((number, row))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class LocationResolver:
+    """Resolve zone/LGA/ward names (or IDs) from the importer's jurisdiction"""
+
+    def __init__(self, importer):
+        self.importer = importer
+        self.zones = {z.name.lower(): z.id for z in Zone.query.all()}
+        self.lgas = {}
+        self.lga_zone = {}
+        for lga in LGA.query.all():
+            self.lgas[lga.name.lower()] = lga.id
+            self.lga_zone[lga.id] = lga.zone_id
+        self.wards = {}
+        self.ward_lga = {}
+        for ward in Ward.query.all():
+            self.wards[(ward.lga_id, ward.name.lower())] = ward.id
+            self.ward_lga[ward.id] = ward.lga_id
+
+    @staticmethod
+    def _lookup(mapping, value):
+        value = (value or '').strip()
+        if not value:
+            return None
+        if value.isdigit() and int(value) in mapping.values():
+            return int(value)
+        return mapping.get(value.lower(), False)
+
+    def resolve(self, row):
+        """Return (zone_id, lga_id, ward_id) or raise ValueError"""
+        importer = self.importer
+        if not any((row.get(c) or '').strip() for c in ('zone', 'lga', 'ward')):
+            # Paper forms without a location belong to the importer's area
+            zone_id, lga_id, ward_id = importer.zone_id, importer.lga_id, importer.ward_id
+        else:
+            zone_id = self._lookup(self.zones, row.get('zone'))
+            lga_id = self._lookup(self.lgas, row.get('lga'))
+            if zone_id is False:
+                raise ValueError(f"Unknown zone '{row.get('zone')}'")
+            if lga_id is False:
+                raise ValueError(f"Unknown LGA '{row.get('lga')}'")
+
+            ward_id = None
+            ward_name = (row.get('ward') or '').strip()
+            if ward_name:
+                if ward_name.isdigit() and int(ward_name) in self.ward_lga:
+                    ward_id = int(ward_name)
+                else:
+                    ward_id = self.wards.get((lga_id or importer.lga_id, ward_name.lower()))
+                if not ward_id:
+                    raise ValueError(f"Unknown ward '{ward_name}'")
+                if lga_id and self.ward_lga[ward_id] != lga_id:
+                    raise ValueError('Ward does not belong to the selected LGA')
+                lga_id = self.ward_lga[ward_id]
+
+            if lga_id:
+                if zone_id and self.lga_zone[lga_id] != zone_id:
+                    raise ValueError('LGA does not belong to the selected zone')
+                zone_id = self.lga_zone[lga_id]
+
+        # Keep imports inside the importer's jurisdiction
+        if importer.role_type == RoleType.ZONAL_COORDINATOR and zone_id != importer.zone_id:
+            raise ValueError('Location is outside your zone')
+        if importer.role_type == RoleType.LGA_LEADER and lga_id != importer.lga_id:
+            raise ValueError('Location is outside your LGA')
+        if importer.role_type == RoleType.WARD_LEADER and ward_id != importer.ward_id:
+            raise ValueError('Location is outside your ward')
+
+        return zone_id, lga_id, ward_id
+
+
+def _report_dir():
+    path = os.path.join(current_app.instance_path, 'import_reports')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def report_path(report_id):
+    """Path of a previously written report (report IDs are hex UUIDs)"""
+    if not re.fullmatch(r'[0-9a-f]{32}', report_id or ''):
+        return None
+    path = os.path.join(_report_dir(), f"{report_id}.csv")
+    return path if os.path.exists(path) else None
+
+
+def _validate_chunk(chunk, seen_usernames, seen_emails, resolver, report):
+    """Validate a chunk of rows, adding failures to the chunk's report lines"""
+    usernames = {(row.get('username') or '').strip() for _, row in chunk}
+    emails = {(row.get('email') or '').strip().lower() for _, row in chunk}
+    existing_usernames = {u for (u,) in db.session.query(User.username).filter(User.username.in_(usernames))}
+    existing_emails = {e.lower() for (e,) in db.session.query(User.email).filter(func.lower(User.email).in_(emails))}
+
+    valid = []
+    for number, row in chunk:
+        username = (row.get('username') or '').strip()
+        email = (row.get('email') or '').strip().lower()
+        try:
+            missing = [c for c in REQUIRED_COLUMNS if not (row.get(c) or '').strip()]
+            if missing:
+                raise ValueError(f"Missing {', '.join(missing)}")
+            if not EMAIL_PATTERN.match(email):
+                raise ValueError('Invalid email address')
+            if username in existing_usernames or username in seen_usernames:
+                raise ValueError('Username already exists')
+            if email in existing_emails or email in seen_emails:
+                raise ValueError('Email already exists')
+            zone_id, lga_id, ward_id = resolver.resolve(row)
+        except ValueError as e:
+            report.append((number, username, email, 'error', str(e)))
+            continue
+
+        seen_usernames.add(username)
+        seen_emails.add(email)
+        valid.append((number, {
+            'full_name': row['full_name'].strip(),
+            'username': username,
+            'email': email,
+            'phone': (row.get('phone') or '').strip() or None,
+            'zone_id': zone_id,
+            'lga_id': lga_id,
+            'ward_id': ward_id,
+        }, (row.get('password') or '').strip() or None))
+    return valid
+
+
+def _invite_fields(password, now):
+    """
+    Columns for a member imported without a password
+
+    They get an unguessable password and a set-password token, sent to them
+    by _queue_invitations().
+
+    Returns:
+        tuple: (password, extra User columns, token or None)
+    """
+    if password:
+        return password, {'reset_token': None, 'reset_token_expires': None}, None
+    token = secrets.token_urlsafe(32)
+    return secrets.token_urlsafe(12), {
+        'reset_token': hashlib.sha256(token.encode()).hexdigest(),
+        'reset_token_expires': now + INVITE_TTL,
+    }, token
+
+
+def _queue_invitations(invites, importer):
+    """Queue invitation emails for (values, token) pairs in the current transaction"""
+    if not invites:
+        return 0
+    return enqueue_template('account_invite', [{
+        'to': values['email'],
+        'idempotency_key': f"account-invite-{values['username']}",
+        'values': {
+            'recipient_name': values['full_name'],
+            'username': values['username'],
+            'invite_link': url_for('staff.reset_password', token=token, _external=True),
+        },
+    } for values, token in invites], batch=f'account-invite-{uuid.uuid4().hex[:8]}',
+        imported_by=importer.full_name, expires_days=INVITE_TTL.days)
+
+
+def run_import(file_storage, importer):
+    """
+    Import general members from an uploaded CSV/XLSX file
+
+    Args:
+        file_storage: Uploaded FileStorage (read as a stream)
+        importer: Leader performing the import; limits locations to their jurisdiction
+
+    Returns:
+        dict: 'imported', 'failed', 'invited' (emailed a set-password link) and
+        'report_id' for the downloadable report, whose rows are in file order
+
+    Raises:
+        BulkImportError: If the file type is unsupported or the header is incomplete
+    """
+    _, rows = iter_import_rows(file_storage)
+    resolver = LocationResolver(importer)
+    report_id = uuid.uuid4().hex
+    imported = failed = invited = 0
+    seen_usernames, seen_emails = set(), set()
+
+    with open(os.path.join(_report_dir(), f"{report_id}.csv"), 'w', newline='') as report_file, \
+            ProcessPoolExecutor(max_workers=current_app.config.get('IMPORT_HASH_WORKERS')) as pool:
+        report = csv.writer(report_file)
+        report.writerow(REPORT_COLUMNS)
+
+        for chunk in _chunks(rows, CHUNK_SIZE):
+            # Chunks arrive in file order; sorting each one's lines keeps the report in row order
+            lines = []
+            valid = _validate_chunk(chunk, seen_usernames, seen_emails, resolver, lines)
+            failed += len(chunk) - len(valid)
+            if valid:
+                now = datetime.utcnow()
+                accounts = [_invite_fields(password, now) for _, _, password in valid]
+
+                # Password hashing is CPU-bound and deliberately slow; spread it across processes
+                hashes = pool.map(generate_password_hash, [password for password, _, _ in accounts],
+                                  chunksize=max(1, len(valid) // 8))
+                records = [dict(values, **token_fields, password_hash=password_hash,
+                                role_type=RoleType.GENERAL_MEMBER,
+                                approval_status=ApprovalStatus.PENDING,
+                                profile_edit_count=0,
+                                created_at=now, updated_at=now)
+                           for (_, values, _), (_, token_fields, _), password_hash in zip(valid, accounts, hashes)]
+                invites = [(values, token) for (_, values, _), (_, _, token) in zip(valid, accounts) if token]
+
+                try:
+                    db.session.execute(insert(User), records)
+                    _queue_invitations(invites, importer)
+                    db.session.commit()
+                except IntegrityError:
+                    # A concurrent registration took one of these usernames/emails
+                    db.session.rollback()
+                    failed += len(valid)
+                    for number, values, _ in valid:
+                        lines.append((number, values['username'], values['email'], 'error',
+                                      'Conflicts with a new registration; please re-import this row'))
+                else:
+                    imported += len(records)
+                    invited += len(invites)
+                    for (number, values, _), (_, _, token) in zip(valid, accounts):
+                        lines.append((number, values['username'], values['email'], 'imported',
+                                      'Invitation emailed to set a password' if token else ''))
+
+            report.writerows(sorted(lines, key=lambda line: line[0]))
+
+    if invited:
+        outbox_worker.notify()
+    return {'imported': imported, 'failed': failed, 'invited': invited, 'report_id': report_id}
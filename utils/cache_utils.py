@@ -1,27 +1,73 @@
 """
 Cache utilities for performance optimization
+Keys of cached queries include a generation number per key prefix, so
+invalidating a prefix makes only that prefix's entries unreachable on any
+cache backend.
+
+Generations and counters only reach every worker process when the cache is
+shared (CACHE_REDIS_URL). With a per-process cache and several workers,
+shared_timeout() caps how long a worker can serve a value that another one
+has changed.
 """
+import time
 from flask import current_app
 from functools import wraps
 from datetime import datetime, timedelta
+from extensions import db
 from models import *
 
 
+PROCESS_LOCAL_CACHES = ('simple', 'SimpleCache', 'null', 'NullCache')
+PROCESS_LOCAL_TIMEOUT = 30  # Seconds a worker may lag behind changes made in another
+
+
+def cache_is_shared():
+    """Whether every worker process sees the same cache (or there is only one process)"""
+    if current_app.config.get('CACHE_TYPE') not in PROCESS_LOCAL_CACHES:
+        return True
+    return current_app.config.get('WEB_CONCURRENCY', 1) <= 1
+
+
+def shared_timeout(timeout):
+    """
+    Timeout for a cached value that any worker may invalidate or update
+
+    Args:
+        timeout: Seconds to keep the value in a shared cache
+
+    Returns:
+        int: timeout, capped at PROCESS_LOCAL_TIMEOUT when each of several
+            workers has its own cache
+    """
+    return timeout if cache_is_shared() else min(timeout, PROCESS_LOCAL_TIMEOUT)
+
+
+def _prefix_generation(cache, key_prefix):
+    key = f"{key_prefix}generation"
+    generation = cache.get(key)
+    if generation is None:
+        # Seed from the clock so an evicted counter never revives stale entries
+        generation = int(time.time() * 1000)
+        cache.set(key, generation, timeout=0)
+    return generation
+
+
 def cached_query(timeout=300, key_prefix=''):
     """
     Decorator to cache database query results
     
     Args:
         timeout: Cache timeout in seconds (default 5 minutes)
-        key_prefix: Prefix for cache key
+        key_prefix: Prefix for cache key; invalidate_cache_pattern(key_prefix + '*') drops the entries
     """
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
             cache = current_app.cache
             
-            # Generate cache key from function name and arguments
-            cache_key = f"{key_prefix}{func.__name__}_{hash(str(args) + str(kwargs))}"
+            # Generate cache key from the prefix's generation, function name and arguments
+            generation = _prefix_generation(cache, key_prefix) if key_prefix else 0
+            cache_key = f"{key_prefix}{generation}_{func.__name__}_{hash(str(args) + str(kwargs))}"
             
             # Try to get from cache
             result = cache.get(cache_key)
@@ -174,28 +220,55 @@ def get_leadership_data():
     return ordered_leaders
 
 
+# Gallery items per page; the first page fills the first screen or two
+GALLERY_PAGE_SIZES = {'photo': 24, 'video': 12}
+
+
+@cached_query(timeout=600, key_prefix='media_')
+def get_media_gallery_page(file_type, cursor=None):
+    """
+    Get one keyset page of public photos or videos with caching
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    from sqlalchemy.orm import joinedload
+    from utils.pagination import keyset_page
+    # Load the uploader and image metadata up front; cached rows are detached when they are rendered
+    query = Media.query.options(joinedload(Media.uploaded_by), joinedload(Media.image_info)).filter(
+        Media.file_type == file_type, Media.public == True
+    )
+    items, next_cursor = keyset_page(query, Media.created_at, Media.id, cursor,
+                                     GALLERY_PAGE_SIZES[file_type])
+    return {'items': items, 'next_cursor': next_cursor}
+
+
 @cached_query(timeout=600, key_prefix='media_')
 def get_media_gallery_data():
-    """Get media gallery data with caching"""
-    photos = Media.query.filter_by(file_type='photo', public=True).order_by(Media.created_at.desc()).all()
-    videos = Media.query.filter_by(file_type='video', public=True).order_by(Media.created_at.desc()).all()
-    return {'photos': photos, 'videos': videos}
+    """Get the first gallery page of photos and videos, plus totals, with caching"""
+    counts = dict(db.session.query(Media.file_type, db.func.count(Media.id))
+                  .filter(Media.public == True).group_by(Media.file_type).all())
+    return {
+        'photos': get_media_gallery_page('photo'),
+        'videos': get_media_gallery_page('video'),
+        'photo_count': counts.get('photo', 0),
+        'video_count': counts.get('video', 0),
+    }
 
 
 def invalidate_cache_pattern(pattern):
     """
-    Invalidate cache entries matching a pattern
+    Invalidate the cached queries of a key prefix
+    
+    Bumps the prefix's generation, so other prefixes stay cached and the
+    stale entries expire on their own.
     
     Args:
-        pattern: Cache key pattern to invalidate (e.g., 'user_stats_*')
+        pattern: Key prefix of cached_query, optionally followed by '*' (e.g., 'media_*')
     """
     cache = current_app.cache
-    if hasattr(cache.cache, 'delete_many'):
-        # For Redis cache
-        cache.cache.delete_many(pattern)
-    else:
-        # For simple cache, clear all (less efficient but works)
-        cache.clear()
+    key_prefix = pattern.rstrip('*')
+    cache.set(f"{key_prefix}generation", _prefix_generation(cache, key_prefix) + 1, timeout=0)
 
 
 def invalidate_user_caches():
@@ -0,0 +1,197 @@
+"""
+Compliance report snapshots
+The auditor general dashboard shows approval, disciplinary, campaign and
+per-zone compliance figures. compute_compliance() works them out with a few
+grouped queries and take_snapshot() stores the result with its date, either on
+a schedule (`flask compliance-snapshot` from cron) or on demand from the
+dashboard. The dashboard renders the latest snapshot, taking a new one only
+when that is older than SNAPSHOT_MAX_AGE, and compares it with
+earlier snapshots as they were stored, so trends never recompute history.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from extensions import db
+from models import (
+    ComplianceSnapshot, User, Zone, LGA, Donation, DisciplinaryAction, Campaign, Event,
+    RoleType, ApprovalStatus
+)
+
+SNAPSHOT_MAX_AGE = timedelta(hours=6)
+ZONE_TARGET_PER_LGA = 10  # Approved members per LGA for a zone to be 100% compliant
+
+# Figures compared between snapshots: key in compliance_metrics or the snapshot itself, label, unit
+TREND_METRICS = [
+    ('member_approval_rate', 'Approval rate', '%'),
+    ('disciplinary_resolution_rate', 'Disciplinary resolution', '%'),
+    ('campaign_publication_rate', 'Campaign publication', '%'),
+    ('zones_above_target', 'Zones compliant', ''),
+    ('approved_members', 'Approved members', ''),
+    ('active_disciplinary', 'Active cases', ''),
+]
+
+# Earlier snapshots each trend compares with: None is the one just before
+TREND_PERIODS = [
+    ('previous', None),
+    ('week', timedelta(days=7)),
+    ('month', timedelta(days=30)),
+]
+
+
+def _rate(part, whole):
+    return round((part / max(whole, 1)) * 100, 2)
+
+
+def compute_compliance():
+    """
+    Work out every figure on the auditor general dashboard
+
+    Returns:
+        dict: JSON-serializable figures, keyed as the dashboard's template variables
+    """
+    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+
+    # Financial oversight
+    donations = dict(db.session.query(Donation.active, func.count(Donation.id)).group_by(Donation.active))
+    recent_donations = Donation.query.filter(Donation.created_at >= thirty_days_ago).count()
+
+    # Member audit
+    statuses = dict(db.session.query(User.approval_status, func.count(User.id)).group_by(User.approval_status))
+    approved_members = statuses.get(ApprovalStatus.APPROVED, 0)
+    total_users = sum(statuses.values())
+
+    roles = dict(db.session.query(User.role_type, func.count(User.id))
+                 .filter(User.approval_status == ApprovalStatus.APPROVED).group_by(User.role_type))
+    role_audit = {role.value: roles.get(role, 0) for role in RoleType}
+
+    # Geographic audit
+    zone_users = dict(db.session.query(User.zone_id, func.count(User.id))
+                      .filter(User.approval_status == ApprovalStatus.APPROVED).group_by(User.zone_id))
+    zone_lgas = dict(db.session.query(LGA.zone_id, func.count(LGA.id)).group_by(LGA.zone_id))
+    zone_audit = []
+    for zone in Zone.query.order_by(Zone.id):
+        users, lgas = zone_users.get(zone.id, 0), zone_lgas.get(zone.id, 0)
+        zone_audit.append({
+            'id': zone.id,
+            'name': zone.name,
+            'approved_users': users,
+            'total_lgas': lgas,
+            'compliance_rate': min(100, (users / max(lgas * ZONE_TARGET_PER_LGA, 1)) * 100)
+        })
+
+    # Disciplinary audit
+    disciplinary = dict(db.session.query(DisciplinaryAction.status, func.count(DisciplinaryAction.id))
+                        .group_by(DisciplinaryAction.status))
+    total_disciplinary = sum(disciplinary.values())
+    resolved_disciplinary = disciplinary.get('resolved', 0)
+
+    # Campaign and event audit
+    campaigns = dict(db.session.query(Campaign.published, func.count(Campaign.id)).group_by(Campaign.published))
+    total_campaigns = sum(campaigns.values())
+    published_campaigns = campaigns.get(True, 0)
+
+    return {
+        'total_donations': donations.get(True, 0),
+        'inactive_donations': donations.get(False, 0),
+        'recent_donations': recent_donations,
+        'total_users': total_users,
+        'approved_members': approved_members,
+        'pending_approvals': statuses.get(ApprovalStatus.PENDING, 0),
+        'rejected_users': statuses.get(ApprovalStatus.REJECTED, 0),
+        'role_audit': role_audit,
+        'zone_audit': zone_audit,
+        'total_disciplinary': total_disciplinary,
+        'active_disciplinary': disciplinary.get('active', 0),
+        'resolved_disciplinary': resolved_disciplinary,
+        'recent_disciplinary': DisciplinaryAction.query.filter(
+            DisciplinaryAction.created_at >= thirty_days_ago
+        ).count(),
+        'total_campaigns': total_campaigns,
+        'published_campaigns': published_campaigns,
+        'total_events': Event.query.count(),
+        'recent_events': Event.query.filter(Event.created_at >= thirty_days_ago).count(),
+        'compliance_metrics': {
+            'member_approval_rate': _rate(approved_members, total_users),
+            'disciplinary_resolution_rate': _rate(resolved_disciplinary, total_disciplinary),
+            'campaign_publication_rate': _rate(published_campaigns, total_campaigns),
+            'zones_above_target': len([z for z in zone_audit if z['compliance_rate'] >= 80])
+        },
+    }
+
+
+def take_snapshot(trigger='scheduled', user=None):
+    """
+    Compute the compliance figures and store them as a new snapshot
+
+    Args:
+        trigger: 'scheduled', 'manual' or 'stale' (see ComplianceSnapshot.trigger)
+        user: User who asked for it, for manual snapshots
+
+    Returns:
+        ComplianceSnapshot: The committed snapshot
+    """
+    snapshot = ComplianceSnapshot(
+        taken_at=datetime.utcnow(),
+        trigger=trigger,
+        taken_by_id=user.id if user else None,
+        metrics=compute_compliance()
+    )
+    db.session.add(snapshot)
+    db.session.commit()
+    return snapshot
+
+
+def latest_snapshot(max_age=None):
+    """
+    The newest snapshot, or a fresh one if there is none younger than max_age
+
+    Args:
+        max_age: timedelta; defaults to SNAPSHOT_MAX_AGE
+    """
+    snapshot = ComplianceSnapshot.query.order_by(ComplianceSnapshot.taken_at.desc()).first()
+    if snapshot is None or snapshot.taken_at < datetime.utcnow() - (max_age or SNAPSHOT_MAX_AGE):
+        snapshot = take_snapshot('stale')
+    return snapshot
+
+
+def _value(metrics, key):
+    compliance = metrics.get('compliance_metrics', {})
+    return compliance[key] if key in compliance else metrics.get(key)
+
+
+def snapshot_trends(snapshot):
+    """
+    Changes since earlier snapshots, read from those snapshots as stored
+
+    Each comparison loads one earlier snapshot through the taken_at index:
+    the one just before, and the newest one at least a week and a month older.
+
+    Returns:
+        list: Dicts with 'period', 'taken_at', 'changes' (metric key -> change)
+            and 'zones' (zone ID -> change in compliance rate), for the periods
+            that have an earlier snapshot
+    """
+    trends = []
+    for period, age in TREND_PERIODS:
+        query = ComplianceSnapshot.query
+        if age is None:
+            query = query.filter(ComplianceSnapshot.taken_at < snapshot.taken_at)
+        else:
+            query = query.filter(ComplianceSnapshot.taken_at <= snapshot.taken_at - age)
+        baseline = query.order_by(ComplianceSnapshot.taken_at.desc()).first()
+        if baseline is None:
+            continue
+
+        changes = {}
+        for key, _, _ in TREND_METRICS:
+            now, then = _value(snapshot.metrics, key), _value(baseline.metrics, key)
+            if now is not None and then is not None:
+                changes[key] = round(now - then, 2)
+        earlier_zones = {zone['id']: zone['compliance_rate'] for zone in baseline.metrics.get('zone_audit', [])}
+        trends.append({
+            'period': period,
+            'taken_at': baseline.taken_at,
+            'changes': changes,
+            'zones': {zone['id']: round(zone['compliance_rate'] - earlier_zones[zone['id']], 1)
+                      for zone in snapshot.metrics.get('zone_audit', []) if zone['id'] in earlier_zones},
+        })
+    return trends
@@ -0,0 +1,313 @@
+"""
+Dashboard widgets
+A staff dashboard page is a shell: the header, profile and tools render
+without touching the statistics, and each panel is a widget that the browser
+fetches from staff.dashboard_widget once the shell is shown. The requests run
+in parallel, so the slowest panel only delays itself.
+
+Each widget has a loader for its template context, a TTL for its rendered
+HTML and the roles allowed to fetch it. Widgets whose contents depend on the
+viewer's zone or LGA are cached per zone or LGA. A live widget also keeps the
+event bus position its counts are current to, so the dashboard stream can
+resume from there (see utils.event_bus).
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+from flask import current_app, render_template, url_for
+from sqlalchemy import func
+from extensions import db
+from models import User, Zone, LGA, Ward, Event, Campaign, DutyLog, RoleType, ApprovalStatus
+from utils.cache_utils import (
+    get_user_statistics, get_campaign_statistics, get_event_statistics,
+    get_role_statistics, get_zone_statistics
+)
+from utils.event_bus import get_event_bus
+from utils.activity_feed import activity_feed
+from utils.time_series import series
+
+Widget = namedtuple('Widget', 'name loader template ttl roles scope live')
+
+WIDGETS = {}
+
+# Widgets of each dashboard; the page renders a placeholder for each one the viewer may load
+DASHBOARDS = {
+    'admin': ['admin_summary', 'zones_overview', 'monthly_growth', 'recent_activities', 'pending_approvals'],
+    'executive': ['executive_summary', 'leadership_distribution', 'role_distribution', 'state_activities',
+                  'geographic_overview', 'critical_approvals'],
+    'zonal': ['zone_summary', 'lga_performance', 'zone_activity', 'zone_staff'],
+    'lga': ['lga_summary', 'ward_performance', 'lga_activity', 'lga_staff'],
+}
+
+STATE_ROLES = (RoleType.ADMIN, RoleType.EXECUTIVE)
+
+
+def widget(name, ttl, roles, scope=None, live=False):
+    """
+    Register a widget rendered from staff/widgets/<name>.html
+
+    Args:
+        name: Widget name, used in its URL and in DASHBOARDS
+        ttl: Seconds its rendered HTML is cached
+        roles: RoleTypes allowed to load it
+        scope: 'zone' or 'lga' if its contents depend on the viewer's location;
+            the loader is then called with the viewer's zone or LGA ID
+        live: Its counts are kept up to date by the dashboard stream
+    """
+    def decorator(loader):
+        WIDGETS[name] = Widget(name, loader, f'staff/widgets/{name}.html', ttl, tuple(roles), scope, live)
+        return loader
+    return decorator
+
+
+def can_load(widget, user):
+    return user.role_type in widget.roles
+
+
+def dashboard_widgets(dashboard, user):
+    """URLs of a dashboard's widgets that the user may load, by name"""
+    return {name: url_for('staff.dashboard_widget', name=name)
+            for name in DASHBOARDS[dashboard] if can_load(WIDGETS[name], user)}
+
+
+def load_widget(widget, user):
+    """
+    A widget's HTML for the user's scope, from the cache or its loader
+
+    Returns:
+        tuple: (html, event bus cursor the contents are current to, or None if not live)
+    """
+    cache = current_app.cache
+    scope_id = getattr(user, f'{widget.scope}_id') if widget.scope else None
+    cache_key = f'widget_{widget.name}_{scope_id}'
+
+    cached = cache.get(cache_key)
+    # A live widget is only reusable while the stream still holds the events since it was rendered
+    if cached is not None and (not widget.live or get_event_bus().resumable(cached[1])):
+        return cached
+
+    cursor = get_event_bus().last_id() if widget.live else None
+    context = widget.loader(scope_id) if widget.scope else widget.loader()
+    result = (render_template(widget.template, **context), cursor)
+    cache.set(cache_key, result, timeout=widget.ttl)
+    return result
+
+
+# State dashboards
+
+@widget('admin_summary', ttl=600, roles=[RoleType.ADMIN])
+def admin_summary():
+    user_stats = get_user_statistics()
+    return {
+        'total_members': user_stats['total_members'],
+        'pending_approvals': user_stats['pending_approvals'],
+        'new_members_this_month': user_stats['new_members_this_month'],
+        'active_campaigns': get_campaign_statistics()['active_campaigns'],
+        'upcoming_events': get_event_statistics()['upcoming_events'],
+    }
+
+
+@widget('executive_summary', ttl=300, roles=[RoleType.EXECUTIVE], live=True)
+def executive_summary():
+    # Counted directly: the stream applies changes made after these counts were taken
+    try:
+        active_campaigns = Campaign.query.filter_by(published=True).count()
+    except:
+        active_campaigns = 0
+    try:
+        total_duties = DutyLog.query.count()
+        pending_duties = DutyLog.query.filter_by(completion_status='pending').count()
+    except:
+        total_duties = 0
+        pending_duties = 0
+    return {
+        'total_users': User.query.count(),
+        'pending_approvals': User.query.filter_by(approval_status=ApprovalStatus.PENDING).count(),
+        'active_campaigns': active_campaigns,
+        'total_duties': total_duties,
+        'pending_duties': pending_duties,
+    }
+
+
+@widget('zones_overview', ttl=1800, roles=[RoleType.ADMIN])
+@widget('geographic_overview', ttl=1800, roles=[RoleType.EXECUTIVE])
+def zone_overview():
+    return {'zones': get_zone_statistics()}
+
+
+@widget('monthly_growth', ttl=600, roles=[RoleType.ADMIN])
+def monthly_growth():
+    monthly_data = series('registrations', 'month', 6)
+    return {'monthly_data': monthly_data, 'peak': max(month['count'] for month in monthly_data)}
+
+
+@widget('recent_activities', ttl=120, roles=[RoleType.ADMIN])
+@widget('state_activities', ttl=120, roles=[RoleType.EXECUTIVE])
+def recent_activities():
+    return feed_page('state')
+
+
+def feed_page(scope):
+    """Template context for the first page of an activity feed"""
+    entries, next_cursor = activity_feed(scope)
+    return {
+        'entries': entries,
+        'next_url': url_for('staff.activity_feed_page', scope=scope, cursor=next_cursor) if next_cursor else None,
+    }
+
+
+@widget('pending_approvals', ttl=60, roles=[RoleType.ADMIN])
+@widget('critical_approvals', ttl=60, roles=[RoleType.EXECUTIVE])
+def pending_approvals():
+    return {
+        'pending_users': User.query.filter_by(approval_status=ApprovalStatus.PENDING)
+                                   .order_by(User.created_at.desc()).limit(10).all(),
+        'pending_approvals': User.query.filter_by(approval_status=ApprovalStatus.PENDING).count(),
+    }
+
+
+@widget('leadership_distribution', ttl=1800, roles=STATE_ROLES)
+def leadership_distribution():
+    # Leaders per zone and role in one grouped query
+    leader_roles = (RoleType.ZONAL_COORDINATOR, RoleType.LGA_LEADER, RoleType.WARD_LEADER)
+    counts = {(zone_id, role): count for zone_id, role, count in db.session.query(
+        User.zone_id, User.role_type, func.count(User.id)
+    ).filter(
+        User.role_type.in_(leader_roles), User.approval_status == ApprovalStatus.APPROVED
+    ).group_by(User.zone_id, User.role_type)}
+
+    leadership_distribution = []
+    for zone in Zone.query.all():
+        coordinators, lga_leaders, ward_leaders = (counts.get((zone.id, role), 0) for role in leader_roles)
+        leadership_distribution.append({
+            'zone_name': zone.name,
+            'coordinators': coordinators,
+            'lga_leaders': lga_leaders,
+            'ward_leaders': ward_leaders,
+            'total_leaders': coordinators + lga_leaders + ward_leaders
+        })
+    return {'leadership_distribution': leadership_distribution}
+
+
+@widget('role_distribution', ttl=1800, roles=STATE_ROLES)
+def role_distribution():
+    role_stats = {role: count for role, count in get_role_statistics().items()
+                  if role != RoleType.GENERAL_MEMBER.value}
+    return {'role_stats': role_stats, 'total_users': get_user_statistics()['total_users']}
+
+
+# Zonal and LGA dashboards
+
+@widget('zone_summary', ttl=300, roles=[RoleType.ZONAL_COORDINATOR], scope='zone')
+def zone_summary(zone_id):
+    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+    return {
+        'total_lgas': LGA.query.filter_by(zone_id=zone_id).count(),
+        'total_members': User.query.filter_by(zone_id=zone_id, approval_status=ApprovalStatus.APPROVED).count(),
+        'pending_lga_approvals': User.query.filter_by(
+            zone_id=zone_id,
+            approval_status=ApprovalStatus.PENDING,
+            role_type=RoleType.LGA_LEADER
+        ).count(),
+        'new_members_this_month': User.query.filter(
+            User.zone_id == zone_id,
+            User.created_at >= thirty_days_ago,
+            User.approval_status == ApprovalStatus.APPROVED
+        ).count(),
+    }
+
+
+@widget('lga_performance', ttl=1800, roles=[RoleType.ZONAL_COORDINATOR], scope='zone')
+def lga_performance(zone_id):
+    # Approved members per LGA in one grouped query
+    zone_lgas = LGA.query.filter_by(zone_id=zone_id).all()
+    counts = dict(db.session.query(User.lga_id, func.count(User.id)).filter(
+        User.lga_id.in_([lga.id for lga in zone_lgas]), User.approval_status == ApprovalStatus.APPROVED
+    ).group_by(User.lga_id))
+    lga_performance = []
+    for lga in zone_lgas:
+        lga_users = counts.get(lga.id, 0)
+        lga_performance.append({
+            'id': lga.id,
+            'name': lga.name,
+            'users': lga_users,
+            'performance': min(100, (lga_users / 50) * 100) if lga_users else 0  # Performance based on target of 50 members per LGA
+        })
+    return {'lga_performance': lga_performance, 'zone': Zone.query.get(zone_id)}
+
+
+@widget('zone_activity', ttl=120, roles=[RoleType.ZONAL_COORDINATOR], scope='zone')
+def zone_activity(zone_id):
+    return feed_page(f'zone:{zone_id}')
+
+
+@widget('zone_staff', ttl=300, roles=[RoleType.ZONAL_COORDINATOR], scope='zone')
+def zone_staff(zone_id):
+    members = User.query.filter_by(zone_id=zone_id, approval_status=ApprovalStatus.APPROVED)
+    try:
+        zone_events = Event.query.filter_by(zone_id=zone_id).count()
+    except:
+        zone_events = 0
+    return {
+        'zone_users': members.limit(10).all(),
+        'total_members': members.count(),
+        'zone_events': zone_events,
+        'zone': Zone.query.get(zone_id),
+    }
+
+
+@widget('lga_summary', ttl=300, roles=[RoleType.LGA_LEADER], scope='lga')
+def lga_summary(lga_id):
+    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+    return {
+        'total_wards': Ward.query.filter_by(lga_id=lga_id).count(),
+        'total_members': User.query.filter_by(lga_id=lga_id, approval_status=ApprovalStatus.APPROVED).count(),
+        'pending_ward_approvals': User.query.filter_by(
+            lga_id=lga_id,
+            approval_status=ApprovalStatus.PENDING,
+            role_type=RoleType.WARD_LEADER
+        ).count(),
+        'new_members_this_month': User.query.filter(
+            User.lga_id == lga_id,
+            User.created_at >= thirty_days_ago,
+            User.approval_status == ApprovalStatus.APPROVED
+        ).count(),
+    }
+
+
+@widget('ward_performance', ttl=1800, roles=[RoleType.LGA_LEADER], scope='lga')
+def ward_performance(lga_id):
+    # Approved members per ward in one grouped query
+    lga_wards = Ward.query.filter_by(lga_id=lga_id).all()
+    counts = dict(db.session.query(User.ward_id, func.count(User.id)).filter(
+        User.ward_id.in_([ward.id for ward in lga_wards]), User.approval_status == ApprovalStatus.APPROVED
+    ).group_by(User.ward_id))
+    ward_performance = []
+    for ward in lga_wards:
+        ward_users = counts.get(ward.id, 0)
+        ward_performance.append({
+            'id': ward.id,
+            'name': ward.name,
+            'users': ward_users,
+            'performance': min(100, (ward_users / 20) * 100) if ward_users else 0  # Performance based on target of 20 members per ward
+        })
+    return {'ward_performance': ward_performance, 'lga': LGA.query.get(lga_id)}
+
+
+@widget('lga_activity', ttl=120, roles=[RoleType.LGA_LEADER], scope='lga')
+def lga_activity(lga_id):
+    return feed_page(f'lga:{lga_id}')
+
+
+@widget('lga_staff', ttl=300, roles=[RoleType.LGA_LEADER], scope='lga')
+def lga_staff(lga_id):
+    members = User.query.filter_by(lga_id=lga_id, approval_status=ApprovalStatus.APPROVED)
+    try:
+        lga_events = Event.query.filter_by(lga_id=lga_id).count()
+    except:
+        lga_events = 0
+    return {
+        'lga_users': members.limit(8).all(),
+        'total_members': members.count(),
+        'lga_events': lga_events,
+        'lga': LGA.query.get(lga_id),
+    }
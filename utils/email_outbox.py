@@ -0,0 +1,370 @@
+"""
+Transactional email outbox
+Messages are written to email_outbox in the same transaction as the change
+that triggers them, so a committed password reset always gets its email and a
+rolled-back one never does, and the request returns without waiting on the
+mail API. A background thread sends due messages over the pooled
+EmailService session, retries failures with exponential backoff and moves
+messages that keep failing to the dead state. Every attempt carries the
+message's idempotency key, so a retry after a lost response is delivered once.
+Notification fan-outs enqueue many messages under one batch ID; the worker
+sends them a few at a time in parallel and batch_progress() reports how far
+a batch has got. enqueue_template() stores only the template name and its
+variables, so a fan-out to thousands of members adds small rows to the
+request's transaction and the worker renders each claimed batch once with
+render_batch() just before sending it.
+
+Each web process starts the worker when the app is created, so messages left
+pending or backing off by a restart are picked up without waiting for a new
+one (set EMAIL_OUTBOX_WORKER=0 to leave that to another process). Where no
+web process runs all the time, e.g. a deployment that scales to zero,
+schedule `flask drain-email-outbox` every minute or so from cron.
+"""
+import logging
+import random
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from flask import current_app, request, has_request_context
+from sqlalchemy import insert
+from extensions import db
+from models import EmailOutbox
+from utils.email_service import email_service, EmailDeliveryError
+from utils.email_templates import render_batch
+
+BATCH_SIZE = 50  # Claimed together; all must be sent within SEND_LEASE
+SEND_CONCURRENCY = 8  # Parallel sends; keep within the EmailService connection pool
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 30  # Seconds before the first retry; doubles per attempt
+BACKOFF_MAX = 3600
+SEND_LEASE = timedelta(minutes=5)  # A claimed message is retried if its sender died
+POLL_INTERVAL = 30  # Seconds between checks for retries that have come due
+
+
+def enqueue_email(to, subject, html=None, text=None, cc=None, idempotency_key=None):
+    """
+    Add a message to the outbox in the current transaction
+
+    The caller commits along with the change the email belongs to, then calls
+    outbox_worker.notify() so it is sent right away.
+
+    Args:
+        to: Recipient email address
+        subject: Email subject
+        html: HTML body (optional)
+        text: Plain text body (optional)
+        cc: CC recipients (optional)
+        idempotency_key: Identifies the message to the mail API across retries (default: random)
+
+    Returns:
+        EmailOutbox: The pending message
+    """
+    message = EmailOutbox(
+        idempotency_key=idempotency_key or uuid.uuid4().hex,
+        to=to, cc=cc, subject=subject, html=html, text=text,
+        status='pending', attempts=0, next_attempt_at=datetime.utcnow(),
+    )
+    db.session.add(message)
+    return message
+
+
+def enqueue_many(messages, batch=None):
+    """
+    Add many messages to the outbox in the current transaction with one INSERT
+
+    Args:
+        messages: Dicts with to, subject, html, text and optionally cc and idempotency_key
+        batch: ID that groups the messages for batch_progress() (optional)
+
+    Returns:
+        int: Number of messages queued
+    """
+    now = datetime.utcnow()
+    rows = [{
+        'idempotency_key': message.get('idempotency_key') or uuid.uuid4().hex,
+        'batch': batch,
+        'to': message['to'],
+        'cc': message.get('cc'),
+        'subject': message['subject'],
+        'html': message.get('html'),
+        'text': message.get('text'),
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': now,
+        'created_at': now,
+    } for message in messages]
+    if rows:
+        db.session.execute(insert(EmailOutbox), rows)
+    return len(rows)
+
+
+def _to_json(value):
+    """Template variables as JSON; datetimes are tagged so they come back as datetimes"""
+    if isinstance(value, dict):
+        return {key: _to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, date):
+        return {'__date__': value.isoformat()}
+    return value
+
+
+def _from_json(value):
+    if isinstance(value, dict):
+        if '__datetime__' in value:
+            return datetime.fromisoformat(value['__datetime__'])
+        if '__date__' in value:
+            return date.fromisoformat(value['__date__'])
+        return {key: _from_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_from_json(item) for item in value]
+    return value
+
+
+def enqueue_template(name, recipients, batch=None, **context):
+    """
+    Add a templated message per recipient to the outbox with one INSERT
+
+    Nothing is rendered here: the worker renders the template with
+    render_batch() when it claims the messages. Links built with
+    url_for(_external=True) point at the host of the current request.
+
+    Args:
+        name: Key of utils.email_templates.EMAIL_TEMPLATES
+        recipients: Dicts with 'to', 'idempotency_key' and 'values', the
+            per-recipient template variables (same keys for every recipient)
+        batch: ID that groups the messages for batch_progress() and rendering (optional)
+        **context: Template variables shared by every recipient; plain values,
+            dicts, lists and datetimes only (pass model fields, not models)
+
+    Returns:
+        int: Number of messages queued
+    """
+    context = _to_json(context)
+    if has_request_context():
+        context['_base_url'] = request.url_root
+    now = datetime.utcnow()
+    rows = [{
+        'idempotency_key': recipient.get('idempotency_key') or uuid.uuid4().hex,
+        'batch': batch,
+        'to': recipient['to'],
+        'subject': '',  # Rendered by the worker
+        'template': name,
+        'context': context,
+        'recipient': _to_json(recipient['values']),
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': now,
+        'created_at': now,
+    } for recipient in recipients]
+    if rows:
+        db.session.execute(insert(EmailOutbox), rows)
+    return len(rows)
+
+
+def batch_progress(batch):
+    """Message counts of a batch by status, plus 'total'"""
+    counts = dict(db.session.query(EmailOutbox.status, db.func.count(EmailOutbox.id))
+                  .filter(EmailOutbox.batch == batch).group_by(EmailOutbox.status))
+    progress = {status: counts.get(status, 0) for status in ('pending', 'sending', 'sent', 'dead')}
+    progress['total'] = sum(counts.values())
+    return progress
+
+
+def backoff_delay(attempts):
+    """Delay before the next attempt, with jitter so failed batches do not retry in lockstep"""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** max(0, attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def _due(now):
+    return db.and_(EmailOutbox.status.in_(('pending', 'sending')), EmailOutbox.next_attempt_at <= now)
+
+
+def _claim(limit):
+    """Claim due messages for this sender; returns them"""
+    now = datetime.utcnow()
+    lease = now + SEND_LEASE
+    candidates = [message_id for (message_id,) in db.session.query(EmailOutbox.id)
+                  .filter(_due(now)).order_by(EmailOutbox.next_attempt_at).limit(limit)]
+    if not candidates:
+        return []
+    # Conditional update, so only one thread or process wins each message; the
+    # lease timestamp tells this sender's claims apart from a concurrent one's
+    EmailOutbox.query.filter(EmailOutbox.id.in_(candidates), _due(now)).update(
+        {EmailOutbox.status: 'sending', EmailOutbox.next_attempt_at: lease},
+        synchronize_session=False
+    )
+    db.session.commit()
+    return EmailOutbox.query.filter(EmailOutbox.id.in_(candidates), EmailOutbox.status == 'sending',
+                                    EmailOutbox.next_attempt_at == lease).all()
+
+
+def _render(app, messages):
+    """
+    Render the templated messages among claimed ones that have no body yet
+
+    Messages of one batch share their context, so each batch is rendered once.
+
+    Returns:
+        dict: Message ID -> error, for messages whose template failed to render
+    """
+    groups = {}
+    for message in messages:
+        if message.template and message.html is None and message.text is None:
+            groups.setdefault((message.template, message.batch or message.id), []).append(message)
+
+    errors = {}
+    for (template, _), group in groups.items():
+        context = _from_json(group[0].context or {})
+        base_url = context.pop('_base_url', None)
+        try:
+            # A request context of the enqueuing host, for url_for(_external=True)
+            with app.test_request_context(base_url=base_url):
+                rendered = render_batch(template, [_from_json(m.recipient) for m in group], **context)
+        except Exception as e:
+            logging.error(f"Rendering {template} email for {len(group)} messages failed: {e}")
+            error = EmailDeliveryError(f"Rendering {template} failed: {e}", permanent=True)
+            errors.update((message.id, error) for message in group)
+            continue
+        for message, (subject, html, text) in zip(group, rendered):
+            message.subject, message.html, message.text = subject, html, text
+    return errors
+
+
+def _send(app, message):
+    """Send one message (in a sender thread); returns the exception or None"""
+    with app.app_context():
+        try:
+            email_service.send_email(
+                to=message['to'],
+                subject=message['subject'],
+                text=message['text'],
+                html=message['html'],
+                cc=message['cc'],
+                idempotency_key=message['idempotency_key']
+            )
+        except Exception as e:
+            return e
+    return None
+
+
+def _record(message, error):
+    """Record the outcome of a send attempt; returns True if it was sent"""
+    message.attempts += 1
+    if error is not None:
+        message.last_error = str(error)[:500]
+        if getattr(error, 'permanent', False) or message.attempts >= MAX_ATTEMPTS:
+            message.status = 'dead'
+            message.next_attempt_at = None
+            logging.error(f"Email {message.id} to {message.to} moved to dead letters after "
+                          f"{message.attempts} attempts: {error}")
+        else:
+            message.status = 'pending'
+            message.next_attempt_at = datetime.utcnow() + backoff_delay(message.attempts)
+        return False
+
+    message.status = 'sent'
+    message.sent_at = datetime.utcnow()
+    message.next_attempt_at = None
+    message.last_error = None
+    return True
+
+
+def drain(limit=None):
+    """
+    Send every message that is due now
+
+    Each claimed batch is sent SEND_CONCURRENCY (or EMAIL_SEND_CONCURRENCY)
+    messages at a time and its outcomes are committed together.
+
+    Args:
+        limit: Stop after this many messages (default: until none are due)
+
+    Returns:
+        dict: 'sent' and 'failed' counts
+    """
+    app = current_app._get_current_object()
+    sent = failed = 0
+    with ThreadPoolExecutor(max_workers=app.config.get('EMAIL_SEND_CONCURRENCY', SEND_CONCURRENCY)) as executor:
+        while limit is None or sent + failed < limit:
+            batch = _claim(BATCH_SIZE if limit is None else min(BATCH_SIZE, limit - sent - failed))
+            if not batch:
+                break
+            render_errors = _render(app, batch)
+            for message in batch:
+                if message.id in render_errors:
+                    _record(message, render_errors[message.id])
+                    failed += 1
+            batch = [message for message in batch if message.id not in render_errors]
+            # Sender threads get plain values, not session-bound rows
+            payloads = [{'to': m.to, 'subject': m.subject, 'text': m.text, 'html': m.html,
+                         'cc': m.cc, 'idempotency_key': m.idempotency_key} for m in batch]
+            errors = executor.map(lambda payload: _send(app, payload), payloads)
+            for message, error in zip(batch, errors):
+                if _record(message, error):
+                    sent += 1
+                else:
+                    failed += 1
+            db.session.commit()
+    return {'sent': sent, 'failed': failed}
+
+
+def requeue_dead():
+    """Give dead messages a fresh set of attempts; returns how many were requeued"""
+    requeued = EmailOutbox.query.filter_by(status='dead').update(
+        {EmailOutbox.status: 'pending', EmailOutbox.attempts: 0,
+         EmailOutbox.next_attempt_at: datetime.utcnow()},
+        synchronize_session=False
+    )
+    db.session.commit()
+    return requeued
+
+
+class OutboxWorker:
+    """Background thread that drains the outbox; started with the app, restarted by notify() if it died"""
+
+    def __init__(self):
+        self._thread = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self, app):
+        """Start draining the outbox in this process, if the thread is not already running"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, args=(app,), name='email-outbox', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the worker once its current drain finishes"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def notify(self):
+        """Wake the worker after committing new messages"""
+        self.start(current_app._get_current_object())
+        self._wake.set()
+
+    def _run(self, app):
+        interval = app.config.get('EMAIL_OUTBOX_POLL_INTERVAL', POLL_INTERVAL)
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                with app.app_context():
+                    drain()
+            except Exception as e:
+                logging.error(f"Email outbox worker error: {e}")
+            # Woken early by notify(); otherwise look for retries that have come due
+            self._wake.wait(interval)
+
+
+# Create global instance
+outbox_worker = OutboxWorker()
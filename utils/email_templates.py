@@ -0,0 +1,210 @@
+"""
+Email template registry
+Emails are Jinja templates under templates/emails/. When a template is first
+loaded, the rules of templates/emails/email.css are written into the style
+attributes of its tags (mail clients drop <style> blocks), and the result is
+compiled once and kept for the life of the process. The plain-text part comes
+from a .txt template when there is one, otherwise it is derived from the HTML
+and memoized. render_batch() renders a template once for many recipients and
+only substitutes the per-recipient values into the output.
+"""
+import os
+import re
+import html as html_lib
+from functools import lru_cache
+from flask import current_app
+from jinja2 import FileSystemLoader, TemplateNotFound
+from markupsafe import escape
+
+STYLESHEET = 'emails/email.css'
+
+# Subject templates of the registered emails; bodies are emails/<name>.html
+EMAIL_TEMPLATES = {
+    'password_reset': 'KPN - Password Reset Request',
+    'duty_assigned': 'KPN - New Duty Assigned',
+    'account_approved': 'KPN - Your Account Has Been Approved',
+    'account_invite': 'KPN - Set Up Your Membership Account',
+    'event_created': 'KPN - New Event: {{ event.title }}',
+}
+
+TAG_PATTERN = re.compile(r'<([a-zA-Z][a-zA-Z0-9]*)(\s[^<>]*?)?(/?)>')
+CLASS_PATTERN = re.compile(r'\sclass="([^"]*)"')
+STYLE_PATTERN = re.compile(r'\sstyle="([^"]*)"')
+
+
+def parse_stylesheet(css):
+    """
+    Rules of a simple stylesheet
+
+    Only tag, .class and tag.class selectors are supported, which is all an
+    email stylesheet should need.
+
+    Returns:
+        list: (tag or None, class or None, declarations) in stylesheet order
+    """
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    rules = []
+    for selectors, declarations in re.findall(r'([^{}]+)\{([^{}]*)\}', css):
+        declarations = '; '.join(d.strip() for d in declarations.split(';') if d.strip())
+        for selector in selectors.split(','):
+            tag, _, class_name = selector.strip().partition('.')
+            rules.append((tag.lower() or None, class_name or None, declarations))
+    return rules
+
+
+def inline_css(source, rules):
+    """Write matching stylesheet rules into the style attribute of each tag"""
+    def apply(match):
+        tag, attrs, closing = match.group(1).lower(), match.group(2) or '', match.group(3)
+        class_match = CLASS_PATTERN.search(attrs)
+        classes = class_match.group(1).split() if class_match else []
+        # Tag rules, then class rules, then the tag's own style, so later ones win
+        declarations = [d for rule_tag, rule_class, d in rules
+                        if rule_class is None and rule_tag == tag]
+        declarations += [d for rule_tag, rule_class, d in rules
+                         if rule_class in classes and rule_tag in (None, tag)]
+        if not declarations:
+            return match.group(0)
+        style_match = STYLE_PATTERN.search(attrs)
+        if style_match:
+            declarations.append(style_match.group(1).strip().rstrip(';'))
+            attrs = attrs[:style_match.start()] + attrs[style_match.end():]
+        attrs = CLASS_PATTERN.sub('', attrs)
+        return f'<{match.group(1)}{attrs} style="{"; ".join(declarations)};"{closing}>'
+    return TAG_PATTERN.sub(apply, source)
+
+
+class InlineCSSLoader(FileSystemLoader):
+    """Template loader that inlines the email stylesheet into HTML templates"""
+
+    def __init__(self, searchpath):
+        super().__init__(searchpath)
+        with open(os.path.join(searchpath, STYLESHEET)) as stylesheet:
+            self.rules = parse_stylesheet(stylesheet.read())
+
+    def get_source(self, environment, template):
+        source, filename, uptodate = super().get_source(environment, template)
+        if template.endswith('.html'):
+            source = inline_css(source, self.rules)
+        return source, filename, uptodate
+
+
+@lru_cache(maxsize=256)
+def html_to_text(html):
+    """Plain-text rendition of an HTML email"""
+    text = re.sub(r'(?is)<(head|style|script)\b.*?</\1>', '', html)
+
+    def link(match):
+        url, label = html_lib.unescape(match.group(1)), re.sub(r'<[^>]+>', '', match.group(2)).strip()
+        return label if not label or url in label else f'{label}: {url}'
+    text = re.sub(r'(?is)<a\b[^>]*?href="([^"]*)"[^>]*>(.*?)</a>', link, text)
+    text = re.sub(r'(?i)<br\s*/?>', '\n', text)
+    text = re.sub(r'(?i)<li\b[^>]*>', '\n- ', text)
+    text = re.sub(r'(?i)</(p|div|h[1-6]|ul|ol|table|tr)>', '\n\n', text)
+    text = html_lib.unescape(re.sub(r'<[^>]+>', '', text))
+
+    lines = []
+    for line in (' '.join(line.split()) for line in text.splitlines()):
+        if line.startswith('- ') and len(lines) > 1 and not lines[-1] and lines[-2].startswith('- '):
+            lines.pop()  # Keep list items together
+        if line or (lines and lines[-1]):
+            lines.append(line)
+    return '\n'.join(lines).strip() + '\n'
+
+
+class EmailTemplate:
+    """A compiled email: subject, inlined HTML body and optional text body"""
+
+    def __init__(self, environment, name, subject):
+        self.name = name
+        # Subjects are plain text; Flask autoescapes templates without a file name
+        self.subject = environment.from_string(f'{{% autoescape false %}}{subject}{{% endautoescape %}}')
+        self.html = environment.get_template(f'emails/{name}.html')
+        try:
+            self.text = environment.get_template(f'emails/{name}.txt')
+        except TemplateNotFound:
+            self.text = None
+
+    def render(self, **context):
+        """Render for one recipient; returns (subject, html, text)"""
+        html = self.html.render(**context)
+        text = self.text.render(**context) if self.text else html_to_text(html)
+        return self.subject.render(**context).strip(), html, text
+
+
+class EmailTemplateRegistry:
+    """Email templates of an app, compiled on first use"""
+
+    def __init__(self, app):
+        template_folder = os.path.join(app.root_path, app.template_folder)
+        # Shares the app's globals and filters (url_for, ...) but has its own loader and cache
+        self.environment = app.jinja_env.overlay(loader=InlineCSSLoader(template_folder))
+        self._templates = {}
+
+    def get(self, name):
+        template = self._templates.get(name)
+        if template is None:
+            template = self._templates[name] = EmailTemplate(self.environment, name, EMAIL_TEMPLATES[name])
+        return template
+
+
+def get_registry(app=None):
+    """The app's email template registry, created on first use"""
+    app = app or current_app._get_current_object()
+    registry = app.extensions.get('email_templates')
+    if registry is None:
+        registry = app.extensions['email_templates'] = EmailTemplateRegistry(app)
+    return registry
+
+
+def render_email(name, **context):
+    """
+    Render a registered email
+
+    Args:
+        name: Key of EMAIL_TEMPLATES
+        **context: Template variables
+
+    Returns:
+        tuple: (subject, html, text)
+    """
+    return get_registry().get(name).render(**context)
+
+
+def render_batch(name, recipients, **context):
+    """
+    Render a registered email for many recipients
+
+    The template is rendered once with a marker in place of every
+    per-recipient value, and the values are substituted into the output
+    (escaped in the HTML). Per-recipient values can therefore only be printed,
+    not used in template logic or filters.
+
+    Args:
+        name: Key of EMAIL_TEMPLATES
+        recipients: Dicts of per-recipient values, all with the same keys
+        **context: Template variables shared by every recipient
+
+    Returns:
+        list: (subject, html, text) per recipient, in order
+    """
+    if not recipients:
+        return []
+    keys = list(recipients[0])
+    markers = {key: f'%%{key}%%' for key in keys}
+    subject, html, text = get_registry().get(name).render(**context, **markers)
+
+    pattern = re.compile('|'.join(re.escape(marker) for marker in markers.values()))
+    marker_keys = {marker: key for key, marker in markers.items()}
+
+    def substitute(rendered, values):
+        if not pattern.search(rendered):
+            return rendered
+        return pattern.sub(lambda m: values[marker_keys[m.group(0)]], rendered)
+
+    messages = []
+    for recipient in recipients:
+        raw = {key: str(recipient[key]) for key in keys}
+        escaped = {key: str(escape(value)) for key, value in raw.items()}
+        messages.append((substitute(subject, raw), substitute(html, escaped), substitute(text, raw)))
+    return messages
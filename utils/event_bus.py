@@ -0,0 +1,192 @@
+"""
+Live dashboard events
+Changes that move dashboard counts (registrations, approvals, duties) are
+published as small deltas such as {'pending_approvals': 1} and streamed to
+open dashboards as Server-Sent Events. The bus keeps the most recent events,
+so a reconnecting client resumes from its Last-Event-ID; a client that has
+fallen further behind is told to resync.
+
+Events are shared between worker processes through a Redis stream when
+EVENT_BUS_REDIS_URL is set; otherwise they stay within the process, which
+only suits a single worker such as a development server. Production
+deployments running several workers should set EVENT_BUS_REDIS_URL;
+gunicorn.conf.py warns when they do not. Waiting is done with threading
+primitives or blocking socket reads, so under the default threaded workers a
+stream holds a thread until it ends, and under the opt-in gevent workers, whose
+monkey-patching makes both cooperative, it costs a greenlet.
+"""
+import json
+import time
+import logging
+import threading
+from collections import deque, namedtuple
+from flask import current_app
+
+BUFFER_SIZE = 500  # Events kept for reconnecting clients
+HEARTBEAT_INTERVAL = 15  # Seconds; keeps proxies from closing idle streams
+RECONNECT_DELAY = 3000  # Milliseconds the browser waits before reconnecting
+SYNC_WORKER_STREAM_SECONDS = 25  # Stay under gunicorn's sync worker timeout
+REDIS_STREAM = 'kpn:dashboard_events'
+
+BusEvent = namedtuple('BusEvent', 'id name data')
+
+
+class MemoryEventBus:
+    """Events held in this process; IDs are consecutive integers"""
+
+    def __init__(self, size=BUFFER_SIZE):
+        self._events = deque(maxlen=size)
+        self._next_id = 1
+        self._condition = threading.Condition()
+
+    def publish(self, name, data):
+        with self._condition:
+            self._events.append(BusEvent(str(self._next_id), name, data))
+            self._next_id += 1
+            self._condition.notify_all()
+
+    def last_id(self):
+        with self._condition:
+            return str(self._next_id - 1)
+
+    def _after(self, last_id):
+        # None when events were dropped from the buffer or the ID predates a restart
+        if last_id > self._next_id - 1:
+            return None
+        if self._events and last_id < int(self._events[0].id) - 1:
+            return None
+        return [event for event in self._events if int(event.id) > last_id]
+
+    def resumable(self, last_id):
+        """Whether the events after last_id are all still kept"""
+        try:
+            last_id = int(last_id)
+        except ValueError:
+            return False
+        with self._condition:
+            return self._after(last_id) is not None
+
+    def listen(self, last_id, timeout):
+        """
+        Events after last_id, waiting up to timeout seconds for one
+
+        Returns:
+            list: Events (empty on timeout), or None if the client must resync
+        """
+        try:
+            last_id = int(last_id)
+        except ValueError:
+            return None
+        with self._condition:
+            events = self._after(last_id)
+            if events == []:
+                self._condition.wait(timeout)
+                events = self._after(last_id)
+            return events
+
+
+class RedisEventBus:
+    """Events in a capped Redis stream shared by every worker process"""
+
+    def __init__(self, url, size=BUFFER_SIZE):
+        import redis
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.size = size
+
+    def publish(self, name, data):
+        self.client.xadd(REDIS_STREAM, {'name': name, 'data': json.dumps(data)},
+                         maxlen=self.size, approximate=True)
+
+    def last_id(self):
+        entries = self.client.xrevrange(REDIS_STREAM, count=1)
+        return entries[0][0] if entries else '0-0'
+
+    @staticmethod
+    def _position(stream_id):
+        milliseconds, _, sequence = stream_id.partition('-')
+        return int(milliseconds), int(sequence or 0)
+
+    def resumable(self, last_id):
+        """Whether the events after last_id are all still kept"""
+        try:
+            position = self._position(last_id)
+        except ValueError:
+            return False
+        first = self.client.xrange(REDIS_STREAM, count=1)
+        # Trimmed past the client, or the stream was reset since it connected
+        if first and position != (0, 0) and position < self._position(first[0][0]):
+            return False
+        return position <= self._position(self.last_id())
+
+    def listen(self, last_id, timeout):
+        """Events after last_id, as for MemoryEventBus.listen()"""
+        import redis
+        try:
+            if not self.resumable(last_id):
+                return None
+            result = self.client.xread({REDIS_STREAM: last_id}, count=100, block=int(timeout * 1000))
+        except (ValueError, redis.ResponseError):
+            return None
+        if not result:
+            return []
+        return [BusEvent(event_id, fields['name'], json.loads(fields['data']))
+                for event_id, fields in result[0][1]]
+
+
+def get_event_bus(app=None):
+    """The app's event bus, created on first use"""
+    app = app or current_app._get_current_object()
+    bus = app.extensions.get('event_bus')
+    if bus is None:
+        redis_url = app.config.get('EVENT_BUS_REDIS_URL')
+        bus = RedisEventBus(redis_url) if redis_url else MemoryEventBus()
+        app.extensions['event_bus'] = bus
+    return bus
+
+
+def publish(name, **data):
+    """Publish an event after the change it describes is committed; failures are only logged"""
+    try:
+        get_event_bus().publish(name, data)
+    except Exception as e:
+        logging.error(f"Could not publish {name} event: {e}")
+
+
+def publish_counts(message=None, **changes):
+    """Publish changes to dashboard counts, e.g. publish_counts(pending_approvals=-1)"""
+    publish('counts', changes=changes, message=message)
+
+
+def cooperative():
+    """Whether blocking waits yield to other requests (gevent monkey-patching is active)"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+
+def event_stream(bus, last_id, max_duration, heartbeat=HEARTBEAT_INTERVAL):
+    """
+    Server-Sent Events from last_id on
+
+    Sends a comment line as heartbeat when nothing happens, a 'resync' event
+    when the client missed events that are no longer kept, and ends after
+    max_duration seconds; the browser then reconnects with its Last-Event-ID.
+    Runs without a request context, so no database connection is held.
+    """
+    deadline = time.monotonic() + max_duration
+    yield f'retry: {RECONNECT_DELAY}\n\n'
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        events = bus.listen(last_id, min(heartbeat, remaining))
+        if events is None:
+            last_id = bus.last_id()
+            yield f'id: {last_id}\nevent: resync\ndata: {{}}\n\n'
+        elif not events:
+            yield ': heartbeat\n\n'
+        for event in events or []:
+            last_id = event.id
+            yield f'id: {event.id}\nevent: {event.name}\ndata: {json.dumps(event.data)}\n\n'
@@ -0,0 +1,353 @@
+"""
+Facebook Graph API integration for registration verification
+Verification runs as a background job on a bounded worker pool that shares a
+keep-alive requests.Session, so request workers never wait on the Graph API.
+The registrant's access token only lives in the worker's memory, so a job
+whose process died cannot be resumed: once JOB_LEASE has passed, the status
+check fails it and the registrant can try again.
+"""
+import os
+import time
+import random
+import logging
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from flask import current_app
+from extensions import db
+from models import User, RoleType, ApprovalStatus, FacebookVerificationJob
+
+# Facebook App Configuration (secure environment variables)
+FACEBOOK_APP_ID = os.environ.get('FACEBOOK_APP_ID')
+FACEBOOK_APP_SECRET = os.environ.get('FACEBOOK_APP_SECRET')
+FACEBOOK_PAGE_ID = os.environ.get('FACEBOOK_PAGE_ID', '')  # KPN Official Page ID removed
+FACEBOOK_GRAPH_URL = os.environ.get('FACEBOOK_GRAPH_URL', 'https://graph.facebook.com/v18.0').rstrip('/')
+FACEBOOK_PAGE_ACCESS_TOKEN = os.environ.get('FACEBOOK_PAGE_ACCESS_TOKEN')  # Optional; else the registrant's token
+
+MAX_WORKERS = int(os.environ.get('FACEBOOK_VERIFY_WORKERS', 4))
+MAX_RETRIES = 3
+REQUEST_TIMEOUT = (3.05, 10)  # (connect, read) seconds
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+FOLLOWER_CACHE_TTL = int(os.environ.get('FACEBOOK_FOLLOWER_CACHE_TTL', 900))  # Full refresh interval (seconds)
+FOLLOWER_REFRESH_INTERVAL = 30  # Minimum seconds between incremental refreshes on a miss
+FOLLOWER_PAGE_SIZE = 100
+JOB_LEASE = timedelta(minutes=5)  # Well above a job's worst case of retried Graph API calls
+
+
+class FacebookAPIError(Exception):
+    """Raised when the Graph API cannot be reached after retries"""
+
+
+class FollowerCache:
+    """
+    Page follower IDs fetched by following Graph API cursors to completion
+
+    IDs are stored as integers in a set, so each check is an O(1) membership
+    test. A miss triggers an incremental refresh that walks the newest pages
+    only until it reaches an ID that is already known. A miss within
+    FOLLOWER_REFRESH_INTERVAL of the last refresh is left undecided for the
+    caller to look up, since the user may have followed the page since.
+    """
+
+    def __init__(self, service, ttl=FOLLOWER_CACHE_TTL):
+        self.service = service
+        self.ttl = ttl
+        self._ids = set()
+        self._loaded_at = 0.0
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(facebook_user_id):
+        value = str(facebook_user_id)
+        return int(value) if value.isdigit() else value
+
+    def _fetch(self, access_token, known=None):
+        """Collect follower IDs page by page, stopping early at a known ID if given"""
+        ids = set()
+        response = self.service.graph_get(f"{FACEBOOK_PAGE_ID}/likes", {
+            'access_token': access_token,
+            'fields': 'id',
+            'limit': FOLLOWER_PAGE_SIZE
+        })
+        while True:
+            if response.status_code != 200:
+                error = response.json().get('error', {}).get('message', 'Unknown error') \
+                    if response.headers.get('content-type', '').startswith('application/json') else ''
+                raise FacebookAPIError(f"Facebook API returned status code {response.status_code}: {error}")
+
+            data = response.json()
+            page_ids = {self._key(like['id']) for like in data.get('data', []) if like.get('id')}
+            ids |= page_ids
+            if known is not None and page_ids & known:
+                break
+
+            next_url = data.get('paging', {}).get('next')
+            if not next_url or not page_ids:
+                break
+            # The next URL already carries the cursor and token
+            response = self.service.graph_get(next_url, None)
+        return ids
+
+    def contains(self, facebook_user_id, access_token):
+        """
+        Check membership, refreshing the set when stale or on a miss
+
+        Returns:
+            bool or None: None for a miss while refreshes are throttled
+        """
+        key = self._key(facebook_user_id)
+        now = time.monotonic()
+        if key in self._ids and now - self._loaded_at < self.ttl:
+            return True
+
+        with self._lock:
+            now = time.monotonic()
+            if now - self._loaded_at >= self.ttl:
+                self._ids = self._fetch(access_token)
+                self._loaded_at = self._refreshed_at = now
+            elif key not in self._ids:
+                if now - self._refreshed_at < FOLLOWER_REFRESH_INTERVAL:
+                    return None
+                self._ids = self._ids | self._fetch(access_token, known=self._ids)
+                self._refreshed_at = now
+            return key in self._ids
+
+    def add(self, facebook_user_id):
+        """Record a follower confirmed by a single-user lookup"""
+        with self._lock:
+            self._ids = self._ids | {self._key(facebook_user_id)}
+
+    def clear(self):
+        with self._lock:
+            self._ids = set()
+            self._loaded_at = self._refreshed_at = 0.0
+
+
+class FacebookService:
+    """Graph API client with a pooled session and exponential backoff"""
+
+    def __init__(self, base_url=FACEBOOK_GRAPH_URL, max_workers=MAX_WORKERS):
+        self.base_url = base_url
+        self.max_workers = max_workers
+        self._session = None
+        self._executor = None
+        self.followers = FollowerCache(self)
+
+    @property
+    def session(self):
+        """Keep-alive session sized to the worker pool"""
+        if self._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self._session = session
+        return self._session
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix='facebook-verify')
+        return self._executor
+
+    def graph_get(self, path, params):
+        """
+        GET a Graph API path, retrying timeouts, 429 and 5xx with exponential backoff
+
+        Returns:
+            requests.Response for any non-retryable status
+        """
+        url = path if path.startswith('http') else f"{self.base_url}/{path.lstrip('/')}"
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                response = self.session.get(url, params=params, timeout=REQUEST_TIMEOUT)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    return response
+                error = f"HTTP {response.status_code}"
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                error = str(e)
+
+            if attempt < MAX_RETRIES:
+                delay = (2 ** attempt) * 0.5 + random.uniform(0, 0.25)
+                logging.info(f"Facebook API retry {attempt + 1} for {path} in {delay:.2f}s: {error}")
+                time.sleep(delay)
+
+        raise FacebookAPIError(f"Facebook API unavailable after {MAX_RETRIES + 1} attempts: {error}")
+
+    def verify_page_follow(self, facebook_user_id, access_token):
+        """
+        Verify if user follows the KPN Facebook page
+
+        Returns:
+            bool: True if the user follows the page
+
+        Raises:
+            FacebookAPIError: If the Graph API stays unavailable
+        """
+        # Check if Facebook is properly configured
+        if not FACEBOOK_APP_ID or not FACEBOOK_APP_SECRET or not FACEBOOK_PAGE_ID:
+            logging.warning("Facebook integration not properly configured")
+            return False
+
+        # Validate access token first
+        token_response = self.graph_get('me', {'access_token': access_token, 'fields': 'id'})
+        if token_response.status_code != 200:
+            logging.info("Invalid Facebook access token")
+            return False
+
+        if token_response.json().get('id') != facebook_user_id:
+            logging.info("Access token does not match user ID")
+            return False
+
+        # Check if user likes/follows the page against the cached follower set
+        follows_page = self.followers.contains(facebook_user_id, FACEBOOK_PAGE_ACCESS_TOKEN or access_token)
+        if follows_page is None:
+            # The set was refreshed moments ago; ask about this user alone rather than report a miss
+            follows_page = self.user_follows_page(facebook_user_id, access_token)
+            if follows_page:
+                self.followers.add(facebook_user_id)
+        return follows_page
+
+    def user_follows_page(self, facebook_user_id, access_token):
+        """
+        Look up whether one user follows the KPN page, with the user's own token
+
+        Raises:
+            FacebookAPIError: If the lookup fails, so the check can be retried
+        """
+        response = self.graph_get(f"{facebook_user_id}/likes/{FACEBOOK_PAGE_ID}", {
+            'access_token': access_token,
+            'fields': 'id'
+        })
+        if response.status_code != 200:
+            raise FacebookAPIError(f"Facebook API returned status code {response.status_code} for the follow lookup")
+        return any(like.get('id') == FACEBOOK_PAGE_ID for like in response.json().get('data', []))
+
+    def enqueue_verification(self, user_id, facebook_user_id, access_token):
+        """
+        Queue a page-follow verification for a pending registration
+
+        The access token is handed to the worker in memory only and never stored.
+
+        Returns:
+            FacebookVerificationJob: The queued job
+        """
+        job = FacebookVerificationJob(user_id=user_id, facebook_user_id=facebook_user_id)
+        db.session.add(job)
+        db.session.commit()
+
+        app = current_app._get_current_object()
+        self.executor.submit(self._run_job, app, job.id, access_token)
+        return job
+
+    def _run_job(self, app, job_id, access_token):
+        with app.app_context():
+            job = FacebookVerificationJob.query.get(job_id)
+            if not job or job.finished:
+                return
+
+            job.status = 'running'
+            job.attempts = (job.attempts or 0) + 1
+            job.started_at = datetime.utcnow()
+            db.session.commit()
+
+            try:
+                follows_page = self.verify_page_follow(job.facebook_user_id, access_token)
+            except FacebookAPIError as e:
+                job.status = 'failed'
+                job.error = str(e)
+                job.completed_at = datetime.utcnow()
+                db.session.commit()
+                return
+            except Exception as e:
+                logging.error(f"Facebook verification error for job {job_id}: {e}")
+                db.session.rollback()
+                job.status = 'failed'
+                job.error = 'Unexpected verification error'
+                job.completed_at = datetime.utcnow()
+                db.session.commit()
+                return
+
+            complete_verification(job.user, job.facebook_user_id, follows_page)
+            job.status = 'verified' if follows_page else 'not_following'
+            job.completed_at = datetime.utcnow()
+            db.session.commit()
+
+
+def fail_stranded_job(job):
+    """
+    Fail a queued or running job that has outlived JOB_LEASE
+
+    Its worker is gone (the process restarted or died), and with it the
+    access token, so the job can only be failed for the registrant to retry.
+    The update is conditional, so a worker that finishes at the same moment
+    is not overwritten.
+
+    Returns:
+        bool: True if the job was failed
+    """
+    expired = datetime.utcnow() - JOB_LEASE
+    if job.finished or (job.started_at or job.created_at) > expired:
+        return False
+    failed = FacebookVerificationJob.query.filter(
+        FacebookVerificationJob.id == job.id,
+        FacebookVerificationJob.status.in_(('queued', 'running')),
+        db.func.coalesce(FacebookVerificationJob.started_at, FacebookVerificationJob.created_at) <= expired,
+    ).update({
+        FacebookVerificationJob.status: 'failed',
+        FacebookVerificationJob.error: 'Verification did not finish',
+        FacebookVerificationJob.completed_at: datetime.utcnow(),
+    }, synchronize_session=False)
+    db.session.commit()
+    db.session.refresh(job)
+    if failed:
+        logging.warning(f"Facebook verification job {job.id} outlived its lease and was failed")
+    return bool(failed)
+
+
+def complete_verification(user, facebook_user_id, follows_page):
+    """Record a verification result on the user and track the follow"""
+    from utils.activity_tracker import log_activity, auto_track_facebook_follow
+
+    user.facebook_user_id = facebook_user_id
+    user.facebook_verified = follows_page
+    user.facebook_follow_date = datetime.utcnow() if follows_page else None
+
+    # Auto-approve general members who verify Facebook
+    if user.role_type == RoleType.GENERAL_MEMBER and follows_page:
+        user.approval_status = ApprovalStatus.APPROVED
+        user.approved_at = datetime.utcnow()
+
+    db.session.commit()
+
+    # Track Facebook follow activity if successful
+    if follows_page:
+        try:
+            # Log the Facebook follow activity
+            auto_track_facebook_follow(user.id)
+
+            # Log profile completion activity
+            log_activity(
+                user_id=user.id,
+                activity_type='profile_completed',
+                description=f"Completed registration and Facebook verification for {user.role_type.value} role"
+            )
+        except Exception as e:
+            logging.error(f"Error tracking Facebook verification activity: {str(e)}")
+
+
+# Create global instance
+facebook_service = FacebookService()
+
+
+def verify_facebook_page_follow(facebook_user_id, access_token):
+    """Verify if user follows the KPN Facebook page (False if the API is unavailable)"""
+    try:
+        return facebook_service.verify_page_follow(facebook_user_id, access_token)
+    except FacebookAPIError as e:
+        logging.warning(str(e))
+        return False
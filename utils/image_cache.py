@@ -0,0 +1,131 @@
+"""
+On-demand image resizing with a bounded disk cache
+Sizes are rendered lazily on first request from an allow-list, guarded by a
+per-key lock so concurrent requests render once, and kept on disk with LRU
+eviction by total bytes.
+"""
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from flask import current_app
+from utils.image_utils import render_resized, VARIANT_FORMATS
+
+# (width, height) boxes that may be requested; override with IMAGE_RESIZE_SIZES
+DEFAULT_SIZES = {(150, 150), (320, 240), (400, 400), (640, 480), (960, 720), (1280, 960), (1600, 1200)}
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # IMAGE_CACHE_MAX_BYTES
+
+# URL extension -> (Pillow format, mimetype)
+FORMATS = {ext: spec for ext, spec in {
+    'jpg': ('jpeg', 'image/jpeg'),
+    'webp': ('webp', 'image/webp'),
+    'avif': ('avif', 'image/avif'),
+}.items() if spec[0] in VARIANT_FORMATS}
+
+
+class ResizeCache:
+    """Disk cache of resized images, evicting least recently used files past max_bytes"""
+
+    def __init__(self):
+        self._entries = None  # OrderedDict of path -> size, oldest first
+        self._total = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    @staticmethod
+    def _root():
+        return os.path.join(current_app.instance_path, 'image_cache')
+
+    def _load(self):
+        """Rebuild the LRU order from file access times after a restart"""
+        entries = []
+        for directory, _, filenames in os.walk(self._root()):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                if filename.endswith('.tmp'):
+                    continue
+                stat = os.stat(path)
+                entries.append((stat.st_atime, path, stat.st_size))
+        self._entries = OrderedDict((path, size) for _, path, size in sorted(entries))
+        self._total = sum(self._entries.values())
+
+    def _touch(self, path, size):
+        with self._lock:
+            if self._entries is None:
+                self._load()
+            if path in self._entries:
+                self._entries.move_to_end(path)
+            else:
+                self._entries[path] = size
+                self._total += size
+            self._evict()
+
+    def _evict(self):
+        max_bytes = current_app.config.get('IMAGE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+        while self._total > max_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _key_lock(self, key):
+        with self._lock:
+            lock, users = self._key_locks.get(key, (None, 0))
+            if lock is None:
+                lock = threading.Lock()
+            self._key_locks[key] = (lock, users + 1)
+            return lock
+
+    def _release_key_lock(self, key):
+        with self._lock:
+            lock, users = self._key_locks[key]
+            if users <= 1:
+                del self._key_locks[key]
+            else:
+                self._key_locks[key] = (lock, users - 1)
+
+    def get(self, source_path, width, height, ext):
+        """
+        Path of source_path resized into width x height as ext, rendering it if needed
+
+        Returns:
+            str: Cached file path, or None if the source could not be rendered
+        """
+        stat = os.stat(source_path)
+        # Changing the source (path, size or mtime) changes the key, so stale entries just age out
+        source_key = hashlib.sha256(f"{source_path}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+        key = f"{source_key}_{width}x{height}.{ext}"
+        path = os.path.join(self._root(), source_key[:2], key)
+
+        if not os.path.exists(path):
+            lock = self._key_lock(key)
+            try:
+                with lock:
+                    # Another request may have rendered it while we waited
+                    if not os.path.exists(path):
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        if not render_resized(source_path, path, width, height, FORMATS[ext][0]):
+                            return None
+                        logging.info(f"Rendered {width}x{height}.{ext} of {source_path}")
+            finally:
+                self._release_key_lock(key)
+        else:
+            try:
+                os.utime(path)  # Keep the access time current for LRU after restarts
+            except OSError:
+                pass
+
+        self._touch(path, os.path.getsize(path))
+        return path
+
+
+def allowed_size(width, height):
+    sizes = current_app.config.get('IMAGE_RESIZE_SIZES', DEFAULT_SIZES)
+    return (width, height) in sizes
+
+
+# Create global instance
+resize_cache = ResizeCache()
@@ -0,0 +1,119 @@
+"""
+Image metadata index
+Width, height, format, byte size, dominant colour and an inline placeholder
+are recorded once per stored image, so pages can reserve layout space and
+paint a placeholder immediately, and admin views can sort and filter by size
+without opening files. The image pipeline records new images; backfill()
+indexes uploads stored before the index existed.
+"""
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import ImageMetadata, Media, User, Campaign
+from utils.image_utils import extract_image_metadata
+from utils.storage import get_storage, storage_key
+
+BATCH_SIZE = 100
+
+
+def _image_paths():
+    """Image paths referenced by Media photos, profile photos and campaign images"""
+    queries = [
+        db.session.query(Media.file_path).filter(Media.file_type == 'photo'),
+        db.session.query(User.photo).filter(User.photo.isnot(None)),
+        db.session.query(Campaign.featured_image).filter(Campaign.featured_image.isnot(None)),
+    ]
+    return {path for query in queries for (path,) in query if path}
+
+
+def _file_path(path):
+    """Local copy of a stored image (downloaded once on remote backends), or None"""
+    return get_storage().fetch(storage_key(path))
+
+
+def record_metadata(path, values):
+    """
+    Insert or update the metadata of a stored image; the caller commits
+
+    Args:
+        path: Image path relative to static/, as stored on the row
+        values: Dict from extract_image_metadata()
+    """
+    info = ImageMetadata.query.filter_by(path=path).first()
+    if info is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(ImageMetadata(path=path, **values))
+            return
+        except IntegrityError:
+            # Recorded concurrently (pipeline and backfill); update that row instead
+            info = ImageMetadata.query.filter_by(path=path).first()
+    for name, value in values.items():
+        setattr(info, name, value)
+
+
+def forget_metadata(*paths):
+    """Drop the metadata of deleted images; the caller commits"""
+    if paths:
+        ImageMetadata.query.filter(ImageMetadata.path.in_(paths)).delete(synchronize_session=False)
+
+
+def backfill(workers=None, force=False):
+    """
+    Index stored images that have no metadata yet, reading files in parallel
+
+    Files are fetched as workers free up, with at most two per worker in
+    flight, so a remote backend's bounded download cache never evicts a file
+    before it is read.
+
+    Args:
+        workers: Worker processes (default: one per CPU)
+        force: Re-read images that are already indexed
+
+    Returns:
+        dict: 'recorded', 'failed' (unreadable) and 'missing' (no file) counts
+    """
+    paths = _image_paths()
+    if not force:
+        paths -= {path for (path,) in db.session.query(ImageMetadata.path)}
+
+    recorded = failed = missing = 0
+    if paths:
+        max_workers = workers or os.cpu_count() or 1
+        queue = iter(sorted(paths))
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            pending = {}
+            while True:
+                # Keep a bounded number of files in flight
+                for path in queue:
+                    file_path = _file_path(path)
+                    if not file_path:
+                        missing += 1
+                        continue
+                    pending[pool.submit(extract_image_metadata, file_path)] = path
+                    if len(pending) >= max_workers * 2:
+                        break
+                if not pending:
+                    break
+
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path = pending.pop(future)
+                    try:
+                        values = future.result()
+                    except Exception as e:
+                        logging.error(f"Reading metadata of {path} failed: {e}")
+                        values = None
+                    if values is None:
+                        failed += 1
+                        continue
+                    record_metadata(path, values)
+                    recorded += 1
+                    if recorded % BATCH_SIZE == 0:
+                        db.session.commit()
+        db.session.commit()
+
+    logging.info(f"Image metadata backfill recorded {recorded}, failed {failed}, missing {missing}")
+    return {'recorded': recorded, 'failed': failed, 'missing': missing}
@@ -0,0 +1,323 @@
+"""
+Background image pipeline for uploads
+Requests only store the original in the blob store and return; optimization,
+EXIF orientation, thumbnailing and responsive variants run in a process pool,
+and the outputs are stored as blobs and recorded on the Media/User/Campaign
+row (and in the image metadata index) once the worker finishes. A row is
+marked pending in the caller's transaction and handed to the pool only when
+that transaction commits.
+"""
+import os
+import logging
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import event
+from markupsafe import Markup, escape
+from werkzeug.utils import secure_filename
+from extensions import db
+from models import User, Media, Campaign
+from utils.image_utils import process_image
+from utils import blob_store
+from utils.image_metadata import record_metadata
+from utils.storage import get_storage, storage_key, upload_url
+from utils.upload_intake import IntakeFile
+
+# Bounding boxes and responsive widths per upload kind
+IMAGE_PROFILES = {
+    'media': {'max_width': 1600, 'max_height': 1200, 'thumb_size': (400, 400),
+              'variant_widths': (320, 640, 960, 1280, 1600)},
+    'photo': {'max_width': 600, 'max_height': 600, 'thumb_size': (150, 150),
+              'variant_widths': (120, 240, 480)},
+    'campaign': {'max_width': 1600, 'max_height': 1200, 'thumb_size': (400, 400),
+                 'variant_widths': (320, 640, 960, 1280, 1600)},
+}
+
+# Row attributes holding (image path, thumbnail, variants, status) per model
+IMAGE_FIELDS = {
+    Media: ('file_path', 'thumbnail_path', 'variants', 'processing_status'),
+    User: ('photo', 'photo_thumbnail', 'photo_variants', 'photo_status'),
+    Campaign: ('featured_image', None, 'featured_image_variants', 'featured_image_status'),
+}
+
+
+def store_original(file):
+    """
+    Store an uploaded file in the blob store and count the row's reference to it
+
+    Identical uploads share one blob. The caller commits along with the row that
+    holds the returned path.
+
+    Args:
+        file: Uploaded FileStorage
+
+    Returns:
+        str: Blob path (storage key), as stored on the row
+    """
+    if isinstance(file.stream, IntakeFile):
+        # Already hashed while the request streamed in; publish by rename
+        relative_path = blob_store.put_intake(file.stream)
+    else:
+        ext = os.path.splitext(secure_filename(file.filename or ''))[1].lower()
+        file.stream.seek(0)
+        relative_path = blob_store.put_stream(file.stream, ext)
+    blob_store.acquire(relative_path)
+    return relative_path
+
+
+def release_stored(*values):
+    """
+    Drop a row's references to stored files (paths or variant metadata)
+
+    Blobs are removed by garbage collection once unreferenced; files stored
+    before the blob store existed are deleted directly.
+    """
+    paths = [path for value in values for path in blob_store.referenced_paths(value)]
+    blob_store.release(*paths)
+    remove_legacy_files(*paths)
+
+
+def remove_legacy_files(*paths):
+    """Delete files stored before the blob store existed (blob paths are ignored)"""
+    storage = get_storage()
+    for path in paths:
+        if not blob_store.is_blob_path(path):
+            storage.delete(storage_key(path))
+
+
+class ImagePipeline:
+    """Process pool that optimizes stored uploads and records the outcome"""
+
+    def __init__(self):
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=current_app.config.get('IMAGE_PROCESS_WORKERS'))
+        return self._executor
+
+    def process_media(self, media_item):
+        """Queue a photo Media row for processing once the current transaction commits"""
+        self._queue(media_item, IMAGE_PROFILES['media'])
+
+    def process_user_photo(self, user):
+        """Queue a user's profile photo for processing once the current transaction commits"""
+        self._queue(user, IMAGE_PROFILES['photo'])
+
+    def process_campaign_image(self, campaign):
+        """Queue a campaign's featured image for processing once the current transaction commits"""
+        self._queue(campaign, IMAGE_PROFILES['campaign'])
+
+    def _queue(self, row, profile):
+        # Marks the row pending in the caller's transaction; _submit_queued() runs after its commit
+        model = row.__class__  # Also resolves proxies such as current_user
+        path_field, _, _, status_field = IMAGE_FIELDS[model]
+        setattr(row, status_field, 'pending')
+        db.session.flush()  # Assigns the ID of a new row
+        db.session.info.setdefault('image_pipeline', []).append((model, row.id, getattr(row, path_field), profile))
+
+    def _submit(self, model, row_id, original, profile):
+        app = current_app._get_current_object()
+        work_dir = tempfile.mkdtemp(dir=blob_store.temp_dir())
+        try:
+            # Workers read a local copy; remote backends download it once
+            source = get_storage().fetch(storage_key(original))
+            if source is None:
+                raise FileNotFoundError(original)
+            future = self.executor.submit(process_image, source, work_dir=work_dir, **profile)
+        except Exception as e:
+            # A broken pool is replaced on the next upload
+            logging.error(f"Image pipeline unavailable: {e}")
+            if not isinstance(e, FileNotFoundError):
+                self._executor = None
+            shutil.rmtree(work_dir, ignore_errors=True)
+            self._record(app, model, row_id, original, {'success': False, 'error': 'Image processing unavailable'})
+            return
+        future.add_done_callback(lambda f: self._on_done(app, model, row_id, original, work_dir, f))
+
+    def _submit_queued(self, queued):
+        for model, row_id, original, profile in queued:
+            try:
+                self._submit(model, row_id, original, profile)
+            except Exception as e:
+                # The commit has happened; a failure here must not reach the caller
+                logging.error(f"Could not queue image processing for {original}: {e}")
+
+    def _on_done(self, app, model, row_id, original, work_dir, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            logging.error(f"Image processing failed for {original}: {e}")
+            result = {'success': False, 'error': 'Image processing failed'}
+        try:
+            self._record(app, model, row_id, original, result)
+        except Exception as e:
+            logging.error(f"Could not record image processing result for {original}: {e}")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    @staticmethod
+    def _record(app, model, row_id, original, result):
+        """Apply a processing result to its row; returns False if the row moved on"""
+        with app.app_context():
+            path_field, thumbnail_field, variants_field, status_field = IMAGE_FIELDS[model]
+            row = db.session.get(model, row_id)
+            # Skip rows that were deleted or re-uploaded while the job ran
+            if getattr(row, path_field, None) != original:
+                return False
+
+            setattr(row, status_field, 'ready' if result['success'] else 'failed')
+            if model is Media:
+                row.processing_error = result.get('error')
+                row.processed_at = datetime.utcnow()
+
+            if result['success']:
+                # Move the outputs into the blob store and swap the row's references
+                old_values = [original, getattr(row, variants_field)]
+                if thumbnail_field:
+                    old_values.append(getattr(row, thumbnail_field))
+
+                variants = result.get('variants')
+                if variants:
+                    variants = dict(variants, sources={
+                        fmt: [dict(source, path=blob_store.put_file(source['path'])) for source in sources]
+                        for fmt, sources in variants['sources'].items()
+                    })
+                setattr(row, path_field, blob_store.put_file(result['path']))
+                setattr(row, variants_field, variants)
+                if result.get('metadata'):
+                    record_metadata(getattr(row, path_field), result['metadata'])
+                new_values = [getattr(row, path_field), variants]
+                if thumbnail_field:
+                    setattr(row, thumbnail_field, blob_store.put_file(result['thumbnail']) if result.get('thumbnail') else None)
+                    new_values.append(getattr(row, thumbnail_field))
+
+                blob_store.acquire(*[path for value in new_values for path in blob_store.referenced_paths(value)])
+                released = [path for value in old_values for path in blob_store.referenced_paths(value)]
+                blob_store.release(*released)
+            db.session.commit()
+            if result['success']:
+                # Only delete legacy files once the row no longer points at them
+                remove_legacy_files(*released)
+
+            if model is Media:
+                from utils.cache_utils import invalidate_media_caches
+                invalidate_media_caches()
+            elif model is Campaign:
+                from utils.cache_utils import invalidate_campaign_caches
+                invalidate_campaign_caches()
+            return True
+
+
+def _add_placeholder(img_attrs, info):
+    """Paint the dominant colour and LQIP behind the image until it loads"""
+    if info:
+        img_attrs['style'] = info.placeholder_style + (f" {img_attrs['style']}" if img_attrs.get('style') else '')
+
+
+def responsive_image(src, variants=None, alt='', sizes='100vw', info=None, **attrs):
+    """
+    Render a <picture> that lets the browser pick the smallest adequate variant
+
+    Emits AVIF/WebP <source> srcsets ahead of a JPEG <img> srcset, with the
+    intrinsic width/height so layout space is reserved. Without variants it
+    falls back to a plain lazy-loaded <img> of src.
+
+    Args:
+        src: Fallback image path (storage key)
+        variants: Variant metadata stored by the image pipeline
+        alt: Alternative text
+        sizes: The img sizes attribute describing the rendered width
+        info: ImageMetadata of src, for its size and placeholder
+        **attrs: Extra <img> attributes (class_ for class, underscores become hyphens)
+    """
+    img_attrs = {'alt': alt, 'loading': 'lazy', 'decoding': 'async'}
+    if info:
+        img_attrs.update(width=info.width, height=info.height)
+    for name, value in attrs.items():
+        img_attrs['class' if name == 'class_' else name.replace('_', '-')] = value
+    _add_placeholder(img_attrs, info)
+
+    def render_attrs(values):
+        return ''.join(f' {name}="{escape(value)}"' for name, value in values.items() if value is not None)
+
+    if not variants or not variants.get('sources', {}).get('jpeg'):
+        return Markup(f"<img src=\"{escape(upload_url(src))}\"{render_attrs(img_attrs)}>")
+
+    def srcset(sources):
+        return ', '.join(f"{upload_url(source['path'])} {source['width']}w" for source in sources)
+
+    tags = ['<picture>']
+    for fmt in ('avif', 'webp'):
+        if variants['sources'].get(fmt):
+            tags.append(f'<source type="image/{fmt}"'
+                        f'{render_attrs({"srcset": srcset(variants["sources"][fmt]), "sizes": sizes})}>')
+    img_attrs.update(srcset=srcset(variants['sources']['jpeg']), sizes=sizes,
+                     width=variants['width'], height=variants['height'])
+    tags.append(f"<img src=\"{escape(upload_url(src))}\"{render_attrs(img_attrs)}>")
+    tags.append('</picture>')
+    return Markup(''.join(tags))
+
+
+def thumbnail_image(src, thumbnail=None, variants=None, thumb_size=IMAGE_PROFILES['media']['thumb_size'],
+                    alt='', sizes='100vw', eager=False, info=None, **attrs):
+    """
+    Render the stored thumbnail as a plain <img> with its intrinsic size
+
+    Grid views show small images, so the thumbnail is fetched rather than a
+    srcset candidate; width/height derived from the variant metadata reserve
+    the layout space before it loads. eager marks first-screen images so they
+    are not deferred by lazy loading. Until the pipeline has produced a
+    thumbnail it falls back to responsive_image() of src.
+
+    Args:
+        src: Image path (storage key), used without a thumbnail
+        thumbnail: Thumbnail path (storage key)
+        variants: Variant metadata stored by the image pipeline
+        thumb_size: Bounding box the thumbnail was generated in
+        alt: Alternative text
+        sizes: The img sizes attribute for the fallback
+        eager: Load immediately with high priority
+        info: ImageMetadata of src, for its size and placeholder
+        **attrs: Extra <img> attributes, as for responsive_image()
+    """
+    if not thumbnail:
+        if eager:
+            attrs.update(loading='eager', fetchpriority='high')
+        return responsive_image(src, variants, alt=alt, sizes=sizes, info=info, **attrs)
+
+    img_attrs = {'alt': alt, 'loading': 'eager' if eager else 'lazy', 'decoding': 'async'}
+    if eager:
+        img_attrs['fetchpriority'] = 'high'
+    width, height = (info.width, info.height) if info else \
+        (variants.get('width'), variants.get('height')) if variants else (None, None)
+    if width and height:
+        # Thumbnails keep the aspect ratio inside thumb_size
+        scale = min(thumb_size[0] / width, thumb_size[1] / height, 1)
+        img_attrs['width'] = max(1, round(width * scale))
+        img_attrs['height'] = max(1, round(height * scale))
+    for name, value in attrs.items():
+        img_attrs['class' if name == 'class_' else name.replace('_', '-')] = value
+    _add_placeholder(img_attrs, info)
+
+    rendered = ''.join(f' {name}="{escape(value)}"' for name, value in img_attrs.items() if value is not None)
+    return Markup(f"<img src=\"{escape(upload_url(thumbnail))}\"{rendered}>")
+
+
+# Create global instance
+image_pipeline = ImagePipeline()
+
+
+@event.listens_for(db.session, 'after_commit')
+def _submit_committed(session):
+    queued = session.info.pop('image_pipeline', None)
+    if queued:
+        image_pipeline._submit_queued(queued)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_queued(session):
+    session.info.pop('image_pipeline', None)
@@ -2,11 +2,28 @@
 Image optimization utilities for performance
 """
 import os
+import logging
+import base64
+import io
+import shutil
 from datetime import datetime
-from PIL import Image, ImageOps
+from PIL import Image, ImageOps, features
 from werkzeug.utils import secure_filename
 import mimetypes
 
+# Responsive variant formats, best compression first; JPEG is the universal fallback
+VARIANT_FORMATS = [fmt for fmt, supported in (
+    ('avif', features.check('avif')),
+    ('webp', features.check('webp')),
+    ('jpeg', True),
+) if supported]
+VARIANT_EXTENSIONS = {'avif': 'avif', 'webp': 'webp', 'jpeg': 'jpg'}
+VARIANT_QUALITY = {'avif': 60, 'webp': 78, 'jpeg': 82}
+
+# Inline placeholder (LQIP): a tiny blurred-by-upscaling copy embedded as a data URI
+PLACEHOLDER_SIZE = (16, 16)
+PLACEHOLDER_FORMAT = 'webp' if 'webp' in VARIANT_FORMATS else 'jpeg'
+
 
 def optimize_image(image_path, max_width=800, max_height=600, quality=85):
     """
@@ -23,6 +40,9 @@ def optimize_image(image_path, max_width=800, max_height=600, quality=85):
     """
     try:
         with Image.open(image_path) as img:
+            # Auto-orient image based on EXIF data (before conversion drops the EXIF)
+            img = ImageOps.exif_transpose(img)
+            
             # Convert RGBA to RGB if necessary (for JPEG compatibility)
             if img.mode in ('RGBA', 'LA', 'P'):
                 # Create a white background
@@ -32,9 +52,6 @@ def optimize_image(image_path, max_width=800, max_height=600, quality=85):
                 background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
                 img = background
             
-            # Auto-orient image based on EXIF data
-            img = ImageOps.exif_transpose(img)
-            
             # Calculate new dimensions maintaining aspect ratio
             ratio = min(max_width / img.width, max_height / img.height)
             if ratio < 1:
@@ -42,22 +59,23 @@ def optimize_image(image_path, max_width=800, max_height=600, quality=85):
                 new_height = int(img.height * ratio)
                 img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
             
-            # Save optimized image
+            # Save optimized image via a temp file so the original is never half-written
             if image_path.lower().endswith(('.png', '.gif')):
                 # Keep PNG/GIF format but optimize
-                img.save(image_path, optimize=True)
+                new_path = image_path
+                img.save(f"{new_path}.tmp", 'PNG' if new_path.lower().endswith('.png') else 'GIF', optimize=True)
             else:
                 # Convert to JPEG for better compression
                 base_path = os.path.splitext(image_path)[0]
                 new_path = f"{base_path}.jpg"
-                img.save(new_path, 'JPEG', quality=quality, optimize=True)
-                
-                # Remove original if different format
-                if new_path != image_path:
-                    os.remove(image_path)
-                    return new_path
+                img.save(f"{new_path}.tmp", 'JPEG', quality=quality, optimize=True)
+            os.replace(f"{new_path}.tmp", new_path)
+            
+            # Remove original if different format
+            if new_path != image_path:
+                os.remove(image_path)
             
-            return image_path
+            return new_path
             
     except Exception as e:
         print(f"Error optimizing image {image_path}: {e}")
@@ -76,9 +94,9 @@ def create_thumbnail(image_path, thumb_size=(150, 150)):
         str: Path to thumbnail file or None if failed
     """
     try:
-        # Generate thumbnail filename
-        base_path, ext = os.path.splitext(image_path)
-        thumb_path = f"{base_path}_thumb{ext}"
+        # Generate thumbnail filename (thumbnails are always JPEG)
+        base_path = os.path.splitext(image_path)[0]
+        thumb_path = f"{base_path}_thumb.jpg"
         
         with Image.open(image_path) as img:
             # Auto-orient image
@@ -104,41 +122,151 @@ def create_thumbnail(image_path, thumb_size=(150, 150)):
         return None
 
 
-def validate_and_process_upload(file, upload_dir, max_size_mb=5):
+def generate_variants(image_path, widths=(320, 640, 960, 1280)):
     """
-    Validate, optimize and save uploaded image
+    Create resized copies of an image in every supported variant format
+    
+    Widths larger than the image are skipped; the image's own width is used
+    instead so the largest variant is never upscaled.
     
     Args:
-        file: Uploaded file object
-        upload_dir: Directory to save the file
-        max_size_mb: Maximum file size in MB
+        image_path: Path to the (already optimized) image
+        widths: Target widths in pixels
     
     Returns:
-        dict: Result with 'success', 'filename', 'thumbnail', 'error' keys
+        dict: 'width', 'height' and 'sources' mapping each format to a list of
+        {'path', 'width', 'height'} sorted by width, or None if failed
     """
-    result = {
-        'success': False,
-        'filename': None,
-        'thumbnail': None,
+    try:
+        base_path = os.path.splitext(image_path)[0]
+        
+        with Image.open(image_path) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ('RGB', 'L'):
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                rgba = img.convert('RGBA')
+                background.paste(rgba, mask=rgba.split()[-1])
+                img = background
+            
+            target_widths = sorted({w for w in widths if w < img.width} |
+                                   ({img.width} if img.width <= max(widths) else set()))
+            
+            sources = {fmt: [] for fmt in VARIANT_FORMATS}
+            for width in target_widths:
+                height = max(1, round(img.height * width / img.width))
+                resized = img if width == img.width else img.resize((width, height), Image.Resampling.LANCZOS)
+                
+                for fmt in VARIANT_FORMATS:
+                    variant_path = f"{base_path}_{width}w.{VARIANT_EXTENSIONS[fmt]}"
+                    resized.save(f"{variant_path}.tmp", fmt.upper(), quality=VARIANT_QUALITY[fmt])
+                    os.replace(f"{variant_path}.tmp", variant_path)
+                    sources[fmt].append({'path': variant_path, 'width': width, 'height': height})
+            
+            return {'width': img.width, 'height': img.height, 'sources': sources}
+            
+    except Exception as e:
+        logging.error(f"Error creating variants for {image_path}: {e}")
+        return None
+
+
+def render_resized(image_path, output_path, width, height, fmt='jpeg', quality=None):
+    """
+    Render a copy of an image that fits inside width x height
+    
+    Args:
+        image_path: Path to the source image
+        output_path: Where to write the result (written via a temp file)
+        width, height: Bounding box in pixels; the image is never upscaled
+        fmt: Output format name understood by Pillow ('jpeg', 'webp', 'avif')
+        quality: Encoder quality, defaulting to VARIANT_QUALITY for the format
+    
+    Returns:
+        bool: True if the file was written
+    """
+    try:
+        with Image.open(image_path) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ('RGB', 'L'):
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                rgba = img.convert('RGBA')
+                background.paste(rgba, mask=rgba.split()[-1])
+                img = background
+            
+            if img.width > width or img.height > height:
+                img = ImageOps.contain(img, (width, height), Image.Resampling.LANCZOS)
+            
+            # Per-process temp name: other workers may render the same file concurrently
+            tmp_path = f"{output_path}.{os.getpid()}.tmp"
+            img.save(tmp_path, fmt.upper(), quality=quality or VARIANT_QUALITY.get(fmt, 85))
+            os.replace(tmp_path, output_path)
+            return True
+            
+    except Exception as e:
+        logging.error(f"Error resizing image {image_path}: {e}")
+        return False
+
+
+def process_image(image_path, max_width=800, max_height=600, thumb_size=(150, 150), variant_widths=None,
+                  work_dir=None):
+    """
+    Optimize a stored upload and create its thumbnail and responsive variants
+    
+    Runs in a worker process, so it only takes and returns plain values.
+    
+    Args:
+        image_path: Absolute path to the stored original
+        max_width, max_height: Bounding box for the optimized image
+        thumb_size: Tuple of (width, height) for the thumbnail
+        variant_widths: Widths for generate_variants, or None to skip variants
+        work_dir: If given, outputs are written there and the original is left untouched
+    
+    Returns:
+        dict: Result with 'success', 'path', 'thumbnail', 'variants', 'metadata', 'error' keys
+    """
+    if work_dir:
+        working_copy = os.path.join(work_dir, f"image{os.path.splitext(image_path)[1].lower()}")
+        shutil.copyfile(image_path, working_copy)
+        image_path = working_copy
+    
+    optimized_path = optimize_image(image_path, max_width, max_height)
+    if not optimized_path:
+        return {'success': False, 'path': None, 'thumbnail': None, 'variants': None,
+                'metadata': None, 'error': 'Failed to optimize image'}
+    
+    return {
+        'success': True,
+        'path': optimized_path,
+        'thumbnail': create_thumbnail(optimized_path, thumb_size),
+        'variants': generate_variants(optimized_path, variant_widths) if variant_widths else None,
+        'metadata': extract_image_metadata(optimized_path),
         'error': None
     }
+
+
+def validate_image_upload(file, max_size_mb=5):
+    """
+    Validate an uploaded image's name, type and size
+    
+    Args:
+        file: Uploaded file object
+        max_size_mb: Maximum file size in MB
     
+    Returns:
+        str: Error message, or None if the upload is acceptable
+    """
     if not file or not file.filename:
-        result['error'] = 'No file selected'
-        return result
+        return 'No file selected'
     
     # Validate file extension
     allowed_extensions = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
     if '.' not in file.filename or file.filename.rsplit('.', 1)[1].lower() not in allowed_extensions:
-        result['error'] = 'Invalid file type. Please upload PNG, JPG, JPEG, GIF, or WebP images.'
-        return result
+        return 'Invalid file type. Please upload PNG, JPG, JPEG, GIF, or WebP images.'
     
     # Validate MIME type
     mime_type, _ = mimetypes.guess_type(file.filename)
     allowed_mimes = {'image/png', 'image/jpeg', 'image/jpg', 'image/gif', 'image/webp'}
     if mime_type not in allowed_mimes:
-        result['error'] = 'Invalid file type detected.'
-        return result
+        return 'Invalid file type detected.'
     
     # Check file size
     file.seek(0, os.SEEK_END)
@@ -146,7 +274,32 @@ def validate_and_process_upload(file, upload_dir, max_size_mb=5):
     file.seek(0)
     
     if size_mb > max_size_mb:
-        result['error'] = f'File too large. Maximum size is {max_size_mb}MB.'
+        return f'File too large. Maximum size is {max_size_mb}MB.'
+    
+    return None
+
+
+def validate_and_process_upload(file, upload_dir, max_size_mb=5):
+    """
+    Validate, optimize and save uploaded image
+    
+    Args:
+        file: Uploaded file object
+        upload_dir: Directory to save the file
+        max_size_mb: Maximum file size in MB
+    
+    Returns:
+        dict: Result with 'success', 'filename', 'thumbnail', 'error' keys
+    """
+    result = {
+        'success': False,
+        'filename': None,
+        'thumbnail': None,
+        'error': None
+    }
+    
+    result['error'] = validate_image_upload(file, max_size_mb)
+    if result['error']:
         return result
     
     try:
@@ -205,4 +358,51 @@ def get_image_info(image_path):
                 'size_bytes': os.path.getsize(image_path)
             }
     except Exception:
+        return None
+
+
+def extract_image_metadata(image_path):
+    """
+    Read the metadata stored in the image index for one file
+    
+    Runs in worker processes (pipeline and backfill), so it only takes and
+    returns plain values.
+    
+    Args:
+        image_path: Path to image file
+    
+    Returns:
+        dict: 'width', 'height', 'format', 'bytes', 'dominant_color' ('#rrggbb')
+        and 'placeholder' (data URI), or None if the file is not a readable image
+    """
+    try:
+        with Image.open(image_path) as img:
+            fmt = (img.format or '').lower()
+            img = ImageOps.exif_transpose(img)
+            width, height = img.size
+            
+            small = img.convert('RGB')
+            small.thumbnail((64, 64), Image.Resampling.BILINEAR)
+            
+            # Most common colour of a reduced palette, rather than a muddy average
+            quantized = small.quantize(colors=5)
+            _, index = max(quantized.getcolors())
+            r, g, b = quantized.getpalette()[index * 3:index * 3 + 3]
+            
+            small.thumbnail(PLACEHOLDER_SIZE, Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            small.save(buffer, PLACEHOLDER_FORMAT.upper(), quality=40)
+            placeholder = (f"data:image/{PLACEHOLDER_FORMAT};base64,"
+                           f"{base64.b64encode(buffer.getvalue()).decode()}")
+        
+        return {
+            'width': width,
+            'height': height,
+            'format': 'jpeg' if fmt == 'mpo' else fmt,
+            'bytes': os.path.getsize(image_path),
+            'dominant_color': f'#{r:02x}{g:02x}{b:02x}',
+            'placeholder': placeholder,
+        }
+    except Exception as e:
+        logging.error(f"Error reading image metadata for {image_path}: {e}")
         return None
\ No newline at end of file
@@ -0,0 +1,88 @@
+"""
+Media file delivery
+Videos are served with HTTP Range support so players can seek and resume
+without downloading the whole file; conditional requests (ETag,
+Last-Modified, If-Range) are answered by Werkzeug and the body is streamed
+from disk through the server's file wrapper. Behind a reverse proxy the
+transfer can be handed off entirely with X-Sendfile or X-Accel-Redirect.
+Files held by a remote storage backend are not proxied at all: the client is
+redirected to a short-lived presigned URL and the object store serves ranges.
+"""
+import os
+import mimetypes
+from flask import Response, current_app, request, redirect
+from werkzeug.utils import send_file as werkzeug_send_file
+from utils import blob_store
+from utils.storage import get_storage, storage_key
+
+# MEDIA_OFFLOAD values understood by send_media()
+OFFLOAD_MODES = ('x-sendfile', 'x-accel-redirect')
+REDIRECT_URL_EXPIRY = 900
+
+
+def cache_headers(response, immutable, public):
+    """Cache-Control of a media response; restricted media is only cached by the browser"""
+    if public:
+        response.cache_control.public = True
+    else:
+        # Restricted media must not be stored by shared caches
+        response.cache_control.public = None
+        response.cache_control.private = True
+    response.cache_control.max_age = 31536000 if immutable else 3600
+    if immutable:
+        response.cache_control.immutable = True
+    return response
+
+
+def send_media(relative_path, mimetype=None, public=True):
+    """
+    Send a stored file relative to static/ with range and conditional support
+
+    Args:
+        relative_path: Stored file path relative to static/
+        mimetype: Content type; guessed from the extension if omitted
+        public: Whether shared caches may store the response
+
+    Config:
+        MEDIA_OFFLOAD: None (serve from Python), 'x-sendfile' (Apache/lighttpd)
+            or 'x-accel-redirect' (nginx)
+        MEDIA_ACCEL_PREFIX: Internal nginx location mapped to static/
+            (default '/protected-static/')
+
+    Returns:
+        Response: 200/206/304/416 response (302 to a presigned URL on remote
+        storage), or None if the file is missing
+    """
+    storage = get_storage()
+    key = storage_key(relative_path)
+    path = storage.local_path(key)
+    if path is None:
+        if storage.is_local or not storage.exists(key):
+            return None
+        # Remote backend: let the object store send the bytes
+        response = redirect(storage.url(key, expires=REDIRECT_URL_EXPIRY))
+        response.cache_control.private = True
+        response.cache_control.max_age = REDIRECT_URL_EXPIRY // 2
+        return response
+
+    mimetype = mimetype or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    # Blob paths are content-addressed, so their bytes never change
+    immutable = blob_store.is_blob_path(relative_path)
+    mode = current_app.config.get('MEDIA_OFFLOAD')
+
+    if mode == 'x-accel-redirect':
+        # nginx serves the internal location itself, including ranges and validators
+        prefix = current_app.config.get('MEDIA_ACCEL_PREFIX', '/protected-static/')
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + relative_path
+        response.headers['Accept-Ranges'] = 'bytes'
+        return cache_headers(response, immutable, public)
+
+    response = werkzeug_send_file(
+        path, request.environ, mimetype=mimetype, conditional=True, etag=True,
+        use_x_sendfile=(mode == 'x-sendfile'),
+        max_age=31536000 if immutable else 3600,
+        response_class=current_app.response_class,
+        _root_path=current_app.root_path,
+    )
+    return cache_headers(response, immutable, public)
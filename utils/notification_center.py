@@ -0,0 +1,148 @@
+"""
+In-app notification center
+Notifications are rows in the notifications table. Each user's unread count
+and cursor (the ID of their newest notification) are kept in the cache and
+updated as notifications are added or read, so the navbar badge costs one
+cache read. A badge already showing cursor N only asks for notifications
+newer than N. Other worker processes only see an update when the cache is
+shared; otherwise their counters are re-read within PROCESS_LOCAL_TIMEOUT
+(see utils.cache_utils.shared_timeout).
+"""
+from datetime import datetime
+from flask import current_app, url_for
+from sqlalchemy import event, insert, case, func, or_, and_
+from extensions import db
+from models import Notification, User, RoleType, ApprovalStatus
+from utils.cache_utils import shared_timeout
+
+COUNTER_TIMEOUT = 3600  # Counters are re-read from the database at least this often
+DELTA_LIMIT = 20
+
+
+def _counter_key(user_id):
+    return f'notifications_{user_id}'
+
+
+def load_counter(user_id):
+    """
+    A user's unread count and cursor, from the cache or one query
+
+    Returns:
+        dict: 'unread' count and 'cursor' (newest notification ID, 0 if none)
+    """
+    cache = current_app.cache
+    counter = cache.get(_counter_key(user_id))
+    if counter is None:
+        unread, cursor = db.session.query(
+            func.sum(case((Notification.read_at.is_(None), 1), else_=0)),
+            func.max(Notification.id)
+        ).filter(Notification.user_id == user_id).one()
+        counter = {'unread': unread or 0, 'cursor': cursor or 0}
+        cache.set(_counter_key(user_id), counter, timeout=shared_timeout(COUNTER_TIMEOUT))
+    return counter
+
+
+def _adjust_counter(user_id, unread_change, cursor=0):
+    # Counters that are not cached are loaded on the next read
+    cache = current_app.cache
+    counter = cache.get(_counter_key(user_id))
+    if counter is not None:
+        cache.set(_counter_key(user_id), {
+            'unread': max(0, counter['unread'] + unread_change),
+            'cursor': max(counter['cursor'], cursor),
+        }, timeout=shared_timeout(COUNTER_TIMEOUT))
+
+
+def push(user_ids, kind, message, link=None):
+    """
+    Add a notification for each user in the current transaction
+
+    The users' cached counters are updated when the transaction commits.
+
+    Args:
+        user_ids: Recipients
+        kind: Notification type, e.g. 'duty_assigned'
+        message: Text shown in the list (up to 255 characters)
+        link: URL the notification opens (optional)
+
+    Returns:
+        list: IDs of the new notifications
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return []
+    now = datetime.utcnow()
+    rows = db.session.execute(
+        insert(Notification).returning(Notification.id, Notification.user_id),
+        [{'user_id': user_id, 'kind': kind, 'message': message[:255], 'link': link, 'created_at': now}
+         for user_id in user_ids]
+    ).all()
+    db.session.info.setdefault('notification_counters', []).extend(rows)
+    return [notification_id for notification_id, _ in rows]
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_pushed(session):
+    pushed = session.info.pop('notification_counters', None)
+    if not pushed:
+        return
+    per_user = {}
+    for notification_id, user_id in pushed:
+        count, newest = per_user.get(user_id, (0, 0))
+        per_user[user_id] = (count + 1, max(newest, notification_id))
+    for user_id, (count, newest) in per_user.items():
+        _adjust_counter(user_id, count, newest)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_pushed(session):
+    session.info.pop('notification_counters', None)
+
+
+def mark_read(user_id, notification_ids=None):
+    """
+    Mark a user's notifications read and commit
+
+    Args:
+        user_id: Owner of the notifications
+        notification_ids: Notifications to mark (default: all unread)
+
+    Returns:
+        int: Number of notifications that were unread
+    """
+    query = Notification.query.filter(Notification.user_id == user_id, Notification.read_at.is_(None))
+    if notification_ids is not None:
+        query = query.filter(Notification.id.in_(notification_ids))
+    updated = query.update({Notification.read_at: datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+    if updated:
+        _adjust_counter(user_id, -updated)
+    return updated
+
+
+def newer_than(user_id, cursor, limit=DELTA_LIMIT):
+    """A user's notifications with IDs above cursor, newest first"""
+    return Notification.query.filter(Notification.user_id == user_id, Notification.id > cursor) \
+        .order_by(Notification.id.desc()).limit(limit).all()
+
+
+def approvers_of(user):
+    """IDs of the approved users who may approve a pending registration (see User.can_approve_user)"""
+    conditions = [User.role_type == RoleType.ADMIN]
+    if user.role_type == RoleType.ZONAL_COORDINATOR:
+        conditions.append(User.role_type == RoleType.EXECUTIVE)
+    elif user.role_type == RoleType.LGA_LEADER and user.zone_id:
+        conditions.append(and_(User.role_type == RoleType.ZONAL_COORDINATOR, User.zone_id == user.zone_id))
+    elif user.role_type == RoleType.WARD_LEADER and user.lga_id:
+        conditions.append(and_(User.role_type == RoleType.LGA_LEADER, User.lga_id == user.lga_id))
+    return [user_id for (user_id,) in db.session.query(User.id).filter(
+        User.approval_status == ApprovalStatus.APPROVED, or_(*conditions)
+    )]
+
+
+def push_approval_pending(user):
+    """Tell the approvers of a new registration that it is waiting for them"""
+    return push(approvers_of(user), 'approval_pending',
+                f'{user.full_name} registered as {user.role_title or user.role_type.value.replace("_", " ").title()} '
+                f'and is awaiting approval.',
+                url_for('leadership.approvals'))
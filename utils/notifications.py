@@ -0,0 +1,109 @@
+"""
+Member notifications
+Duty assignments, approvals and new events are announced by email. The
+recipients of a scope are resolved with one query and queued in the email
+outbox with one INSERT in the caller's transaction, each row holding only the
+template name and its variables. The outbox worker renders the email once per
+claimed batch with render_batch() and sends the copies in parallel;
+batch_progress() of the returned batch ID reports how many have gone out.
+"""
+import uuid
+from flask import url_for
+from sqlalchemy import or_, select
+from extensions import db
+from models import User, LGA, Ward, ApprovalStatus
+from utils.email_outbox import enqueue_template
+from utils.notification_center import push
+
+
+def scope_recipients(scope, zone_id=None, lga_id=None, ward_id=None, exclude_ids=()):
+    """
+    Approved members reached by a state, zone, LGA or ward scope
+
+    Members are matched on their own zone/LGA/ward or on a ward or LGA that
+    lies inside the scope, all in one query.
+
+    Returns:
+        list: (id, email, full_name) rows
+    """
+    query = db.session.query(User.id, User.email, User.full_name).filter(
+        User.approval_status == ApprovalStatus.APPROVED
+    )
+    if scope == 'ward':
+        if not ward_id:
+            return []
+        query = query.filter(User.ward_id == ward_id)
+    elif scope == 'lga':
+        if not lga_id:
+            return []
+        query = query.filter(or_(
+            User.lga_id == lga_id,
+            User.ward_id.in_(select(Ward.id).where(Ward.lga_id == lga_id)),
+        ))
+    elif scope == 'zone':
+        if not zone_id:
+            return []
+        zone_lgas = select(LGA.id).where(LGA.zone_id == zone_id)
+        query = query.filter(or_(
+            User.zone_id == zone_id,
+            User.lga_id.in_(zone_lgas),
+            User.ward_id.in_(select(Ward.id).where(Ward.lga_id.in_(zone_lgas))),
+        ))
+    if exclude_ids:
+        query = query.filter(User.id.notin_(exclude_ids))
+    return query.all()
+
+
+def notify(kind, recipients, reference, **context):
+    """
+    Queue one notification per recipient in the current transaction
+
+    The caller commits along with the change being announced, then calls
+    outbox_worker.notify() to start sending.
+
+    Args:
+        kind: Email template name (see utils.email_templates.EMAIL_TEMPLATES)
+        recipients: (id, email, full_name) rows, e.g. from scope_recipients()
+        reference: ID of the record being announced, part of the batch ID
+        **context: Template variables, stored as JSON (plain values, dicts and datetimes)
+
+    Returns:
+        tuple: (batch ID, number of messages queued)
+    """
+    batch = f'{kind}-{reference}-{uuid.uuid4().hex[:8]}'
+    queued = enqueue_template(kind, [{
+        'to': email,
+        'idempotency_key': f'{batch}-{user_id}',
+        'values': {'recipient_name': full_name},
+    } for user_id, email, full_name in recipients], batch=batch, **context)
+    return batch, queued
+
+
+def notify_duty_assigned(duty, user, assigned_by):
+    """Tell a member about a duty assigned to them (duty must be flushed)"""
+    push([user.id], 'duty_assigned', f'{assigned_by.full_name} assigned you a duty: {duty.duty_description}',
+         url_for('duty_logs.view_duties'))
+    return notify('duty_assigned', [(user.id, user.email, user.full_name)], duty.id,
+                  duty={'duty_description': duty.duty_description, 'due_date': duty.due_date},
+                  assigned_by=assigned_by.full_name)
+
+
+def notify_account_approved(user, approved_by):
+    """Tell a member their registration was approved"""
+    role = user.role_title or user.role_type.value.replace('_', ' ').title()
+    push([user.id], 'account_approved', f'Your registration as {role} has been approved.',
+         url_for('staff.dashboard'))
+    return notify('account_approved', [(user.id, user.email, user.full_name)], user.id,
+                  role=role, approved_by=approved_by.full_name)
+
+
+def notify_event_created(event):
+    """Announce a new event to every approved member in its scope (event must be flushed)"""
+    recipients = scope_recipients(event.scope, event.zone_id, event.lga_id, event.ward_id,
+                                  exclude_ids=(event.created_by_id,))
+    return notify('event_created', recipients, event.id, event={
+        'title': event.title,
+        'event_date': event.event_date,
+        'location': event.location,
+        'description': event.description,
+    })
@@ -0,0 +1,61 @@
+"""
+Keyset pagination helpers
+Pages are addressed by an opaque cursor holding the (created_at, id) of the
+last row shown, so fetching page N costs the same as page 1 and rows inserted
+meanwhile do not shift later pages the way OFFSET does.
+"""
+import base64
+from datetime import datetime
+from sqlalchemy import or_, and_
+
+
+def encode_cursor(created_at, row_id):
+    """Opaque, URL-safe cursor for the position after a row"""
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor from encode_cursor()
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def keyset_page(query, created_column, id_column, cursor=None, limit=20):
+    """
+    Fetch one page of a query newest first
+
+    Args:
+        query: Filtered query; ordering is applied here
+        created_column: Timestamp column, e.g. Media.created_at
+        id_column: Primary key column breaking timestamp ties
+        cursor: Cursor of the previous page, or None for the first page
+        limit: Rows per page
+
+    Returns:
+        tuple: (rows, next_cursor); next_cursor is None on the last page
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(or_(created_column < created_at,
+                                 and_(created_column == created_at, id_column < row_id)))
+
+    # One extra row tells whether another page exists
+    rows = query.order_by(created_column.desc(), id_column.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, created_column.key), getattr(last, id_column.key))
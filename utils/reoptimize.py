@@ -0,0 +1,167 @@
+"""
+Batch re-optimization of legacy uploads
+Files stored under uploads/ before the image pipeline existed are run
+through the same optimize/thumbnail/variant step in a process pool, moved
+into the blob store, and swapped into their rows in one commit per file.
+Converted files are appended to a checkpoint so an interrupted run resumes
+where it stopped; files that failed or whose row changed are tried again.
+"""
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from flask import current_app
+from extensions import db
+from models import Media, User, Campaign
+from utils import blob_store
+from utils.image_utils import process_image
+from utils.image_pipeline import IMAGE_PROFILES, IMAGE_FIELDS, ImagePipeline
+from utils.storage import get_storage, storage_key
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif'}
+PROFILE_BY_MODEL = {Media: 'media', User: 'photo', Campaign: 'campaign'}
+CHECKPOINT_NAME = 'reoptimize.checkpoint'
+
+
+def _references():
+    """Map legacy image paths to the (model, row id, stored value) rows using them"""
+    references = {}
+    for model, (path_field, *_rest) in IMAGE_FIELDS.items():
+        column = getattr(model, path_field)
+        query = db.session.query(model.id, column).filter(column.isnot(None))
+        if model is Media:
+            query = query.filter(Media.file_type == 'photo')
+        for row_id, value in query:
+            if value and not blob_store.is_blob_path(value):
+                references.setdefault(storage_key(value), []).append((model, row_id, value))
+    return references
+
+
+def _walk_uploads():
+    """Keys of image files under uploads/, outside the blob store"""
+    for key, _, _ in get_storage().iter_files('uploads'):
+        if not key.startswith(f"{blob_store.BLOB_ROOT}/") and \
+                os.path.splitext(key)[1].lower() in IMAGE_EXTENSIONS:
+            yield key
+
+
+def checkpoint_path():
+    return os.path.join(current_app.instance_path, CHECKPOINT_NAME)
+
+
+def _load_checkpoint(reset):
+    path = checkpoint_path()
+    if reset and os.path.exists(path):
+        os.remove(path)
+    if not os.path.exists(path):
+        return set()
+    with open(path) as checkpoint:
+        return {line.strip() for line in checkpoint if line.strip()}
+
+
+def reoptimize_uploads(workers=None, dry_run=False, reset=False, progress=None):
+    """
+    Optimize every referenced legacy upload and move it into the blob store
+
+    Args:
+        workers: Worker processes (default: one per CPU)
+        dry_run: Process into scratch space and report the savings without
+            changing files, rows or the checkpoint
+        reset: Ignore (and delete) the checkpoint of a previous run
+        progress: Optional callable(path, outcome) called per file
+
+    Returns:
+        dict: Counts of 'processed', 'failed', 'skipped' (unreferenced, shared
+        or already done) and 'bytes_before'/'bytes_after' of the main images
+    """
+    app = current_app._get_current_object()
+    references = _references()
+    done = set() if dry_run else _load_checkpoint(reset)
+    report = {'processed': 0, 'failed': 0, 'skipped': 0, 'bytes_before': 0, 'bytes_after': 0}
+
+    def notify(path, outcome):
+        if progress:
+            progress(path, outcome)
+
+    def jobs():
+        for path in _walk_uploads():
+            rows = references.get(path)
+            if path in done:
+                report['skipped'] += 1
+            elif not rows:
+                report['skipped'] += 1
+                notify(path, 'unreferenced')
+            elif len(rows) > 1:
+                # Swapping one row would delete the file under the others
+                report['skipped'] += 1
+                notify(path, 'shared by several rows')
+            else:
+                yield path, rows[0]
+
+    max_workers = workers or os.cpu_count() or 1
+    checkpoint = None if dry_run else open(checkpoint_path(), 'a')
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            pending = {}
+            queue = jobs()
+            while True:
+                # Keep a bounded number of files in flight
+                for path, row in queue:
+                    model, _, _ = row
+                    source = get_storage().fetch(path)
+                    if source is None:
+                        report['skipped'] += 1
+                        notify(path, 'missing')
+                        continue
+                    work_dir = tempfile.mkdtemp(dir=blob_store.temp_dir())
+                    future = pool.submit(process_image, source,
+                                         work_dir=work_dir, **IMAGE_PROFILES[PROFILE_BY_MODEL[model]])
+                    pending[future] = (path, source, row, work_dir)
+                    if len(pending) >= max_workers * 2:
+                        break
+                if not pending:
+                    break
+
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path, source, (model, row_id, value), work_dir = pending.pop(future)
+                    try:
+                        converted = _finish(app, path, source, model, row_id, value, future, dry_run, report, notify)
+                    finally:
+                        shutil.rmtree(work_dir, ignore_errors=True)
+                    if checkpoint and converted:
+                        checkpoint.write(f"{path}\n")
+                        checkpoint.flush()
+    finally:
+        if checkpoint:
+            checkpoint.close()
+
+    if not dry_run and os.path.exists(checkpoint_path()):
+        # A complete run leaves nothing to resume
+        os.remove(checkpoint_path())
+    return report
+
+
+def _finish(app, path, source, model, row_id, value, future, dry_run, report, notify):
+    """Record the outcome of one file; returns True if it was converted"""
+    try:
+        result = future.result()
+    except Exception as e:
+        result = {'success': False, 'error': str(e)}
+    if not result['success']:
+        report['failed'] += 1
+        notify(path, f"failed: {result.get('error')}")
+        return False
+
+    before = os.path.getsize(source)
+    after = os.path.getsize(result['path'])
+    if not dry_run and not ImagePipeline._record(app, model, row_id, value, result):
+        report['skipped'] += 1
+        notify(path, 'row changed during the run')
+        return False
+
+    report['processed'] += 1
+    report['bytes_before'] += before
+    report['bytes_after'] += after
+    notify(path, f"{before // 1024} KB -> {after // 1024} KB")
+    return True
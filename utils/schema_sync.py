@@ -0,0 +1,35 @@
+"""
+Lightweight schema sync for existing databases
+db.create_all() only creates missing tables, so columns and indexes added to
+existing models are applied here. New columns must be nullable (or have a
+server default) so they can be added in place on SQLite and PostgreSQL.
+"""
+import logging
+from sqlalchemy import inspect, text
+from extensions import db
+
+
+def sync_schema():
+    """Add columns and indexes declared on models but missing from the database"""
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                logging.info(f"Added column {table.name}.{column.name}")
+
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(bind=connection)
+                    logging.info(f"Added index {index.name}")
@@ -0,0 +1,140 @@
+"""
+Seat-occupancy index for leadership registration
+Answers "which titles are taken at this scope and how many seats remain"
+from grouped queries over approved leaders and live registration holds, cached
+until the next hold, approval or role change (or until the first hold expires).
+Invalidation bumps a generation in the cache, which other worker processes
+only see when the cache is shared; otherwise entries live at most
+PROCESS_LOCAL_TIMEOUT seconds (see utils.cache_utils.shared_timeout).
+"""
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import func
+from extensions import db
+from models import User, RoleType, ApprovalStatus, SeatReservation
+from utils.cache_utils import shared_timeout
+
+# Seat limits per leadership level and the location column that scopes them
+SEAT_LIMITS = {
+    RoleType.EXECUTIVE: (20, None),
+    RoleType.ZONAL_COORDINATOR: (3, 'zone_id'),
+    RoleType.LGA_LEADER: (10, 'lga_id'),
+    RoleType.WARD_LEADER: (8, 'ward_id'),
+}
+
+SEAT_INDEX_TIMEOUT = 600  # 10 minutes; holds, approvals and role changes invalidate sooner (see shared_timeout)
+_GENERATION_KEY = 'seats_generation'
+
+
+def resolve_role(role_type):
+    """Map 'EXECUTIVE', 'executive' or RoleType.EXECUTIVE to a RoleType (or None)"""
+    if isinstance(role_type, RoleType):
+        return role_type
+    if not role_type:
+        return None
+    try:
+        return RoleType[str(role_type).upper()]
+    except KeyError:
+        return None
+
+
+def resolve_scope(role, zone_id=None, lga_id=None, ward_id=None):
+    """
+    Get the (column, id) pair that scopes seats for a role
+
+    Returns (None, None) for state-level seats or when the location is unknown.
+    """
+    _, column = SEAT_LIMITS.get(role, (None, None))
+    scope_id = {'zone_id': zone_id, 'lga_id': lga_id, 'ward_id': ward_id}.get(column)
+    if column and scope_id:
+        return column, int(scope_id)
+    return None, None
+
+
+def _generation(cache):
+    generation = cache.get(_GENERATION_KEY)
+    if generation is None:
+        # Seed from the clock so an evicted counter never revives stale entries
+        generation = int(time.time() * 1000)
+        cache.set(_GENERATION_KEY, generation, timeout=0)
+    return generation
+
+
+def _query_occupancy(role, column, scope_id):
+    """
+    Count approved holders and unexpired holds of each title at a scope
+
+    Returns:
+        tuple: (title -> seats taken, expiry of the first hold to lapse or None)
+    """
+    query = db.session.query(User.role_title, func.count(User.id)).filter(
+        User.role_type == role,
+        User.approval_status == ApprovalStatus.APPROVED
+    )
+    if column:
+        query = query.filter(getattr(User, column) == scope_id)
+    titles = {title: count for title, count in query.group_by(User.role_title).all()}
+
+    # Registrations still pending hold their seat until the hold expires
+    holds = db.session.query(
+        SeatReservation.role_title, func.count(SeatReservation.id), func.min(SeatReservation.expires_at)
+    ).filter(
+        SeatReservation.role_type == role,
+        SeatReservation.status == 'held',
+        SeatReservation.expires_at >= datetime.utcnow()
+    )
+    if column:
+        holds = holds.filter(SeatReservation.scope_key == f"{column[:-3]}:{scope_id}")
+    next_expiry = None
+    for title, count, expires_at in holds.group_by(SeatReservation.role_title).all():
+        titles[title] = titles.get(title, 0) + count
+        next_expiry = expires_at if next_expiry is None else min(next_expiry, expires_at)
+    return titles, next_expiry
+
+
+def get_seat_occupancy(role_type, zone_id=None, lga_id=None, ward_id=None):
+    """
+    Get seat occupancy for a leadership level at a location
+
+    Args:
+        role_type: Leadership level ('EXECUTIVE', 'ZONAL_COORDINATOR', ...)
+        zone_id, lga_id, ward_id: Location of the seat
+
+    Returns:
+        dict: 'current', 'total' and 'available' seat counts, 'limited' (False when
+        the location needed to scope the seats is missing) and 'taken_titles'
+    """
+    role = resolve_role(role_type)
+    if role not in SEAT_LIMITS:
+        return {'current': 0, 'total': 0, 'available': 0, 'limited': False, 'taken_titles': set()}
+
+    total, scope_column = SEAT_LIMITS[role]
+    column, scope_id = resolve_scope(role, zone_id, lga_id, ward_id)
+    limited = scope_column is None or column is not None
+
+    cache = current_app.cache
+    cache_key = f"seats_{_generation(cache)}_{role.name}_{column or 'state'}_{scope_id or 0}"
+    titles = cache.get(cache_key)
+    if titles is None:
+        titles, next_expiry = _query_occupancy(role, column, scope_id)
+        timeout = shared_timeout(SEAT_INDEX_TIMEOUT)
+        if next_expiry is not None:
+            # Recount once a hold lapses, as nothing else announces it
+            timeout = max(1, min(timeout, int((next_expiry - datetime.utcnow()).total_seconds()) + 1))
+        cache.set(cache_key, titles, timeout=timeout)
+
+    current = sum(titles.values())
+    return {
+        'current': current,
+        'total': total,
+        'available': max(total - current, 0),
+        'limited': limited,
+        'taken_titles': {title for title in titles if title}
+    }
+
+
+def invalidate_seat_index():
+    """Invalidate all cached seat occupancy after holds, approvals or role changes"""
+    cache = current_app.cache
+    cache.set(_GENERATION_KEY, _generation(cache) + 1, timeout=0)
@@ -0,0 +1,200 @@
+"""
+Concurrency-safe leadership seat reservations
+Holds are taken in the same transaction as the registration and last
+SEAT_HOLD_TTL (30 minutes by default), long enough to finish verification;
+approval converts a live hold or reserves afresh. Unique constraints on
+(role, scope, seat number) and (role, scope, title) make the database reject
+overfills, so the same strategy is safe on PostgreSQL and SQLite without
+explicit row locks. Each attempt runs in a savepoint, so a conflict undoes
+only that attempt and never the caller's own changes.
+"""
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.exc import IntegrityError, OperationalError
+from extensions import db
+from models import User, ApprovalStatus, SeatReservation
+from utils.seat_index import SEAT_LIMITS, resolve_role, resolve_scope, invalidate_seat_index
+
+DEFAULT_HOLD_TTL = timedelta(minutes=30)
+MAX_ATTEMPTS = 8
+
+
+def _scope_key(role, zone_id, lga_id, ward_id):
+    """Build the scope key for a seat, or None when the seat is not limited"""
+    if role not in SEAT_LIMITS:
+        return None
+    _, scope_column = SEAT_LIMITS[role]
+    if scope_column is None:
+        return 'state'
+    column, scope_id = resolve_scope(role, zone_id, lga_id, ward_id)
+    if column is None:
+        return None
+    return f"{column[:-3]}:{scope_id}"
+
+
+def _hold_ttl():
+    return current_app.config.get('SEAT_HOLD_TTL', DEFAULT_HOLD_TTL)
+
+
+def _purge_expired_holds(role, scope_key):
+    SeatReservation.query.filter(
+        SeatReservation.role_type == role,
+        SeatReservation.scope_key == scope_key,
+        SeatReservation.status == 'held',
+        SeatReservation.expires_at < datetime.utcnow()
+    ).delete(synchronize_session=False)
+
+
+def _backfill_approved_leaders(user_id, role, scope_key, zone_id, lga_id, ward_id, taken):
+    """Give approved leaders from before reservations existed a confirmed seat row"""
+    column, scope_id = resolve_scope(role, zone_id, lga_id, ward_id)
+    query = User.query.filter(
+        User.role_type == role,
+        User.approval_status == ApprovalStatus.APPROVED,
+        User.id != user_id,
+        ~User.id.in_(db.session.query(SeatReservation.user_id))
+    )
+    if column:
+        query = query.filter(getattr(User, column) == scope_id)
+
+    total, _ = SEAT_LIMITS[role]
+    taken_titles = {title for _, title in taken.values()}
+    for leader in query.all():
+        seat_number = next((n for n in range(1, total + 1) if n not in taken), None)
+        if seat_number is None:
+            break
+        title = leader.role_title if leader.role_title not in taken_titles else None
+        db.session.add(SeatReservation(
+            user_id=leader.id, role_type=role, role_title=title, scope_key=scope_key,
+            seat_number=seat_number, status='confirmed'
+        ))
+        taken[seat_number] = (leader.id, title)
+        taken_titles.add(title)
+
+
+def _try_reserve(user_id, role, role_title, scope_key, zone_id, lga_id, ward_id, status):
+    """One reservation attempt; the caller commits and retries on conflicts"""
+    _purge_expired_holds(role, scope_key)
+
+    taken = {
+        seat_number: (holder_id, title)
+        for seat_number, holder_id, title in db.session.query(
+            SeatReservation.seat_number, SeatReservation.user_id, SeatReservation.role_title
+        ).filter_by(role_type=role, scope_key=scope_key).all()
+    }
+    _backfill_approved_leaders(user_id, role, scope_key, zone_id, lga_id, ward_id, taken)
+
+    if role_title and any(title == role_title and holder_id != user_id
+                          for holder_id, title in taken.values()):
+        return False
+
+    total, _ = SEAT_LIMITS[role]
+    seat_number = next((n for n in range(1, total + 1) if n not in taken), None)
+    if seat_number is None:
+        return False
+
+    db.session.add(SeatReservation(
+        user_id=user_id,
+        role_type=role,
+        role_title=role_title,
+        scope_key=scope_key,
+        seat_number=seat_number,
+        status=status,
+        expires_at=datetime.utcnow() + _hold_ttl() if status == 'held' else None
+    ))
+    return True
+
+
+def take_seat(user, status='held'):
+    """
+    Reserve a leadership seat inside the caller's transaction
+
+    Any seat the user already occupies is given up in the same attempt. The
+    caller commits (then calls invalidate_seat_index()) or rolls back. Make
+    the change the seat belongs to first: the savepoint flushes it, which
+    opens the transaction (pysqlite only begins one at the first write, and
+    a savepoint outside it would commit on release).
+
+    Args:
+        user: Flushed User whose role_type/role_title/location describe the seat
+        status: 'held' for a TTL hold at registration, 'confirmed' on approval
+
+    Returns:
+        bool: True if the user holds a seat (or the role needs none)
+    """
+    role = resolve_role(user.role_type)
+    scope_key = _scope_key(role, user.zone_id, user.lga_id, user.ward_id)
+    if scope_key is None:
+        SeatReservation.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+        return True
+
+    user_id = user.id
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            with db.session.begin_nested():
+                SeatReservation.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+                return _try_reserve(user_id, role, user.role_title, scope_key,
+                                    user.zone_id, user.lga_id, user.ward_id, status)
+        except (IntegrityError, OperationalError) as e:
+            # Another request took the same seat or title (or SQLite was busy); retry
+            logging.info(f"Seat reservation conflict for user {user_id} (attempt {attempt + 1}): {e.__class__.__name__}")
+            time.sleep(random.uniform(0, 0.01 * (2 ** attempt)))
+
+    logging.warning(f"Giving up on seat reservation for user {user_id} after {MAX_ATTEMPTS} attempts")
+    return False
+
+
+def reserve_seat(user, status='held'):
+    """
+    Reserve a leadership seat for a user's current role, title and location and commit
+
+    Args:
+        user: Committed User whose role_type/role_title/location describe the seat
+        status: 'held' for a TTL hold, 'confirmed' on approval
+
+    Returns:
+        bool: True if the user holds a seat (or the role needs none)
+    """
+    role = resolve_role(user.role_type)
+    scope_key = _scope_key(role, user.zone_id, user.lga_id, user.ward_id)
+    if scope_key is None:
+        return True
+
+    existing = SeatReservation.query.filter_by(user_id=user.id).first()
+    if existing and existing.role_type == role and existing.scope_key == scope_key \
+            and existing.role_title == user.role_title \
+            and (existing.status == 'confirmed' or existing.expires_at >= datetime.utcnow()):
+        if status == 'confirmed' and existing.status != 'confirmed':
+            existing.status = 'confirmed'
+            existing.expires_at = None
+            db.session.commit()
+        return True
+
+    reserved = take_seat(user, status)
+    db.session.commit()
+    if reserved:
+        invalidate_seat_index()
+    return reserved
+
+
+def vacate_seats(*users):
+    """Give up any holds or seats the users occupy, inside the caller's transaction"""
+    return SeatReservation.query.filter(
+        SeatReservation.user_id.in_([user.id for user in users])
+    ).delete(synchronize_session=False)
+
+
+def reassign_seat(user):
+    """
+    Move a user's seat after a role or location change, inside the caller's transaction
+
+    Approved users get a confirmed seat for their new role; anyone else just
+    gives theirs up. On False the caller rolls back, undoing the change too.
+    """
+    if user.approval_status != ApprovalStatus.APPROVED:
+        vacate_seats(user)
+        return True
+    return take_seat(user, status='confirmed')
@@ -0,0 +1,405 @@
+"""
+Storage backends for uploads
+Stored files are addressed by keys such as uploads/blobs/ab/cd/<sha256>.jpg.
+The filesystem backend keeps them under static/, where the web server (or
+Flask's static route) serves them; files being written or processed wait in
+instance/upload_tmp, out of reach of URLs, until they are published. The S3 backend keeps them in an
+S3-compatible bucket (AWS S3, MinIO, ...) and hands browsers public or
+presigned URLs, so upload bytes never pass through the Flask workers; large
+videos can be uploaded straight to the bucket with presigned multipart parts.
+
+Select the backend with STORAGE_BACKEND ('filesystem' or 's3'); the S3
+backend reads S3_BUCKET, S3_ENDPOINT_URL, S3_REGION, S3_ACCESS_KEY,
+S3_SECRET_KEY and optionally S3_PUBLIC_URL (a public bucket or CDN base URL)
+and S3_CACHE_MAX_BYTES (size of the local download cache).
+"""
+import os
+import errno
+import time
+import shutil
+import tempfile
+import threading
+import mimetypes
+from collections import OrderedDict
+from flask import current_app, url_for
+
+CHUNK_SIZE = 64 * 1024
+MULTIPART_THRESHOLD = 16 * 1024 * 1024  # Server-side uploads above this use multipart
+MULTIPART_PART_SIZE = 8 * 1024 * 1024  # S3 requires at least 5MB per part except the last
+MAX_PARTS = 10000
+PRESIGNED_URL_EXPIRY = 3600
+PRESIGNED_URL_REUSE = 2700  # A presigned URL is handed out again until it has only 15 minutes left
+PRESIGNED_URL_CACHE_SIZE = 10000  # Keys whose presigned URL is kept
+DEFAULT_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # S3_CACHE_MAX_BYTES
+
+
+class StorageError(Exception):
+    """Raised when the storage backend is misconfigured or unavailable"""
+
+
+def _content_type(key):
+    return mimetypes.guess_type(key)[0] or 'application/octet-stream'
+
+
+class FileSystemStorage:
+    """Files under a local directory (static/), served as static files"""
+
+    is_local = True
+    supports_direct_upload = False
+
+    def __init__(self, root, scratch_root):
+        self.root = root
+        self.scratch_root = scratch_root
+
+    def _path(self, key):
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise StorageError(f'Invalid storage key: {key}')
+        return path
+
+    def scratch_dir(self):
+        """Scratch space outside the served directory; usually on the same filesystem, so publishing is a rename"""
+        os.makedirs(self.scratch_root, exist_ok=True)
+        return self.scratch_root
+
+    def put_file(self, key, source_path, content_type=None):
+        """Move a local file into storage under key"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.replace(source_path, path)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # Scratch space on another filesystem: copy next to the target, then rename over it
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.publish-')
+            os.close(fd)
+            try:
+                shutil.copyfile(source_path, tmp_path)
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            os.remove(source_path)
+
+    def put_stream(self, key, stream, content_type=None):
+        """Write a readable stream to key in chunks"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.scratch_dir())
+        try:
+            with os.fdopen(fd, 'wb') as destination:
+                shutil.copyfileobj(stream, destination, CHUNK_SIZE)
+            self.put_file(key, tmp_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def open(self, key):
+        """Readable binary stream of a stored file"""
+        return open(self._path(key), 'rb')
+
+    def read_range(self, key, start, end):
+        """Bytes start..end (inclusive) of a stored file"""
+        with self.open(key) as stored:
+            stored.seek(start)
+            return stored.read(end - start + 1)
+
+    def exists(self, key):
+        return os.path.isfile(self._path(key))
+
+    def size(self, key):
+        return os.path.getsize(self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def local_path(self, key):
+        """Path of the stored file on this machine, or None if it is not here"""
+        path = self._path(key)
+        return path if os.path.isfile(path) else None
+
+    def fetch(self, key):
+        """Local path to read a stored file from (no copy is needed here)"""
+        return self.local_path(key)
+
+    def url(self, key, expires=None):
+        return url_for('static', filename=key)
+
+    def iter_files(self, prefix):
+        """Yield (key, modified timestamp, size) of stored files under prefix"""
+        root = self._path(prefix)
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                yield key, os.path.getmtime(path), os.path.getsize(path)
+
+    def prune(self, prefix, older_than):
+        """Remove empty directories under prefix last modified before older_than"""
+        root = self._path(prefix)
+        for directory, _, _ in os.walk(root, topdown=False):
+            if directory != root and not os.listdir(directory) and os.path.getmtime(directory) < older_than:
+                os.rmdir(directory)
+
+
+class S3Storage:
+    """
+    Files in an S3-compatible bucket
+
+    Browsers download through S3_PUBLIC_URL or presigned URLs. A presigned
+    URL is reused for most of its lifetime, so pages keep stable image URLs
+    that browsers can cache. Reads that need a local file (image processing,
+    resizing) download it once into instance/storage_cache, which evicts the
+    least recently used files past cache_max_bytes; keys of blobs are
+    content-addressed, so cached copies never go stale. For direct multipart
+    uploads from the browser the bucket's CORS policy must allow PUT from the
+    site and expose the ETag header.
+    """
+
+    is_local = False
+    supports_direct_upload = True
+
+    def __init__(self, bucket, endpoint_url=None, region=None, access_key=None, secret_key=None,
+                 public_url=None, cache_dir=None, cache_max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+        except ImportError:
+            raise StorageError('The S3 storage backend requires the boto3 package.')
+
+        self.bucket = bucket
+        self.public_url = public_url.rstrip('/') if public_url else None
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes
+        self._cached = None  # OrderedDict of local path -> size, oldest first
+        self._cached_total = 0
+        self._urls = OrderedDict()  # key -> (presigned URL, time it stops being handed out)
+        self._lock = threading.Lock()
+        # MinIO and other stand-ins are addressed by path rather than bucket subdomain
+        self.client = boto3.client(
+            's3', endpoint_url=endpoint_url, region_name=region,
+            aws_access_key_id=access_key, aws_secret_access_key=secret_key,
+            config=Config(signature_version='s3v4',
+                          s3={'addressing_style': 'path' if endpoint_url else 'auto'}),
+        )
+        self.transfer_config = TransferConfig(multipart_threshold=MULTIPART_THRESHOLD,
+                                              multipart_chunksize=MULTIPART_PART_SIZE)
+
+    def _not_found(self, error):
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def scratch_dir(self):
+        path = os.path.join(self.cache_dir, 'tmp')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def put_file(self, key, source_path, content_type=None):
+        """Upload a local file (multipart when large) and remove the local copy"""
+        self.client.upload_file(source_path, self.bucket, key,
+                                ExtraArgs={'ContentType': content_type or _content_type(key)},
+                                Config=self.transfer_config)
+        os.remove(source_path)
+
+    def put_stream(self, key, stream, content_type=None):
+        """Upload a readable stream in parts without buffering it whole"""
+        self.client.upload_fileobj(stream, self.bucket, key,
+                                   ExtraArgs={'ContentType': content_type or _content_type(key)},
+                                   Config=self.transfer_config)
+
+    def open(self, key):
+        """Streaming body of a stored object"""
+        return self.client.get_object(Bucket=self.bucket, Key=key)['Body']
+
+    def _head(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if self._not_found(e):
+                return None
+            raise
+
+    def exists(self, key):
+        return self._head(key) is not None
+
+    def size(self, key):
+        head = self._head(key)
+        if head is None:
+            raise FileNotFoundError(key)
+        return head['ContentLength']
+
+    def read_range(self, key, start, end):
+        """Bytes start..end (inclusive) of a stored object, e.g. to sniff its type"""
+        response = self.client.get_object(Bucket=self.bucket, Key=key, Range=f'bytes={start}-{end}')
+        return response['Body'].read()
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def local_path(self, key):
+        return None
+
+    def _load_cache(self):
+        """Rebuild the LRU order of the download cache from file access times after a restart"""
+        scratch = self.scratch_dir()
+        entries = []
+        for directory, _, filenames in os.walk(self.cache_dir):
+            if directory.startswith(scratch):
+                continue
+            for filename in filenames:
+                stat = os.stat(os.path.join(directory, filename))
+                entries.append((stat.st_atime, os.path.join(directory, filename), stat.st_size))
+        self._cached = OrderedDict((path, size) for _, path, size in sorted(entries))
+        self._cached_total = sum(self._cached.values())
+
+    def _cache_touch(self, path):
+        """Mark a cached file as just used and evict the least recently used past cache_max_bytes"""
+        with self._lock:
+            if self._cached is None:
+                self._load_cache()
+            if path in self._cached:
+                self._cached.move_to_end(path)
+            else:
+                size = os.path.getsize(path)
+                self._cached[path] = size
+                self._cached_total += size
+            while self._cached_total > self.cache_max_bytes and len(self._cached) > 1:
+                evicted, size = self._cached.popitem(last=False)
+                self._cached_total -= size
+                try:
+                    os.remove(evicted)
+                except OSError:
+                    pass
+
+    def fetch(self, key):
+        """Download a stored file into the local cache once; None if it does not exist"""
+        from botocore.exceptions import ClientError
+        path = os.path.join(self.cache_dir, key)
+        if os.path.isfile(path):
+            self._cache_touch(path)
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.scratch_dir())
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, key, tmp_path, Config=self.transfer_config)
+            os.replace(tmp_path, path)
+        except ClientError as e:
+            if self._not_found(e):
+                return None
+            raise
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._cache_touch(path)
+        return path
+
+    def url(self, key, expires=None):
+        if expires is not None:
+            return self._presign(key, expires)
+        if self.public_url:
+            return f"{self.public_url}/{key}"
+
+        now = time.monotonic()
+        with self._lock:
+            cached = self._urls.get(key)
+            if cached and cached[1] > now:
+                self._urls.move_to_end(key)
+                return cached[0]
+        url = self._presign(key, PRESIGNED_URL_EXPIRY)
+        with self._lock:
+            self._urls[key] = (url, now + PRESIGNED_URL_REUSE)
+            self._urls.move_to_end(key)
+            while len(self._urls) > PRESIGNED_URL_CACHE_SIZE:
+                self._urls.popitem(last=False)
+        return url
+
+    def _presign(self, key, expires):
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': key}, ExpiresIn=expires,
+        )
+
+    def iter_files(self, prefix):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix.rstrip('/') + '/'):
+            for item in page.get('Contents', []):
+                yield item['Key'], item['LastModified'].timestamp(), item['Size']
+
+    def prune(self, prefix, older_than):
+        pass  # Buckets have no directories
+
+    # Direct multipart uploads from the browser
+
+    def create_multipart_upload(self, key, content_type=None):
+        """Start a multipart upload; returns its upload ID"""
+        response = self.client.create_multipart_upload(Bucket=self.bucket, Key=key,
+                                                        ContentType=content_type or _content_type(key))
+        return response['UploadId']
+
+    def presign_upload_part(self, key, upload_id, part_number, expires=PRESIGNED_URL_EXPIRY):
+        """URL the browser PUTs one part to"""
+        return self.client.generate_presigned_url(
+            'upload_part',
+            Params={'Bucket': self.bucket, 'Key': key, 'UploadId': upload_id, 'PartNumber': part_number},
+            ExpiresIn=expires,
+        )
+
+    def complete_multipart_upload(self, key, upload_id, parts):
+        """
+        Assemble the uploaded parts into the object
+
+        Args:
+            parts: List of (part_number, etag) as reported by the browser
+        """
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=key, UploadId=upload_id,
+            MultipartUpload={'Parts': [{'PartNumber': number, 'ETag': etag}
+                                       for number, etag in sorted(parts)]},
+        )
+
+    def abort_multipart_upload(self, key, upload_id):
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+
+
+def get_storage(app=None):
+    """The app's configured storage backend, created on first use"""
+    app = app or current_app._get_current_object()
+    storage = app.extensions.get('upload_storage')
+    if storage is None:
+        backend = app.config.get('STORAGE_BACKEND', 'filesystem')
+        if backend == 'filesystem':
+            storage = FileSystemStorage(app.static_folder, os.path.join(app.instance_path, 'upload_tmp'))
+        elif backend == 's3':
+            if not app.config.get('S3_BUCKET'):
+                raise StorageError('S3_BUCKET must be set for the S3 storage backend.')
+            storage = S3Storage(
+                bucket=app.config['S3_BUCKET'],
+                endpoint_url=app.config.get('S3_ENDPOINT_URL'),
+                region=app.config.get('S3_REGION'),
+                access_key=app.config.get('S3_ACCESS_KEY'),
+                secret_key=app.config.get('S3_SECRET_KEY'),
+                public_url=app.config.get('S3_PUBLIC_URL'),
+                cache_dir=os.path.join(app.instance_path, 'storage_cache'),
+                cache_max_bytes=app.config.get('S3_CACHE_MAX_BYTES', DEFAULT_CACHE_MAX_BYTES),
+            )
+        else:
+            raise StorageError(f'Unknown storage backend: {backend}')
+        app.extensions['upload_storage'] = storage
+    return storage
+
+
+def storage_key(path):
+    """Storage key of a stored path; early profile photos were saved as bare filenames"""
+    return path if '/' in path else f"uploads/photos/{path}"
+
+
+def upload_url(path):
+    """Browser URL of an uploaded file (template global)"""
+    if not path:
+        return ''
+    return get_storage().url(storage_key(path))
@@ -0,0 +1,135 @@
+"""
+Time series of dashboard metrics
+A metric counts rows by one of their timestamps. series() buckets the counts
+by day, week (starting Monday) or month with a single GROUP BY on the
+truncated timestamp, using date() on SQLite and date_trunc() on
+PostgreSQL, fills in the buckets with no rows and caches the result per
+metric, bucket and scope.
+"""
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, select, cast, literal_column, Date
+from extensions import db
+from models import User, DutyLog, DisciplinaryAction, Event, Campaign, ActivityLog, ApprovalStatus
+from utils.cache_utils import cached_query
+
+BUCKETS = ('day', 'week', 'month')
+
+# timestamp: column counted; owner: user the row belongs to, for zone and LGA
+# scopes (None for User itself); criteria: extra filters
+Metric = namedtuple('Metric', 'timestamp owner criteria')
+
+METRICS = {
+    'registrations': Metric(User.created_at, None, ()),
+    'approvals': Metric(User.approved_at, None, (User.approval_status == ApprovalStatus.APPROVED,)),
+    'duties_created': Metric(DutyLog.created_at, DutyLog.user_id, ()),
+    'duties_completed': Metric(DutyLog.completed_date, DutyLog.user_id, (DutyLog.completion_status == 'completed',)),
+    'disciplinary_actions': Metric(DisciplinaryAction.created_at, DisciplinaryAction.user_id, ()),
+    'events': Metric(Event.created_at, Event.created_by_id, ()),
+    'campaigns': Metric(Campaign.created_at, Campaign.author_id, ()),
+    'activities': Metric(ActivityLog.created_at, ActivityLog.user_id, ()),
+}
+
+
+def bucket_start(day, bucket):
+    """First day of the bucket a date falls in"""
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _shift(start, bucket, periods):
+    # Start of the bucket `periods` buckets before (negative) or after start
+    if bucket == 'month':
+        month = start.year * 12 + start.month - 1 + periods
+        return date(month // 12, month % 12 + 1, 1)
+    return start + timedelta(days=periods * (7 if bucket == 'week' else 1))
+
+
+def bucket_label(start, bucket):
+    if bucket == 'month':
+        return start.strftime('%B %Y')
+    if bucket == 'week':
+        return f"Week of {start.strftime('%d %b')}"
+    return start.strftime('%d %b')
+
+
+def _truncate(column, bucket, dialect):
+    """SQL expression for the first day of the bucket of a timestamp, or None if the dialect has none"""
+    if dialect == 'sqlite':
+        if bucket == 'day':
+            return func.date(column)
+        if bucket == 'week':
+            # Forward to Sunday (unchanged if it is one), then back to that week's Monday
+            return func.date(column, 'weekday 0', '-6 days')
+        return func.date(column, 'start of month')
+    if dialect == 'postgresql':
+        # The unit is inlined so the grouped and selected expressions are identical SQL
+        return cast(func.date_trunc(literal_column(f"'{bucket}'"), column), Date)
+    return None
+
+
+def count_by_bucket(timestamp, bucket, since, *criteria):
+    """
+    Rows counted per bucket of a timestamp column, from one grouped query
+
+    Works for any model; other dialects than SQLite and PostgreSQL fetch the
+    timestamps and bucket them here.
+
+    Args:
+        timestamp: DateTime column, e.g. User.created_at
+        bucket: 'day', 'week' or 'month'
+        since: First day counted
+        *criteria: Extra filters
+
+    Returns:
+        dict: Count per bucket start date (buckets without rows are absent)
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unknown bucket: {bucket}")
+    filters = [timestamp >= datetime.combine(since, datetime.min.time()), *criteria]
+    truncated = _truncate(timestamp, bucket, db.session.get_bind().dialect.name)
+
+    if truncated is None:
+        counts = {}
+        for (moment,) in db.session.query(timestamp).filter(*filters):
+            start = bucket_start(moment.date(), bucket)
+            counts[start] = counts.get(start, 0) + 1
+        return counts
+
+    rows = db.session.query(truncated, func.count()).filter(*filters).group_by(truncated)
+    # SQLite returns the dates as ISO strings
+    return {start if isinstance(start, date) else date.fromisoformat(start): count
+            for start, count in rows}
+
+
+@cached_query(timeout=600, key_prefix='series_')
+def series(metric, bucket='month', periods=6, scope=None, scope_id=None):
+    """
+    A metric per bucket over the last few buckets, the current one included
+
+    Args:
+        metric: Key of METRICS, e.g. 'registrations'
+        bucket: 'day', 'week' or 'month'
+        periods: Number of buckets
+        scope: 'zone', 'lga' or 'ward' to count only rows of users there (default: state-wide)
+        scope_id: ID of the zone, LGA or ward
+
+    Returns:
+        list: Dicts with 'start' (date), 'label' and 'count', oldest first
+    """
+    timestamp, owner, criteria = METRICS[metric]
+    criteria = list(criteria)
+    if scope:
+        location = getattr(User, f'{scope}_id') == scope_id
+        criteria.append(location if owner is None else owner.in_(select(User.id).where(location)))
+
+    current = bucket_start(datetime.utcnow().date(), bucket)
+    first = _shift(current, bucket, 1 - periods)
+    counts = count_by_bucket(timestamp, bucket, first, *criteria)
+
+    starts = [_shift(first, bucket, i) for i in range(periods)]
+    return [{'start': start, 'label': bucket_label(start, bucket), 'count': counts.get(start, 0)}
+            for start in starts]
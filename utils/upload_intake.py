@@ -0,0 +1,170 @@
+"""
+Streaming upload intake
+Multipart file parts are written straight to a temp file in fixed chunks while
+the request body is parsed. The SHA-256 digest is computed on the way, the type
+is sniffed from the magic bytes at the start of the file, and storing stops as
+soon as a part exceeds the limit for its type, so memory per upload stays
+constant and the blob store can publish the file with a single rename.
+"""
+import os
+import hashlib
+import tempfile
+from flask import Request, current_app
+from utils import blob_store
+
+MB = 1024 * 1024
+SNIFF_BYTES = 32
+
+# Per-type size limits; override with the UPLOAD_TYPE_LIMITS config dict
+DEFAULT_TYPE_LIMITS = {
+    'image': 10 * MB,
+    'video': 16 * MB,
+    None: 16 * MB,  # Anything else, e.g. CSV/XLSX imports
+}
+
+KIND_LABELS = {
+    'image': 'PNG, JPG, GIF, WebP or AVIF images',
+    'video': 'MP4, MOV, WebM or AVI videos',
+}
+
+
+def sniff(header):
+    """
+    Identify a file from its leading bytes
+
+    Returns:
+        tuple: (kind, extension, mimetype), or (None, None, None) if unknown
+    """
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'image', '.jpg', 'image/jpeg'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image', '.png', 'image/png'
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image', '.gif', 'image/gif'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image', '.webp', 'image/webp'
+    if header[:4] == b'RIFF' and header[8:12] == b'AVI ':
+        return 'video', '.avi', 'video/x-msvideo'
+    if header.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'video', '.webm', 'video/webm'
+    if header[4:8] == b'ftyp':
+        brand = header[8:12]
+        if brand in (b'avif', b'avis'):
+            return 'image', '.avif', 'image/avif'
+        if brand == b'qt  ':
+            return 'video', '.mov', 'video/quicktime'
+        if brand in (b'isom', b'iso2', b'mp41', b'mp42', b'avc1', b'M4V ', b'dash', b'3gp4', b'3gp5'):
+            return 'video', '.mp4', 'video/mp4'
+    return None, None, None
+
+
+class IntakeFile:
+    """
+    Writable temp file handed to Werkzeug's multipart parser for one file part
+
+    Once parsing finishes it is readable like any upload stream, and exposes
+    kind, ext, mimetype, size, digest and error for validation and storage.
+    """
+
+    def __init__(self, directory, limits):
+        fd, self.path = tempfile.mkstemp(dir=directory, suffix='.part')
+        self._file = os.fdopen(fd, 'wb+')
+        self._digest = hashlib.sha256()
+        self._header = b''
+        self._sniffed = False
+        self.limits = limits
+        self.size = 0
+        self.kind = self.ext = self.mimetype = None
+        self.error = None
+        self.published = False
+
+    def _sniff(self):
+        self.kind, self.ext, self.mimetype = sniff(self._header)
+        self._sniffed = True
+
+    def write(self, data):
+        if self.error:
+            # Drain the rest of the part without storing it
+            return len(data)
+
+        if not self._sniffed:
+            self._header += data[:SNIFF_BYTES - len(self._header)]
+            if len(self._header) >= SNIFF_BYTES:
+                self._sniff()
+
+        limit = self.limits.get(self.kind, self.limits[None])
+        if self.size + len(data) > limit:
+            self.error = f'File too large. Maximum size is {limit // MB}MB.'
+            self._file.truncate(0)
+            return len(data)
+
+        self._digest.update(data)
+        self._file.write(data)
+        self.size += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        # The parser rewinds once the part is complete; sniff files shorter than SNIFF_BYTES
+        if not self._sniffed:
+            self._sniff()
+        return self._file.seek(offset, whence)
+
+    def __getattr__(self, name):
+        # read, readline, tell, flush, ... come from the underlying file
+        return getattr(self._file, name)
+
+    @property
+    def digest(self):
+        return self._digest.hexdigest()
+
+    def finish(self):
+        """Flush the received bytes to disk before the file is published"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        if not self.published and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class IntakeRequest(Request):
+    """Request class whose file uploads stream through IntakeFile"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        limits = {**DEFAULT_TYPE_LIMITS, **current_app.config.get('UPLOAD_TYPE_LIMITS', {})}
+        return IntakeFile(blob_store.temp_dir(), limits)
+
+
+def validate_upload(file, kinds=('image',), max_size_mb=None):
+    """
+    Validate an upload from its sniffed content rather than its filename
+
+    Args:
+        file: Uploaded FileStorage
+        kinds: Accepted kinds ('image', 'video')
+        max_size_mb: Optional limit tighter than the per-type intake limit
+
+    Returns:
+        str: Error message, or None if the upload is acceptable
+    """
+    if not file or not file.filename:
+        return 'No file selected'
+
+    stream = file.stream
+    if not isinstance(stream, IntakeFile):
+        # Not parsed by IntakeRequest (e.g. constructed in code); check the name instead
+        if 'image' in kinds:
+            from utils.image_utils import validate_image_upload
+            return validate_image_upload(file, max_size_mb or 5)
+        return None
+
+    if stream.error:
+        return stream.error
+    if stream.kind not in kinds:
+        return f"Invalid file type. Please upload {' or '.join(KIND_LABELS[kind] for kind in kinds)}."
+    if max_size_mb and stream.size > max_size_mb * MB:
+        return f'File too large. Maximum size is {max_size_mb}MB.'
+    return None